@@ -0,0 +1,198 @@
+"""Compare the postgres and duckdb engines of the yearly and monthly analyses.
+
+Writes a synthetic Parquet archive (one file per meter-month, like the
+archive job) to a temporary ARCHIVE_DIR, loads the matching daily rollup
+rows into Postgres for BENCH meters, then times analytics.column_totals
+with both engines and checks that they agree. The BENCH meters (and their
+rollups, by cascade) and the archive are removed unless --keep is given.
+
+Postgres answers from the daily rollup, so its cost grows with meter-days;
+DuckDB scans every archived sample but takes that work off Postgres.
+A few hundred million rows:
+
+    uv run python -m benchmarks.bench_analytics --meters 400 --interval-seconds 60
+
+On one core and 2 DuckDB threads that is 210M rows (20 GB of Parquet):
+the yearly case took 168 ms on Postgres and 83 s on DuckDB, the monthly
+case 7 ms and 311 ms.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--meters", type=int, default=100)
+parser.add_argument("--year", type=int, default=2001)
+parser.add_argument("--interval-seconds", type=int, default=300)
+parser.add_argument("--repeat", type=int, default=5)
+parser.add_argument("--threads", type=int, default=2, help="DuckDB threads")
+parser.add_argument("--keep", action="store_true", help="keep BENCH meters and the archive")
+args = parser.parse_args()
+
+archive_dir = tempfile.mkdtemp(prefix="kusm-archive-")
+os.environ.update({"ARCHIVE_DIR": archive_dir, "DUCKDB_THREADS": str(args.threads)})
+
+import duckdb  # noqa: E402
+import numpy as np  # noqa: E402
+import pyarrow as pa  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+from src import analytics  # noqa: E402
+from src.archive import ARCHIVE_SCHEMA, DONE_MARKER, archive_path, month_dir  # noqa: E402
+from src.database import SessionLocal  # noqa: E402
+from src.models import READING_COLUMNS, ROLLUP_COUNTER_COLUMNS, MeterDB  # noqa: E402
+from src.partitions import add_months  # noqa: E402
+
+BENCH_PREFIX = "BENCH"
+COLUMNS = [
+    f"phase_{p}_{c}" for c in ("current", "voltage", "active_power", "grid_consumption")
+    for p in "ABC"
+]
+
+
+def create_meters(count: int) -> list[int]:
+    db = SessionLocal()
+    try:
+        db.query(MeterDB).filter(MeterDB.sn.like(f"{BENCH_PREFIX}%")).delete(
+            synchronize_session=False
+        )
+        meters = [
+            MeterDB(name=f"Bench {i}", sn=f"{BENCH_PREFIX}{i:06d}") for i in range(count)
+        ]
+        db.add_all(meters)
+        db.commit()
+        return [m.meter_id for m in meters]
+    finally:
+        db.close()
+
+
+def delete_meters():
+    db = SessionLocal()
+    try:
+        db.query(MeterDB).filter(MeterDB.sn.like(f"{BENCH_PREFIX}%")).delete(
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def write_archive(meter_ids: list[int]) -> int:
+    rng = np.random.default_rng(0)
+    step = np.timedelta64(args.interval_seconds, "s")
+    rows = 0
+    for month_index in range(12):
+        month = datetime(args.year, month_index + 1, 1)
+        timestamps = np.arange(
+            np.datetime64(month, "s"), np.datetime64(add_months(month, 1), "s"), step
+        )
+        month_dir(month).mkdir(parents=True, exist_ok=True)
+        for meter_id in meter_ids:
+            arrays = [pa.array(timestamps)]
+            for name in READING_COLUMNS:
+                if name in ROLLUP_COUNTER_COLUMNS:
+                    values = np.cumsum(rng.random(len(timestamps)))
+                else:
+                    values = rng.uniform(0, 400, len(timestamps)).astype(np.float32)
+                arrays.append(pa.array(values))
+            table = pa.Table.from_arrays(arrays, schema=ARCHIVE_SCHEMA)
+            pq.write_table(table, archive_path(meter_id, month), compression="zstd")
+            rows += len(timestamps)
+        (month_dir(month) / DONE_MARKER).touch()
+    return rows
+
+
+def load_daily_rollup():
+    """Aggregate the archive per meter-day with DuckDB and COPY it into Postgres"""
+    columns = {
+        "meter_id": "CAST(regexp_extract(filename, 'meter_(\\d+)\\.parquet$', 1) AS INTEGER)",
+        "bucket": "date_trunc('day', \"timestamp\")",
+        "sample_count": "count(*)",
+        "first_timestamp": 'min("timestamp")',
+        "last_timestamp": 'max("timestamp")',
+    }
+    for name in READING_COLUMNS:
+        for agg in ("min", "max", "avg", "count"):
+            columns[f"{name}_{agg}"] = f'{agg}("{name}")'
+    for name in ROLLUP_COUNTER_COLUMNS:
+        columns[f"{name}_first"] = f'arg_min("{name}", "timestamp")'
+        columns[f"{name}_last"] = f'arg_max("{name}", "timestamp")'
+
+    csv = os.path.join(archive_dir, "daily.csv")
+    select = ", ".join(f"{expr} AS {name}" for name, expr in columns.items())
+    duckdb.sql(
+        f"COPY (SELECT {select} FROM read_parquet('{archive_dir}/*/meter_*.parquet', "
+        f"filename = true) GROUP BY ALL) TO '{csv}' (HEADER false)"
+    )
+
+    db = SessionLocal()
+    try:
+        cursor = db.connection().connection.cursor()
+        with open(csv) as f:
+            quoted = ", ".join(f'"{name}"' for name in columns)
+            cursor.copy_expert(f"COPY readings_daily ({quoted}) FROM STDIN WITH CSV", f)
+        db.commit()
+    finally:
+        db.close()
+    os.remove(csv)
+
+
+def timed(engine: str, **kwargs) -> tuple[float, dict]:
+    seconds = []
+    for _ in range(args.repeat):
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            totals, _ = analytics.column_totals(db, COLUMNS, engine=engine, **kwargs)
+            seconds.append(time.perf_counter() - started)
+        finally:
+            db.close()
+    return statistics.median(seconds), totals
+
+
+def agree(a: dict, b: dict) -> bool:
+    for key, columns in a.items():
+        for name, (total, count) in columns.items():
+            other_total, other_count = b.get(key, {}).get(name, (0.0, 0))
+            if count != other_count or abs(total - other_total) > 1e-6 * max(1, abs(total)):
+                return False
+    return len(a) == len(b)
+
+
+def main():
+    meter_ids = create_meters(args.meters)
+    try:
+        started = time.perf_counter()
+        rows = write_archive(meter_ids)
+        print(f"archive:  {rows:,} rows in {time.perf_counter() - started:.1f}s at {archive_dir}")
+        started = time.perf_counter()
+        load_daily_rollup()
+        print(f"rollup:   {args.meters * 365:,} daily rows in {time.perf_counter() - started:.1f}s")
+
+        year = datetime(args.year, 1, 1), datetime(args.year + 1, 1, 1)
+        cases = {
+            "yearly, all meters": dict(start=year[0], end=year[1], meter_ids=meter_ids),
+            "monthly, one meter": dict(
+                start=year[0], end=year[1], period="month", meter_ids=meter_ids[:1]
+            ),
+        }
+        for label, kwargs in cases.items():
+            pg_seconds, pg_totals = timed("postgres", **kwargs)
+            duck_seconds, duck_totals = timed("duckdb", **kwargs)
+            print(
+                f"{label}: postgres {pg_seconds * 1000:,.1f} ms, duckdb {duck_seconds * 1000:,.1f} ms, "
+                f"{'results agree' if agree(pg_totals, duck_totals) else 'RESULTS DIFFER'}"
+            )
+    finally:
+        if not args.keep:
+            delete_meters()
+            shutil.rmtree(archive_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compare sequential and async meter polling against the fake IAMMETER server.
+
+Only the fetch side is measured, no database is touched:
+
+    uv run python -m benchmarks.bench_polling --meters 500 --latency-ms 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--meters", type=int, default=500)
+parser.add_argument("--latency-ms", type=float, default=50)
+parser.add_argument("--concurrency", type=int, default=50)
+parser.add_argument("--cycles", type=int, default=3)
+parser.add_argument("--port", type=int, default=8765)
+parser.add_argument("--skip-sequential", action="store_true")
+args = parser.parse_args()
+
+# Point the collector at the fake server before src.settings is imported
+os.environ["IAMMETER_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+os.environ["FAKE_IAMMETER_LATENCY_MS"] = str(args.latency_ms)
+os.environ["POLL_CONCURRENCY"] = str(args.concurrency)
+os.environ.setdefault("IAMMETER_TOKEN", "benchmark")
+
+from benchmarks import fake_iammeter  # noqa: E402
+from src.api import iammeter  # noqa: E402
+
+
+def run_sequential(meters):
+    fetched = 0
+    for _, sn in meters:
+        if iammeter.fetch_meter_data(sn) is not None:
+            fetched += 1
+    return fetched
+
+
+async def run_async(meters, cycles):
+    durations = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        readings = await iammeter.fetch_all_meter_data_async(meters)
+        durations.append(time.perf_counter() - started)
+        print(f"  async cycle: {len(readings)}/{len(meters)} in {durations[-1]:.2f}s")
+    await iammeter.close_async_client()
+    return durations
+
+
+def main():
+    server = fake_iammeter.serve_in_subprocess(args.port)
+    meters = [(i, f"FAKE{i:06d}") for i in range(args.meters)]
+
+    print(
+        f"{args.meters} meters, {args.latency_ms:.0f} ms latency, "
+        f"concurrency {args.concurrency}"
+    )
+
+    if not args.skip_sequential:
+        started = time.perf_counter()
+        fetched = run_sequential(meters)
+        elapsed = time.perf_counter() - started
+        print(f"sequential: {fetched}/{len(meters)} in {elapsed:.2f}s")
+
+    try:
+        durations = asyncio.run(run_async(meters, args.cycles))
+    finally:
+        server.terminate()
+    print(
+        f"async: median {statistics.median(durations):.2f}s, "
+        f"max {max(durations):.2f}s over {len(durations)} cycles"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Soak the full ingestion path against the IAMMETER simulator.
+
+Creates synthetic SOAK meters, runs collection cycles through
+collect_meter_data() exactly as the scheduler does, and reports fetch
+throughput, cycle time percentiles and database rows/sec. Only the soak
+meters are polled, and they are deleted again (with their readings, by
+cascade) unless --keep is given:
+
+    uv run python -m benchmarks.bench_soak --meters 2000 --cycles 20 \\
+        --latency-ms 50 --jitter-ms 100 --error-rate 0.01 --frozen-fraction 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--meters", type=int, default=1000)
+parser.add_argument("--cycles", type=int, default=10)
+parser.add_argument("--interval", type=float, default=0, help="seconds between cycle starts")
+parser.add_argument("--latency-ms", type=float, default=50)
+parser.add_argument("--jitter-ms", type=float, default=50)
+parser.add_argument("--error-rate", type=float, default=0.0)
+parser.add_argument("--api-error-rate", type=float, default=0.0)
+parser.add_argument("--frozen-fraction", type=float, default=0.0)
+parser.add_argument("--speedup", type=float, default=60)
+parser.add_argument("--concurrency", type=int, default=100)
+parser.add_argument("--mode", choices=["async", "sequential"], default="async")
+parser.add_argument("--write-method", choices=["auto", "insert", "copy"], default="auto")
+parser.add_argument("--spool", action="store_true", help="write through the local spool")
+parser.add_argument("--port", type=int, default=8766)
+parser.add_argument("--keep", action="store_true", help="keep soak meters and readings")
+args = parser.parse_args()
+
+# Configure the collector and the simulator before src.settings is imported
+os.environ.update(
+    {
+        "IAMMETER_BASE_URL": f"http://127.0.0.1:{args.port}",
+        "POLL_MODE": args.mode,
+        "POLL_CONCURRENCY": str(args.concurrency),
+        "INGEST_WRITE_METHOD": args.write_method,
+        "SPOOL_ENABLED": "true" if args.spool else "false",
+        "FAKE_IAMMETER_LATENCY_MS": str(args.latency_ms),
+        "FAKE_IAMMETER_JITTER_MS": str(args.jitter_ms),
+        "FAKE_IAMMETER_ERROR_RATE": str(args.error_rate),
+        "FAKE_IAMMETER_API_ERROR_RATE": str(args.api_error_rate),
+        "FAKE_IAMMETER_FROZEN_FRACTION": str(args.frozen_fraction),
+        "FAKE_IAMMETER_SPEEDUP": str(args.speedup),
+    }
+)
+os.environ.setdefault("IAMMETER_TOKEN", "benchmark")
+
+import httpx  # noqa: E402
+
+from benchmarks import fake_iammeter  # noqa: E402
+from src.api import iammeter, writer  # noqa: E402
+from src.database import SessionLocal  # noqa: E402
+from src.models import MeterDB  # noqa: E402
+
+SOAK_PREFIX = "SOAK"
+
+
+def create_meters(count: int) -> list[tuple[int, str]]:
+    db = SessionLocal()
+    try:
+        db.query(MeterDB).filter(MeterDB.sn.like(f"{SOAK_PREFIX}%")).delete(
+            synchronize_session=False
+        )
+        meters = [
+            MeterDB(name=f"Soak {i}", sn=f"{SOAK_PREFIX}{i:06d}") for i in range(count)
+        ]
+        db.add_all(meters)
+        db.commit()
+        return [(m.meter_id, m.sn) for m in meters]
+    finally:
+        db.close()
+
+
+def delete_meters():
+    db = SessionLocal()
+    try:
+        db.query(MeterDB).filter(MeterDB.sn.like(f"{SOAK_PREFIX}%")).delete(
+            synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(values: list[float], pct: int) -> float:
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+async def soak(cycles: int) -> dict:
+    durations, fetched, failed, skipped = [], 0, 0, 0
+    rows, inserted, write_seconds = 0, 0, 0.0
+
+    for _ in range(cycles):
+        started = time.perf_counter()
+        previous_write = writer.last_write_stats
+        await iammeter.collect_meter_data()
+        durations.append(time.perf_counter() - started)
+
+        cycle = iammeter.last_cycle_stats
+        fetched += cycle.fetched
+        failed += cycle.failed
+        skipped += cycle.skipped
+        if writer.last_write_stats is not previous_write:
+            write = writer.last_write_stats
+            rows += write.rows
+            inserted += write.inserted
+            write_seconds += write.seconds
+        print(
+            f"  cycle {len(durations)}: {cycle.fetched}/{cycle.meters} fetched, "
+            f"{cycle.skipped} skipped in {durations[-1]:.2f}s"
+        )
+
+        if args.interval:
+            await asyncio.sleep(max(0.0, args.interval - durations[-1]))
+
+    await iammeter.close_async_client()
+    return {
+        "durations": durations,
+        "fetched": fetched,
+        "failed": failed,
+        "skipped": skipped,
+        "rows": rows,
+        "inserted": inserted,
+        "write_seconds": write_seconds,
+    }
+
+
+def main():
+    server = fake_iammeter.serve_in_subprocess(args.port)
+    meters = create_meters(args.meters)
+    # Poll only the soak meters, never the real ones in the same database
+    iammeter.load_meters = lambda: meters
+
+    print(
+        f"{args.meters} meters, {args.cycles} {args.mode} cycles, "
+        f"{args.latency_ms:.0f}+{args.jitter_ms:.0f} ms latency, "
+        f"{args.error_rate:.1%} errors, {args.frozen_fraction:.1%} frozen"
+    )
+    started = time.perf_counter()
+    try:
+        result = asyncio.run(soak(args.cycles))
+        sim = httpx.get(f"http://127.0.0.1:{args.port}/_sim").json()
+    finally:
+        server.terminate()
+        if not args.keep:
+            delete_meters()
+    wall = time.perf_counter() - started
+
+    durations = result["durations"]
+    print(f"fetched:      {result['fetched']} ok, {result['failed']} failed, "
+          f"{result['skipped']} skipped by breaker")
+    print(f"throughput:   {result['fetched'] / sum(durations):,.0f} meters/s")
+    print(f"cycle time:   p50 {percentile(durations, 50):.2f}s, "
+          f"p99 {percentile(durations, 99):.2f}s, max {max(durations):.2f}s")
+    if result["write_seconds"]:
+        print(f"db writes:    {result['inserted']}/{result['rows']} rows inserted, "
+              f"{result['inserted'] / result['write_seconds']:,.0f} rows/s while writing")
+    else:
+        print("db writes:    none measured (spooled writes drain in the background)")
+    print(f"end to end:   {result['inserted'] / wall:,.0f} rows/s over {wall:.1f}s")
+    print(f"simulator:    {sim['stats']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare reading write paths: ORM add_all, multi-row INSERT and COPY.
+
+Every run happens in a transaction that is rolled back, so it is safe to
+point at a development database that already has meters:
+
+    uv run python -m benchmarks.bench_writer --rows 20000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from src.api.writer import ReadingBatchWriter
+from src.database import SessionLocal
+from src.models import MeterDB, ReadingDB, READING_COLUMNS
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rows", type=int, default=20000)
+args = parser.parse_args()
+
+
+def synthetic_rows(meter_ids: list[int], count: int) -> list[dict]:
+    start = datetime(2000, 1, 1)
+    rows = []
+    for i in range(count):
+        row = {
+            "meter_id": meter_ids[i % len(meter_ids)],
+            "timestamp": start + timedelta(minutes=i // len(meter_ids)),
+        }
+        row.update({c: round(random.uniform(0, 400), 3) for c in READING_COLUMNS})
+        rows.append(row)
+    return rows
+
+
+def run(label: str, rows: list[dict], write):
+    db = SessionLocal()
+    try:
+        seconds = write(db, rows)
+        print(f"{label:>8}: {len(rows)} rows in {seconds:.3f}s = {len(rows) / seconds:,.0f} rows/s")
+    finally:
+        db.rollback()
+        db.close()
+
+
+def orm_write(db, rows):
+    started = time.perf_counter()
+    db.add_all([ReadingDB(**row) for row in rows])
+    db.flush()
+    return time.perf_counter() - started
+
+
+def batch_write(method):
+    def write(db, rows):
+        writer = ReadingBatchWriter(method=method)
+        writer.extend(rows)
+        return writer.flush(db).seconds
+
+    return write
+
+
+def main():
+    db = SessionLocal()
+    meter_ids = [m.meter_id for m in db.query(MeterDB.meter_id).all()]
+    db.close()
+    if not meter_ids:
+        raise SystemExit("no meters in the database, run migrate.py first")
+
+    rows = synthetic_rows(meter_ids, args.rows)
+    run("orm", rows, orm_write)
+    run("insert", rows, batch_write("insert"))
+    run("copy", rows, batch_write("copy"))
+
+
+if __name__ == "__main__":
+    main()
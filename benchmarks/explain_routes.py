@@ -0,0 +1,115 @@
+"""Print EXPLAIN ANALYZE for every query the read routes issue.
+
+Calls each route in-process, records the SELECTs it sends through the
+engine, then explains each distinct statement once with the parameters of
+its first call. Run it before and after an index change and diff:
+
+    uv run python -m benchmarks.explain_routes > before.txt
+    uv run python migrate.py
+    uv run python -m benchmarks.explain_routes > after.txt
+
+--summary prints only the top plan node and timings of each query.
+"""
+
+import argparse
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select
+
+import main
+from src.database import SessionLocal, db_engine
+from src.models import MeterDB, ReadingDB
+from src.routes.auth.auth_utils import get_current_user, require_admin
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--route", action="append", help="only routes containing this")
+parser.add_argument("--summary", action="store_true")
+args = parser.parse_args()
+
+
+def sample_arguments() -> dict:
+    """A real meter and the most recent day with data"""
+    db = SessionLocal()
+    try:
+        meter_id, name = db.execute(
+            select(MeterDB.meter_id, MeterDB.name).order_by(MeterDB.meter_id)
+        ).first()
+        last = db.execute(select(func.max(ReadingDB.timestamp))).scalar()
+        return {"meter_id": meter_id, "meter_name": name, "day": last.date()}
+    finally:
+        db.close()
+
+
+def routes(a: dict) -> list[str]:
+    day, year = a["day"], a["day"].year
+    return [
+        "/meter",
+        f"/meter/{a['meter_id']}/latest",
+        f"/meter/todaysdata/{a['meter_name']}",
+        f"/meter/databydate?meter_name={a['meter_name']}&from_date={day}&to_date={day}",
+        f"/analysis/avg_consumption_yearly?year={year}",
+        "/analysis/prev_curr_power",
+        f"/analysis/avg_daily_energy?from_date={day.replace(day=1)}&to_date={day}",
+        f"/analysis/monthly_average/{year}/{a['meter_name']}",
+        "/analysis/voltage",
+        "/analysis/current",
+        f"/billing/{year}/{day.month}",
+    ]
+
+
+@contextmanager
+def recorded():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(db_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db_engine, "before_cursor_execute", record)
+
+
+def explain(statement: str, parameters) -> list[str]:
+    with db_engine.connect() as conn:
+        try:
+            rows = conn.exec_driver_sql(
+                "EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters
+            ).scalars()
+            return list(rows)
+        finally:
+            conn.rollback()
+
+
+def main_():
+    user = lambda: type("User", (), {"id": None})()  # noqa: E731
+    main.app.dependency_overrides[get_current_user] = user
+    main.app.dependency_overrides[require_admin] = user
+    client = TestClient(main.app)
+
+    for route in routes(sample_arguments()):
+        if args.route and not any(part in route for part in args.route):
+            continue
+        with recorded() as statements:
+            status = client.get(route).status_code
+
+        distinct = {}
+        for statement, parameters in statements:
+            distinct.setdefault(statement, (parameters, 0))
+            distinct[statement] = (distinct[statement][0], distinct[statement][1] + 1)
+        print(f"==== GET {route} -> {status}, {len(statements)} queries, {len(distinct)} distinct")
+
+        for statement, (parameters, calls) in distinct.items():
+            plan = explain(statement, parameters)
+            print(f"-- x{calls}: {' '.join(statement.split())[:160]}")
+            if args.summary:
+                plan = [plan[0]] + [line for line in plan if line.startswith(("Planning Time", "Execution Time"))]
+            print("\n".join(plan))
+            print()
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,222 @@
+"""Local simulator of the IAMMETER meterdata2 API for load and soak tests.
+
+Every serial number is accepted. Each one is pinned to one of the hourly
+profiles in data/*.csv, with its own hour offset and per phase scaling, and
+replays it at FAKE_IAMMETER_SPEEDUP times real time. Faults are injected
+from the environment or at runtime through POST /_sim:
+
+    FAKE_IAMMETER_LATENCY_MS        fixed delay per request
+    FAKE_IAMMETER_JITTER_MS         extra uniform random delay
+    FAKE_IAMMETER_ERROR_RATE        share of requests failing with 429/500/503
+    FAKE_IAMMETER_API_ERROR_RATE    share answering successful=false
+    FAKE_IAMMETER_FROZEN_FRACTION   share of meters stuck on one reading
+    FAKE_IAMMETER_SPEEDUP           simulated seconds per real second
+"""
+
+import asyncio
+import csv
+import os
+import random
+import subprocess
+import sys
+import time
+import zlib
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+PROFILE_COLUMNS = {"Time", "Voltage", "Current", "Power", "PF"}
+
+
+@dataclass
+class SimConfig:
+    latency_ms: float = float(os.getenv("FAKE_IAMMETER_LATENCY_MS", "50"))
+    jitter_ms: float = float(os.getenv("FAKE_IAMMETER_JITTER_MS", "0"))
+    error_rate: float = float(os.getenv("FAKE_IAMMETER_ERROR_RATE", "0"))
+    api_error_rate: float = float(os.getenv("FAKE_IAMMETER_API_ERROR_RATE", "0"))
+    frozen_fraction: float = float(os.getenv("FAKE_IAMMETER_FROZEN_FRACTION", "0"))
+    speedup: float = float(os.getenv("FAKE_IAMMETER_SPEEDUP", "1"))
+
+
+class SimConfigUpdate(BaseModel):
+    latency_ms: Optional[float] = None
+    jitter_ms: Optional[float] = None
+    error_rate: Optional[float] = None
+    api_error_rate: Optional[float] = None
+    frozen_fraction: Optional[float] = None
+    speedup: Optional[float] = None
+
+
+@dataclass
+class Profile:
+    name: str
+    # (voltage, current, active power W, power factor) per hour
+    hours: list[tuple[float, float, float, float]]
+    # Imported kWh at the start of each hour, plus the total of one loop
+    energy: list[float] = field(default_factory=list)
+
+    def __post_init__(self):
+        total = 0.0
+        for _, _, power, _ in self.hours:
+            self.energy.append(total)
+            total += max(power, 0.0) / 1000
+        self.energy.append(total)
+
+
+def _number(value: str) -> float:
+    return float(value.replace(",", "").replace("W", "").strip())
+
+
+def load_profiles(data_dir: Path = DATA_DIR) -> list[Profile]:
+    """Hourly per phase profiles, skipping CSVs without the meter columns"""
+    profiles = []
+    for path in sorted(data_dir.glob("*.csv")):
+        with open(path, newline="") as f:
+            reader = csv.DictReader(f)
+            if not PROFILE_COLUMNS <= set(reader.fieldnames or []):
+                continue
+            hours = []
+            for row in reader:
+                try:
+                    hours.append(
+                        tuple(_number(row[c]) for c in ("Voltage", "Current", "Power", "PF"))
+                    )
+                except (TypeError, ValueError):
+                    continue
+        if hours:
+            profiles.append(Profile(path.stem, hours))
+    return profiles
+
+
+config = SimConfig()
+profiles = load_profiles()
+stats = {"requests": 0, "http_errors": 0, "api_errors": 0, "frozen": 0}
+started_wall = datetime.now()
+started = time.monotonic()
+
+app = FastAPI(title="Fake IAMMETER")
+
+
+@lru_cache(maxsize=None)
+def _meter(sn: str) -> tuple[Profile, float, list[float], float]:
+    """Deterministic (profile, hour offset, phase scales, frozen draw) of a meter"""
+    rng = random.Random(zlib.crc32(sn.encode()))
+    profile = profiles[rng.randrange(len(profiles))]
+    offset = rng.uniform(0, len(profile.hours))
+    scales = [rng.uniform(0.9, 1.1) for _ in range(3)]
+    return profile, offset, scales, rng.random()
+
+
+def _sim_elapsed_hours() -> float:
+    return (time.monotonic() - started) * config.speedup / 3600
+
+
+def _phase_values(profile: Profile, hour: float, scale: float) -> list[float]:
+    n = len(profile.hours)
+    loops, position = divmod(hour, n)
+    i, frac = int(position), position - int(position)
+    now, nxt = profile.hours[i], profile.hours[(i + 1) % n]
+    voltage, current, _, power_factor = (a + (b - a) * frac for a, b in zip(now, nxt))
+
+    # Phases differ by up to 10% in current and 1% in voltage
+    voltage = voltage * (1 + (scale - 1) / 10)
+    current = current * scale
+    active_power = voltage * current * power_factor
+    energy = (
+        loops * profile.energy[-1]
+        + profile.energy[i]
+        + max(now[2], 0.0) * frac / 1000
+    ) * scale
+    return [
+        round(voltage, 1),
+        round(current, 2),
+        round(active_power, 1),
+        round(power_factor, 3),
+        round(energy, 3),
+        0.0,
+    ]
+
+
+@app.get("/api/v1/site/meterdata2/{sn}")
+async def meterdata2(sn: str, token: str = ""):
+    stats["requests"] += 1
+    delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+    if delay:
+        await asyncio.sleep(delay / 1000)
+
+    if random.random() < config.error_rate:
+        stats["http_errors"] += 1
+        return JSONResponse({"message": "simulated"}, status_code=random.choice([429, 500, 503]))
+    if random.random() < config.api_error_rate:
+        stats["api_errors"] += 1
+        return {"successful": False, "message": "simulated API error", "data": None}
+
+    profile, offset, scales, frozen_draw = _meter(sn)
+    # Frozen meters keep answering with the same reading and localTime
+    if frozen_draw < config.frozen_fraction:
+        stats["frozen"] += 1
+        hour = offset
+        local_time = started_wall + timedelta(hours=offset)
+    else:
+        elapsed = _sim_elapsed_hours()
+        hour = offset + elapsed
+        local_time = started_wall + timedelta(hours=elapsed)
+    return {
+        "successful": True,
+        "message": None,
+        "data": {
+            "sn": sn,
+            "localTime": local_time.strftime("%Y/%m/%d %H:%M:%S"),
+            "values": [_phase_values(profile, hour, s) for s in scales],
+        },
+    }
+
+
+@app.get("/_sim")
+async def get_sim():
+    return {
+        "config": asdict(config),
+        "profiles": [p.name for p in profiles],
+        "simulated_time": (
+            started_wall + timedelta(hours=_sim_elapsed_hours())
+        ).isoformat(),
+        "stats": stats,
+    }
+
+
+@app.post("/_sim")
+async def update_sim(update: SimConfigUpdate):
+    for key, value in update.model_dump(exclude_none=True).items():
+        setattr(config, key, value)
+    return asdict(config)
+
+
+def serve_in_subprocess(port: int = 8765) -> subprocess.Popen:
+    """Start the fake server in its own process so it does not share our GIL"""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_iammeter", str(port)],
+        env=os.environ.copy(),
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/_sim", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("fake IAMMETER server did not start")
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
@@ -3,7 +3,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-import asyncio
+from apscheduler.schedulers.base import STATE_RUNNING, STATE_STOPPED
 from src.routes.auth import auth_routes
 from src.scheduler import scheduler
 from src.routes import (
@@ -16,6 +16,24 @@ from src.routes import (
     meter_status,
 )
 from src.ml_model import power_prediction_service
+from src.api import iammeter
+from src.api.response_cache import ResponseCacheMiddleware
+from src.api.snapshot import snapshot
+from src.leader import leader
+from src.settings import settings
+
+
+async def on_elected():
+    if scheduler.state == STATE_STOPPED:
+        scheduler.start()
+    else:
+        scheduler.resume()
+
+
+async def on_demoted():
+    if scheduler.state == STATE_RUNNING:
+        scheduler.pause()
+    await data_collection.stop_local_collection()
 
 
 @asynccontextmanager
@@ -30,32 +48,34 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Failed to load ML model: {e}")
 
-    # Start scheduler
-    scheduler.start()
-    # Data collection starts as OFF by default
-    # Will be controlled via API endpoint
+    # Every worker keeps the latest readings in memory
+    snapshot.start()
+
+    # Only the elected worker runs the scheduler and the collector, the
+    # collection schedule itself lives in the DB and is controlled via API
+    leader.start(
+        on_elected=on_elected,
+        on_demoted=on_demoted,
+        on_tick=data_collection.sync_collection,
+    )
     try:
         yield
     finally:
         print("Shutting down...")
 
-        # Stop data collection task
-        if data_collection.data_collection_state.task:
-            data_collection.data_collection_state.stop()
-            if not data_collection.data_collection_state.task.done():
-                data_collection.data_collection_state.task.cancel()
-                try:
-                    await asyncio.wait_for(
-                        data_collection.data_collection_state.task, timeout=5.0
-                    )
-                except (asyncio.CancelledError, asyncio.TimeoutError):
-                    pass
+        # Stop background work and release leadership
+        await leader.stop()
+        await snapshot.stop()
+
+        # Close the pooled IAMMETER client
+        await iammeter.close_async_client()
 
         # Shutdown scheduler
-        try:
-            scheduler.shutdown(wait=False)
-        except Exception as e:
-            print(f"Error shutting down scheduler: {e}")
+        if scheduler.state != STATE_STOPPED:
+            try:
+                scheduler.shutdown(wait=False)
+            except Exception as e:
+                print(f"Error shutting down scheduler: {e}")
 
         print("Shutdown complete")
 
@@ -67,6 +87,10 @@ app = FastAPI(
 )
 
 
+# Cached responses of the dashboard reads, see api/response_cache.py
+if settings.RESPONSE_CACHE_ENABLED:
+    app.add_middleware(ResponseCacheMiddleware)
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -1,10 +1,24 @@
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
 
 from src.database import db_engine, get_db
 from src.models import Base
 from src.init_meter import init_meter
+from src.partitions import maintain_partitions
 
 
-Base.metadata.create_all(bind=db_engine)
+alembic_cfg = Config("alembic.ini")
+
+if inspect(db_engine).has_table("meters"):
+    # Existing database: let the migrations create and backfill new tables
+    command.upgrade(alembic_cfg, "head")
+    Base.metadata.create_all(bind=db_engine)
+else:
+    Base.metadata.create_all(bind=db_engine)
+    command.stamp(alembic_cfg, "head")
+
+print(f"created partitions: {maintain_partitions()}")
 
 db = next(get_db())
 try:
@@ -0,0 +1,11 @@
+"""Shared by the migration scripts in versions/"""
+from alembic import op
+import sqlalchemy as sa
+
+
+def add_column_if_missing(table: str, column: sa.Column) -> None:
+    """Add a column unless the table has it already, e.g. because
+    migrate.py created the table from the current models"""
+    existing = {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in existing:
+        op.add_column(table, column)
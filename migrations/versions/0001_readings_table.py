@@ -0,0 +1,131 @@
+"""Unified readings table, backfilled from current/voltage/power/energy
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from datetime import timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PHASE_COLUMNS = {
+    "current": ["phase_A_current", "phase_B_current", "phase_C_current"],
+    "voltage": ["phase_A_voltage", "phase_B_voltage", "phase_C_voltage"],
+    "power": [
+        "phase_A_active_power",
+        "phase_A_power_factor",
+        "phase_B_active_power",
+        "phase_B_power_factor",
+        "phase_C_active_power",
+        "phase_C_power_factor",
+    ],
+    "energy": [
+        "phase_A_grid_consumption",
+        "phase_A_exported_power",
+        "phase_B_grid_consumption",
+        "phase_B_exported_power",
+        "phase_C_grid_consumption",
+        "phase_C_exported_power",
+    ],
+}
+ALIASES = {"current": "c", "voltage": "v", "power": "p", "energy": "e"}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    # Databases bootstrapped by migrate.py already have the table
+    if not sa.inspect(bind).has_table("readings"):
+        op.create_table(
+            "readings",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column(
+                "meter_id",
+                sa.Integer(),
+                sa.ForeignKey("meters.meter_id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            sa.Column("timestamp", sa.DateTime(), nullable=False),
+            *[
+                sa.Column(name, sa.Float(), nullable=True)
+                for columns in PHASE_COLUMNS.values()
+                for name in columns
+            ],
+        )
+        op.create_index(
+            "idx_readings_meter_timestamp",
+            "readings",
+            ["meter_id", sa.text("timestamp DESC")],
+        )
+
+    backfill(bind)
+
+
+def backfill(bind) -> None:
+    """Copy the legacy tables into readings one month at a time.
+
+    Energy drives the copy because imported history only exists there; the
+    other tables are left joined on (meter_id, timestamp). Rows already in
+    readings are skipped, so this can be re-run safely.
+    """
+    if not sa.inspect(bind).has_table("energy"):
+        return
+
+    bounds = bind.execute(
+        sa.text(
+            "SELECT date_trunc('month', min(timestamp)), max(timestamp) FROM energy"
+        )
+    ).one()
+    if bounds[0] is None:
+        return
+
+    target = ", ".join(
+        f'"{name}"' for columns in PHASE_COLUMNS.values() for name in columns
+    )
+    source = ", ".join(
+        f'{ALIASES[table]}."{name}"'
+        for table, columns in PHASE_COLUMNS.items()
+        for name in columns
+    )
+    joins = " ".join(
+        f"LEFT JOIN {table} {alias} "
+        f"ON {alias}.meter_id = e.meter_id AND {alias}.timestamp = e.timestamp"
+        for table, alias in ALIASES.items()
+        if table != "energy"
+    )
+    # DISTINCT ON keeps duplicated samples from multiplying through the joins
+    statement = sa.text(
+        f"""
+        INSERT INTO readings (meter_id, timestamp, {target})
+        SELECT DISTINCT ON (e.meter_id, e.timestamp)
+            e.meter_id, e.timestamp, {source}
+        FROM energy e {joins}
+        WHERE e.timestamp >= :start AND e.timestamp < :end
+          AND NOT EXISTS (
+            SELECT 1 FROM readings r
+            WHERE r.meter_id = e.meter_id AND r.timestamp = e.timestamp
+          )
+        ORDER BY e.meter_id, e.timestamp, e.id
+        """
+    )
+
+    month, last = bounds
+    while month <= last:
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        result = bind.execute(statement, {"start": month, "end": next_month})
+        print(f"readings backfill {month:%Y-%m}: {result.rowcount} rows")
+        month = next_month
+
+
+def downgrade() -> None:
+    op.drop_index("idx_readings_meter_timestamp", table_name="readings")
+    op.drop_table("readings")
@@ -0,0 +1,59 @@
+"""Deduplicate readings and make (meter_id, timestamp) unique
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def dedup_readings(bind) -> int:
+    """Keep the oldest row of every (meter_id, timestamp) group"""
+    result = bind.execute(
+        sa.text(
+            """
+            DELETE FROM readings r
+            USING readings keep
+            WHERE keep.meter_id = r.meter_id
+              AND keep.timestamp = r.timestamp
+              AND keep.id < r.id
+            """
+        )
+    )
+    return result.rowcount
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    constraints = {
+        c["name"] for c in sa.inspect(bind).get_unique_constraints("readings")
+    }
+    if "uq_readings_meter_timestamp" in constraints:
+        return
+
+    removed = dedup_readings(bind)
+    print(f"removed {removed} duplicate readings")
+
+    op.create_unique_constraint(
+        "uq_readings_meter_timestamp", "readings", ["meter_id", "timestamp"]
+    )
+    op.drop_index("idx_readings_meter_timestamp", table_name="readings", if_exists=True)
+
+
+def downgrade() -> None:
+    op.create_index(
+        "idx_readings_meter_timestamp",
+        "readings",
+        ["meter_id", sa.text("timestamp DESC")],
+    )
+    op.drop_constraint("uq_readings_meter_timestamp", "readings", type_="unique")
@@ -0,0 +1,44 @@
+"""Shared data collection state
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("data_collection_state"):
+        return
+
+    op.create_table(
+        "data_collection_state",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("is_running", sa.Boolean(), nullable=False),
+        sa.Column(
+            "schedule_id",
+            sa.Integer(),
+            sa.ForeignKey("data_collection_schedule.id", ondelete="SET NULL"),
+            nullable=True,
+        ),
+        sa.Column("last_run", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("next_run", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_cycle", sa.JSON(), nullable=True),
+        sa.Column("last_write", sa.JSON(), nullable=True),
+        sa.Column("leader_pid", sa.Integer(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("data_collection_state")
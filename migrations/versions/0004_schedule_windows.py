@@ -0,0 +1,34 @@
+"""Schedule windows and skipped tick counter
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import add_column_if_missing
+
+
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    add_column_if_missing(
+        "data_collection_schedule", sa.Column("windows", sa.JSON(), nullable=True)
+    )
+    add_column_if_missing(
+        "data_collection_state",
+        sa.Column("skipped_ticks", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("data_collection_state", "skipped_ticks")
+    op.drop_column("data_collection_schedule", "windows")
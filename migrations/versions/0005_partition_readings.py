@@ -0,0 +1,107 @@
+"""Partition readings by month
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.partitions import add_months, ensure_partitions, is_partitioned
+
+
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if is_partitioned(bind, "readings"):
+        return
+
+    # Move the heap table aside; constraint and sequence names must be freed
+    # because they live in the schema namespace, not the table's
+    op.execute("ALTER TABLE readings RENAME TO readings_unpartitioned")
+    op.execute(
+        "ALTER TABLE readings_unpartitioned "
+        "RENAME CONSTRAINT readings_pkey TO readings_unpartitioned_pkey"
+    )
+    op.execute(
+        "ALTER TABLE readings_unpartitioned RENAME CONSTRAINT "
+        "uq_readings_meter_timestamp TO uq_readings_unpartitioned_meter_timestamp"
+    )
+    op.execute(
+        "ALTER TABLE readings_unpartitioned "
+        "RENAME CONSTRAINT readings_meter_id_fkey TO readings_unpartitioned_meter_id_fkey"
+    )
+
+    op.execute(
+        "CREATE TABLE readings (LIKE readings_unpartitioned INCLUDING DEFAULTS) "
+        'PARTITION BY RANGE ("timestamp")'
+    )
+    op.execute('ALTER TABLE readings ADD PRIMARY KEY (id, "timestamp")')
+    op.execute(
+        "ALTER TABLE readings ADD CONSTRAINT uq_readings_meter_timestamp "
+        'UNIQUE (meter_id, "timestamp")'
+    )
+    op.execute(
+        "ALTER TABLE readings ADD FOREIGN KEY (meter_id) "
+        "REFERENCES meters (meter_id) ON DELETE CASCADE"
+    )
+    # Keep the id sequence alive when the old table is dropped
+    op.execute("ALTER SEQUENCE readings_id_seq OWNED BY readings.id")
+
+    first, last = bind.execute(
+        sa.text(
+            """SELECT date_trunc('month', min("timestamp")), max("timestamp") """
+            "FROM readings_unpartitioned"
+        )
+    ).one()
+    created = ensure_partitions(bind, "readings", since=first)
+    print(f"created {len(created)} readings partitions")
+
+    # Copy month by month so each statement only touches one partition
+    month = first
+    while month is not None and month <= last:
+        result = bind.execute(
+            sa.text(
+                "INSERT INTO readings SELECT * FROM readings_unpartitioned "
+                'WHERE "timestamp" >= :start AND "timestamp" < :end'
+            ),
+            {"start": month, "end": add_months(month, 1)},
+        )
+        print(f"{month:%Y-%m}: moved {result.rowcount} readings")
+        month = add_months(month, 1)
+
+    op.execute("DROP TABLE readings_unpartitioned")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE readings RENAME TO readings_partitioned")
+    op.execute(
+        "ALTER TABLE readings_partitioned "
+        "RENAME CONSTRAINT uq_readings_meter_timestamp "
+        "TO uq_readings_partitioned_meter_timestamp"
+    )
+    op.execute(
+        "ALTER TABLE readings_partitioned "
+        "RENAME CONSTRAINT readings_pkey TO readings_partitioned_pkey"
+    )
+    op.execute("CREATE TABLE readings (LIKE readings_partitioned INCLUDING DEFAULTS)")
+    op.execute("ALTER TABLE readings ADD PRIMARY KEY (id)")
+    op.execute(
+        "ALTER TABLE readings ADD CONSTRAINT uq_readings_meter_timestamp "
+        'UNIQUE (meter_id, "timestamp")'
+    )
+    op.execute(
+        "ALTER TABLE readings ADD FOREIGN KEY (meter_id) "
+        "REFERENCES meters (meter_id) ON DELETE CASCADE"
+    )
+    op.execute("ALTER SEQUENCE readings_id_seq OWNED BY readings.id")
+    op.execute("INSERT INTO readings SELECT * FROM readings_partitioned")
+    op.execute("DROP TABLE readings_partitioned")
@@ -0,0 +1,104 @@
+"""Hourly and daily rollups of readings
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+READING_COLUMNS = [
+    "phase_A_current",
+    "phase_B_current",
+    "phase_C_current",
+    "phase_A_voltage",
+    "phase_B_voltage",
+    "phase_C_voltage",
+    "phase_A_active_power",
+    "phase_A_power_factor",
+    "phase_B_active_power",
+    "phase_B_power_factor",
+    "phase_C_active_power",
+    "phase_C_power_factor",
+    "phase_A_grid_consumption",
+    "phase_A_exported_power",
+    "phase_B_grid_consumption",
+    "phase_B_exported_power",
+    "phase_C_grid_consumption",
+    "phase_C_exported_power",
+]
+COUNTER_COLUMNS = READING_COLUMNS[-6:]
+
+
+def _rollup_columns() -> list[sa.Column]:
+    return [
+        sa.Column(
+            "meter_id",
+            sa.Integer(),
+            sa.ForeignKey("meters.meter_id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("bucket", sa.DateTime(), primary_key=True),
+        sa.Column("sample_count", sa.Integer(), nullable=False),
+        sa.Column("first_timestamp", sa.DateTime(), nullable=False),
+        sa.Column("last_timestamp", sa.DateTime(), nullable=False),
+        *[
+            column
+            for name in READING_COLUMNS
+            for column in (
+                sa.Column(f"{name}_min", sa.Float(), nullable=True),
+                sa.Column(f"{name}_max", sa.Float(), nullable=True),
+                sa.Column(f"{name}_avg", sa.Float(), nullable=True),
+                sa.Column(f"{name}_count", sa.Integer(), nullable=False),
+            )
+        ],
+        *[
+            column
+            for name in COUNTER_COLUMNS
+            for column in (
+                sa.Column(f"{name}_first", sa.Float(), nullable=True),
+                sa.Column(f"{name}_last", sa.Float(), nullable=True),
+            )
+        ],
+    ]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # Databases bootstrapped by migrate.py already have the tables
+    for table in ("readings_hourly", "readings_daily"):
+        if not inspector.has_table(table):
+            op.create_table(table, *_rollup_columns())
+    if not inspector.has_table("rollup_dirty"):
+        op.create_table(
+            "rollup_dirty",
+            sa.Column("meter_id", sa.Integer(), primary_key=True),
+            sa.Column("bucket", sa.DateTime(), primary_key=True),
+        )
+
+    # Every stored hour starts out dirty; the rollup job builds them in batches
+    result = bind.execute(
+        sa.text(
+            "INSERT INTO rollup_dirty (meter_id, bucket) "
+            """SELECT DISTINCT meter_id, date_trunc('hour', "timestamp") FROM readings """
+            "ON CONFLICT DO NOTHING"
+        )
+    )
+    print(f"queued {result.rowcount} meter hours for the rollup job")
+
+
+def downgrade() -> None:
+    op.drop_table("rollup_dirty")
+    op.drop_table("readings_daily")
+    op.drop_table("readings_hourly")
@@ -0,0 +1,53 @@
+"""BRIN and covering indexes for time-series reads
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from src.partitions import create_index_concurrently
+
+
+revision: str = "0008"
+down_revision: Union[str, Sequence[str], None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LATEST_INCLUDE = (
+    '"phase_A_current", "phase_B_current", "phase_C_current", '
+    '"phase_A_voltage", "phase_B_voltage", "phase_C_voltage", '
+    '"phase_A_active_power", "phase_B_active_power", "phase_C_active_power"'
+)
+
+INDEXES = [
+    (
+        "readings",
+        "ix_readings_timestamp_brin",
+        'USING brin ("timestamp") WITH (autosummarize = on)',
+    ),
+    (
+        "readings",
+        "ix_readings_meter_latest",
+        f'(meter_id, "timestamp") INCLUDE ({LATEST_INCLUDE})',
+    ),
+    ("readings_15min", "ix_readings_15min_bucket_brin", "USING brin (bucket)"),
+    ("readings_hourly", "ix_readings_hourly_bucket_brin", "USING brin (bucket)"),
+    ("readings_daily", "ix_readings_daily_bucket_brin", "USING brin (bucket)"),
+]
+
+
+def upgrade() -> None:
+    # Concurrent builds cannot run inside the migration transaction
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        for table, name, definition in INDEXES:
+            create_index_concurrently(bind, table, name, definition)
+
+
+def downgrade() -> None:
+    for _, name, _ in reversed(INDEXES):
+        op.execute(f"DROP INDEX IF EXISTS {name}")
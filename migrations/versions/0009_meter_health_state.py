@@ -0,0 +1,33 @@
+"""Meter breaker state and reset requests in the collection state
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import add_column_if_missing
+
+
+revision: str = "0009"
+down_revision: Union[str, Sequence[str], None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    add_column_if_missing(
+        "data_collection_state", sa.Column("meter_health", sa.JSON(), nullable=True)
+    )
+    add_column_if_missing(
+        "data_collection_state", sa.Column("health_resets", sa.JSON(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("data_collection_state", "health_resets")
+    op.drop_column("data_collection_state", "meter_health")
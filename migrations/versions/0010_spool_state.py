@@ -0,0 +1,27 @@
+"""Spool stats in the collection state
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import add_column_if_missing
+
+
+revision: str = "0010"
+down_revision: Union[str, Sequence[str], None] = "0009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    add_column_if_missing("data_collection_state", sa.Column("spool", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("data_collection_state", "spool")
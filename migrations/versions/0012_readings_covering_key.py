@@ -0,0 +1,52 @@
+"""Fold the latest-reading covering index into the readings unique key
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from src.partitions import create_index_concurrently
+
+
+revision: str = "0012"
+down_revision: Union[str, Sequence[str], None] = "0011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LATEST_INCLUDE = (
+    '"phase_A_current", "phase_B_current", "phase_C_current", '
+    '"phase_A_voltage", "phase_B_voltage", "phase_C_voltage", '
+    '"phase_A_active_power", "phase_B_active_power", "phase_C_active_power"'
+)
+
+
+def upgrade() -> None:
+    # uq_readings_meter_timestamp and ix_readings_meter_latest had the same
+    # key, so every insert maintained two btrees on (meter_id, timestamp).
+    # The unique key is built first, ON CONFLICT has an arbiter throughout
+    with op.get_context().autocommit_block():
+        create_index_concurrently(
+            op.get_bind(),
+            "readings",
+            "ix_readings_meter_key",
+            f'(meter_id, "timestamp") INCLUDE ({LATEST_INCLUDE})',
+            unique=True,
+        )
+    op.execute("ALTER TABLE readings DROP CONSTRAINT IF EXISTS uq_readings_meter_timestamp")
+    op.execute("DROP INDEX IF EXISTS ix_readings_meter_latest")
+
+
+def downgrade() -> None:
+    op.execute(
+        "ALTER TABLE readings ADD CONSTRAINT uq_readings_meter_timestamp "
+        'UNIQUE (meter_id, "timestamp")'
+    )
+    op.execute(
+        'CREATE INDEX ix_readings_meter_latest ON readings (meter_id, "timestamp") '
+        f"INCLUDE ({LATEST_INCLUDE})"
+    )
+    op.execute("DROP INDEX ix_readings_meter_key")
@@ -0,0 +1,172 @@
+import threading
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from .api.rollups import rollup_sum
+from .archive import archived_span, month_files
+from .models import ReadingDailyDB
+from .partitions import add_months, month_start
+from .settings import settings
+
+try:
+    import duckdb
+except ImportError:  # optional, install the "analytics" extra
+    duckdb = None
+
+# (meter_id, period start or None) -> column -> (sum of samples, sample count)
+Totals = dict[tuple[int, Optional[datetime]], dict[str, tuple[float, int]]]
+
+_duckdb_connection = None
+_duckdb_lock = threading.Lock()
+
+
+def engine_for(route: str) -> str:
+    """Engine configured for a route, postgres unless DuckDB is installed and chosen"""
+    if route in settings.DUCKDB_ROUTES and duckdb is not None:
+        return "duckdb"
+    return "postgres"
+
+
+def _duckdb_cursor():
+    """New cursor on the process-wide DuckDB connection, opened on first use.
+
+    Cursors share the connection's database, thread pool and caches but
+    may be used from different threads, so each query takes its own.
+    """
+    global _duckdb_connection
+    with _duckdb_lock:
+        if _duckdb_connection is None:
+            _duckdb_connection = duckdb.connect(config={"threads": settings.DUCKDB_THREADS})
+    return _duckdb_connection.cursor()
+
+
+def _add(totals: Totals, key, name: str, total, count):
+    if not count:
+        return
+    old_total, old_count = totals.setdefault(key, {}).get(name, (0.0, 0))
+    totals[key][name] = (old_total + float(total), old_count + int(count))
+
+
+def _postgres_totals(
+    db: Session,
+    totals: Totals,
+    columns: list[str],
+    ranges: list[tuple[datetime, datetime]],
+    period: Optional[str],
+    meter_ids: Optional[list[int]],
+):
+    """Accumulate totals from the daily rollup over the given ranges"""
+    if not ranges:
+        return
+    keys = [ReadingDailyDB.meter_id]
+    if period:
+        keys.append(func.date_trunc(period, ReadingDailyDB.bucket))
+    aggregates = []
+    for name in columns:
+        aggregates.append(func.sum(rollup_sum(ReadingDailyDB, name)))
+        aggregates.append(func.sum(getattr(ReadingDailyDB, f"{name}_count")))
+
+    query = (
+        select(*keys, *aggregates)
+        .where(
+            or_(
+                *(
+                    and_(ReadingDailyDB.bucket >= start, ReadingDailyDB.bucket < end)
+                    for start, end in ranges
+                )
+            )
+        )
+        .group_by(*keys)
+    )
+    if meter_ids is not None:
+        query = query.where(ReadingDailyDB.meter_id.in_(meter_ids))
+
+    for row in db.execute(query):
+        key = (row[0], row[1] if period else None)
+        values = row[len(keys):]
+        for i, name in enumerate(columns):
+            _add(totals, key, name, values[2 * i], values[2 * i + 1])
+
+
+def _duckdb_totals(
+    totals: Totals,
+    columns: list[str],
+    start: datetime,
+    end: datetime,
+    period: Optional[str],
+    meter_ids: Optional[list[int]],
+):
+    """Accumulate totals from the Parquet archive, start and end on month bounds"""
+    files, month = [], start
+    while month < end:
+        files += [str(path) for path in month_files(month, meter_ids)]
+        month = add_months(month, 1)
+    if not files:
+        return
+
+    aggregates = ", ".join(f'sum("{name}"), count("{name}")' for name in columns)
+    keys = f"meter_id, date_trunc('{period}', \"timestamp\")" if period else "meter_id"
+    query = (
+        f"SELECT {keys}, {aggregates} FROM ("
+        "  SELECT *, CAST(regexp_extract(filename, 'meter_(\\d+)\\.parquet$', 1) AS INTEGER)"
+        "  AS meter_id FROM read_parquet(?, filename = true, union_by_name = true)"
+        ") GROUP BY ALL"
+    )
+    cursor = _duckdb_cursor()
+    try:
+        rows = cursor.execute(query, [files]).fetchall()
+    finally:
+        cursor.close()
+
+    width = 2 if period else 1
+    for row in rows:
+        key = (row[0], row[1] if period else None)
+        for i, name in enumerate(columns):
+            _add(totals, key, name, row[width + 2 * i], row[width + 2 * i + 1])
+
+
+def column_totals(
+    db: Session,
+    columns: list[str],
+    start: datetime,
+    end: datetime,
+    engine: str = "postgres",
+    period: Optional[str] = None,
+    meter_ids: Optional[list[int]] = None,
+) -> tuple[Totals, Optional[datetime]]:
+    """Sum and count of reading columns per meter in [start, end).
+
+    period ("month" or "year") also splits the totals by that period.
+
+    With the duckdb engine the fully archived months inside the range are
+    scanned from Parquet and only the rest goes to Postgres, so the result
+    matches the postgres engine. Also returns the archive watermark used,
+    None when Postgres answered everything.
+    """
+    totals: Totals = {}
+    span = archived_span() if engine == "duckdb" else None
+    if span is not None:
+        # Only whole archived months, the rollup fills in partial ones
+        archived_start = max(start, span[0])
+        if archived_start != month_start(archived_start):
+            archived_start = add_months(month_start(archived_start), 1)
+        archived_end = month_start(min(end, span[1]))
+        if archived_start >= archived_end:
+            span = None
+
+    if span is None:
+        _postgres_totals(db, totals, columns, [(start, end)], period, meter_ids)
+        return totals, None
+
+    _duckdb_totals(totals, columns, archived_start, archived_end, period, meter_ids)
+    rest = [(start, archived_start), (archived_end, end)]
+    _postgres_totals(db, totals, columns, [r for r in rest if r[0] < r[1]], period, meter_ids)
+    return totals, archived_end
+
+
+def average(totals: Totals, key, name: str) -> Optional[float]:
+    total, count = totals.get(key, {}).get(name, (0.0, 0))
+    return total / count if count else None
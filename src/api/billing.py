@@ -4,7 +4,9 @@ from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy import func
 
-from ..models import EnergyDB, BillingDB, CostPerDayDB, CostPerMeterDB
+from ..models import BillingDB, CostPerDayDB, CostPerMeterDB, ReadingDailyDB
+from .single_flight import advisory_xact_lock
+from .snapshot import notify_bills_changed
 
 
 TARIFF = 8.0
@@ -12,92 +14,29 @@ TARIFF = 8.0
 
 def get_power_per_meter_per_day(year: int, month: int, day: int, db: Session):
     start = datetime(year, month, day)
-    end = start + timedelta(days=1)
-    
-    # Get first and last readings for each meter/phase
-    from sqlalchemy import and_
-    
-    # Subquery for first reading of the day
-    first_reading = (
-        db.query(
-            EnergyDB.meter_id,
-            func.min(EnergyDB.timestamp).label("first_time")
-        )
-        .filter(
-            EnergyDB.timestamp >= start,
-            EnergyDB.timestamp < end
-        )
-        .group_by(EnergyDB.meter_id)
-        .subquery()
-    )
-    
-    # Subquery for last reading of the day
-    last_reading = (
-        db.query(
-            EnergyDB.meter_id,
-            func.max(EnergyDB.timestamp).label("last_time")
-        )
-        .filter(
-            EnergyDB.timestamp >= start,
-            EnergyDB.timestamp < end
-        )
-        .group_by(EnergyDB.meter_id)
-        .subquery()
-    )
-    
-    # Get first values
-    first_values = (
-        db.query(
-            EnergyDB.meter_id,
-            EnergyDB.phase_A_grid_consumption.label("first_a"),
-            EnergyDB.phase_B_grid_consumption.label("first_b"),
-            EnergyDB.phase_C_grid_consumption.label("first_c"),
-        )
-        .join(
-            first_reading,
-            and_(
-                EnergyDB.meter_id == first_reading.c.meter_id,
-                EnergyDB.timestamp == first_reading.c.first_time
-            )
-        )
-        .all()
-    )
-    
-    # Get last values
-    last_values = (
+
+    # First and last energy counter of the day, straight from the daily rollup
+    daily = (
         db.query(
-            EnergyDB.meter_id,
-            EnergyDB.phase_A_grid_consumption.label("last_a"),
-            EnergyDB.phase_B_grid_consumption.label("last_b"),
-            EnergyDB.phase_C_grid_consumption.label("last_c"),
-        )
-        .join(
-            last_reading,
-            and_(
-                EnergyDB.meter_id == last_reading.c.meter_id,
-                EnergyDB.timestamp == last_reading.c.last_time
-            )
+            ReadingDailyDB.meter_id,
+            ReadingDailyDB.phase_A_grid_consumption_first.label("first_a"),
+            ReadingDailyDB.phase_B_grid_consumption_first.label("first_b"),
+            ReadingDailyDB.phase_C_grid_consumption_first.label("first_c"),
+            ReadingDailyDB.phase_A_grid_consumption_last.label("last_a"),
+            ReadingDailyDB.phase_B_grid_consumption_last.label("last_b"),
+            ReadingDailyDB.phase_C_grid_consumption_last.label("last_c"),
         )
+        .filter(ReadingDailyDB.bucket == start)
         .all()
     )
     
-    # Create lookup dictionaries
-    first_dict = {row.meter_id: row for row in first_values}
-    last_dict = {row.meter_id: row for row in last_values}
-    
     meter_to_energy = {}
     
-    for meter_id in first_dict.keys():
-        if meter_id not in last_dict:
-            continue
-            
-        first = first_dict[meter_id]
-        last = last_dict[meter_id]
-        
+    for row in daily:
         # Calculate consumption as difference
-        phase_a = (last.last_a or 0) - (first.first_a or 0)
-        phase_b = (last.last_b or 0) - (first.first_b or 0)
-        phase_c = (last.last_c or 0) - (first.first_c or 0)
+        phase_a = (row.last_a or 0) - (row.first_a or 0)
+        phase_b = (row.last_b or 0) - (row.first_b or 0)
+        phase_c = (row.last_c or 0) - (row.first_c or 0)
         
         total = phase_a + phase_b + phase_c
         
@@ -107,12 +46,23 @@ def get_power_per_meter_per_day(year: int, month: int, day: int, db: Session):
             # You may want to log this or handle differently
             continue
             
-        meter_to_energy[meter_id] = total
+        meter_to_energy[row.meter_id] = total
     
     return meter_to_energy
 
-def calculate_bill(year: int, month: int, db: Session):
+def calculate_bill(year: int, month: int, db: Session, recalculate: bool = True):
+    """Calculate and commit the bill of a month.
+
+    Holds the month's advisory lock, so the scheduler and the billing
+    routes of every worker never write the same month at once. Without
+    recalculate an existing bill is kept.
+    """
     month_key = f"{year}-{month:02d}"
+    advisory_xact_lock(db, f"bill:{month_key}")
+    if not recalculate and db.query(BillingDB.date).filter(BillingDB.date == month_key).first():
+        db.commit()
+        return
+
     _, total_days = calendar.monthrange(year, month)
     
     # Track total cost per meter for the entire month
@@ -184,5 +134,6 @@ def calculate_bill(year: int, month: int, db: Session):
         expensive_day_cost=expensive_day_cost,
     )
     db.add(billing)
+    notify_bills_changed(db)
     
     db.commit()
@@ -0,0 +1,284 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from ..models import READING_COLUMNS, ROLLUP_COUNTER_COLUMNS, MeterDB, ReadingDB
+from ..settings import settings
+from ..utils.floats import float32_to_python
+from .snapshot import snapshot
+
+INITIAL_CAPACITY = 256
+
+
+def _dtype(column: str):
+    # float32 keeps about 7 significant digits, enough for instantaneous
+    # values but not for kWh counters that only ever grow
+    return np.float64 if column in ROLLUP_COUNTER_COLUMNS else np.float32
+
+
+class MeterRing:
+    """Readings of one meter in time order, in a ring of column arrays.
+
+    Readings older than covered_from may have been evicted, everything
+    from it on is held. Full rings overwrite readings older than the
+    window and otherwise double in size.
+    """
+
+    def __init__(self, covered_from: datetime, capacity: int = INITIAL_CAPACITY):
+        self.covered_from = covered_from
+        self.start = 0
+        self.size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.timestamps = np.empty(capacity, dtype="datetime64[us]")
+        self.values = {c: np.empty(capacity, dtype=_dtype(c)) for c in READING_COLUMNS}
+
+    @property
+    def capacity(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + sum(v.nbytes for v in self.values.values())
+
+    def _order(self) -> np.ndarray:
+        """Slot indices from oldest to newest"""
+        return (self.start + np.arange(self.size)) % self.capacity
+
+    def _linearize(self, capacity: int):
+        """Move the readings to slots 0..size-1 of arrays of the given capacity"""
+        order = self._order()
+        timestamps, values = self.timestamps[order], {c: v[order] for c, v in self.values.items()}
+        self._allocate(capacity)
+        self.timestamps[: self.size] = timestamps
+        for c, v in values.items():
+            self.values[c][: self.size] = v
+        self.start = 0
+
+    def fill(self, timestamps: list, columns: dict[str, list]):
+        """Load readings in time order into an empty ring"""
+        self.size = len(timestamps)
+        capacity = INITIAL_CAPACITY
+        while capacity < self.size:
+            capacity *= 2
+        self._allocate(capacity)
+        self.timestamps[: self.size] = np.array(timestamps, dtype="datetime64[us]")
+        for c in READING_COLUMNS:
+            # None becomes NaN
+            self.values[c][: self.size] = np.array(columns[c], dtype=np.float64)
+
+    def evict(self, cutoff: datetime):
+        cutoff = np.datetime64(cutoff, "us")
+        count = int(np.searchsorted(self.timestamps[self._order()], cutoff))
+        self.start = (self.start + count) % self.capacity
+        self.size -= count
+        self.covered_from = max(self.covered_from, cutoff.astype(datetime))
+
+    def add(self, timestamp: datetime, row: dict, cutoff: datetime):
+        """Insert one reading, ignored if its timestamp is already held"""
+        if timestamp < self.covered_from:
+            return
+        ts = np.datetime64(timestamp, "us")
+        newest = self.timestamps[(self.start + self.size - 1) % self.capacity]
+        if self.size and ts <= newest:
+            self._insert_late(ts, row)
+            return
+        if self.size == self.capacity:
+            self.evict(cutoff)
+        if self.size == self.capacity:
+            self._linearize(2 * self.capacity)
+        slot = (self.start + self.size) % self.capacity
+        self.timestamps[slot] = ts
+        for c in READING_COLUMNS:
+            value = row.get(c)
+            self.values[c][slot] = np.nan if value is None else value
+        self.size += 1
+
+    def _insert_late(self, ts: np.datetime64, row: dict):
+        """A reading older than the newest one, e.g. drained from the spool"""
+        order = self._order()
+        position = int(np.searchsorted(self.timestamps[order], ts))
+        if position < self.size and self.timestamps[order[position]] == ts:
+            return
+        self._linearize(self.capacity if self.size < self.capacity else 2 * self.capacity)
+        end = self.size
+        self.timestamps[position + 1 : end + 1] = self.timestamps[position:end]
+        self.timestamps[position] = ts
+        for c in READING_COLUMNS:
+            column = self.values[c]
+            column[position + 1 : end + 1] = column[position:end]
+            value = row.get(c)
+            column[position] = np.nan if value is None else value
+        self.size += 1
+
+    def slice(self, start: datetime, end: datetime) -> list[dict]:
+        """Readings with start <= timestamp <= end, oldest first"""
+        order = self._order()
+        timestamps = self.timestamps[order]
+        lo = int(np.searchsorted(timestamps, np.datetime64(start, "us"), "left"))
+        hi = int(np.searchsorted(timestamps, np.datetime64(end, "us"), "right"))
+        selected = order[lo:hi]
+        columns = {"timestamp": self.timestamps[selected].astype(datetime).tolist()}
+        for c, v in self.values.items():
+            columns[c] = float32_to_python(v[selected])
+        return [
+            {"timestamp": columns["timestamp"][i], **{c: columns[c][i] for c in READING_COLUMNS}}
+            for i in range(hi - lo)
+        ]
+
+
+class HotTier:
+    """The last HOT_TIER_HOURS of readings of every meter, held in memory.
+
+    Follows the latest snapshot: warmed with one query on its first load,
+    fed the rows this process writes and topped up with the readings
+    other processes inserted whenever the snapshot reloads. A top-up asks
+    for rows with a new id or a timestamp within HOT_TIER_REFRESH_OVERLAP_SECONDS
+    of the newest one held, since ids are taken in insert order but become
+    visible in commit order; rows already held are skipped.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.hits = 0
+        self.misses = 0
+        self._rings: dict[int, MeterRing] = {}
+        self._meter_ids: dict[str, int] = {}
+        self._since: Optional[datetime] = None
+        self._last_id = 0
+        self._newest: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def _cutoff(self) -> datetime:
+        return datetime.now() - timedelta(hours=settings.HOT_TIER_HOURS)
+
+    def _query(self, db: Session, *conditions) -> list:
+        return db.execute(
+            select(
+                ReadingDB.id,
+                ReadingDB.meter_id,
+                ReadingDB.timestamp,
+                *(getattr(ReadingDB, c) for c in READING_COLUMNS),
+            )
+            .where(*conditions)
+            .order_by(ReadingDB.meter_id, ReadingDB.timestamp)
+        ).all()
+
+    def warm(self, db: Session):
+        """Load the window from the database, replacing what is held"""
+        since = self._cutoff()
+        meters = dict(db.execute(select(MeterDB.name, MeterDB.meter_id)).all())
+        rows = self._query(db, ReadingDB.timestamp >= since)
+
+        rings = {meter_id: MeterRing(since) for meter_id in meters.values()}
+        last_id = max((row.id for row in rows), default=0)
+        newest = max((row.timestamp for row in rows), default=since)
+        # Rows are ordered by meter, fill each ring with its run of rows
+        start = 0
+        while start < len(rows):
+            meter_id = rows[start].meter_id
+            end = start
+            while end < len(rows) and rows[end].meter_id == meter_id:
+                end += 1
+            if meter_id in rings:
+                columns = dict(zip(["id", "meter_id", "timestamp", *READING_COLUMNS], zip(*rows[start:end])))
+                rings[meter_id].fill(columns["timestamp"], columns)
+            start = end
+
+        with self._lock:
+            self._rings, self._meter_ids = rings, meters
+            self._since, self._last_id, self._newest = since, last_id, newest
+            self.ready = True
+
+    def refresh(self, db: Session):
+        """Add readings inserted since the last refresh, warm if not ready"""
+        if not self.ready:
+            self.warm(db)
+            return
+
+        cutoff = self._cutoff()
+        covered_from = min((r.covered_from for r in self._rings.values()), default=cutoff)
+        overlap = timedelta(seconds=settings.HOT_TIER_REFRESH_OVERLAP_SECONDS)
+        meters = dict(db.execute(select(MeterDB.name, MeterDB.meter_id)).all())
+        rows = [
+            row._mapping
+            for row in self._query(
+                db,
+                or_(ReadingDB.id > self._last_id, ReadingDB.timestamp >= self._newest - overlap),
+                ReadingDB.timestamp >= covered_from,
+            )
+        ]
+        with self._lock:
+            # Meters added since, their readings all have ids past _last_id
+            for meter_id in meters.values():
+                self._rings.setdefault(meter_id, MeterRing(self._since))
+            for meter_id in set(self._rings) - set(meters.values()):
+                del self._rings[meter_id]
+            self._meter_ids = meters
+            self._add(rows, cutoff)
+            # The overlap re-reads older rows, never move backwards
+            self._last_id = max(self._last_id, max((row["id"] for row in rows), default=0))
+
+    def publish(self, rows: list[dict]):
+        """Merge readings this process just committed"""
+        if not self.ready:
+            return
+        with self._lock:
+            self._add(sorted(rows, key=lambda r: (r["meter_id"], r["timestamp"])), self._cutoff())
+
+    def _add(self, rows, cutoff: datetime):
+        for row in rows:
+            ring = self._rings.get(row["meter_id"])
+            if ring is not None:
+                ring.add(row["timestamp"], row, cutoff)
+                self._newest = max(self._newest, row["timestamp"])
+
+    def invalidate(self):
+        with self._lock:
+            self.ready = False
+
+    def readings(self, meter_name: str, start: datetime, end: datetime) -> Optional[list[dict]]:
+        """Readings of a meter with start <= timestamp <= end, oldest first,
+        as dicts of ReadingDB columns. None when the window does not cover
+        start, the caller then asks the database."""
+        with self._lock:
+            meter_id = self._meter_ids.get(meter_name)
+            ring = self._rings.get(meter_id)
+            if not self.ready or ring is None or start < ring.covered_from:
+                self.misses += 1
+                return None
+            self.hits += 1
+            rows = ring.slice(start, end)
+        for row in rows:
+            row["meter_id"] = meter_id
+        return rows
+
+    def stats(self) -> dict:
+        with self._lock:
+            meters = {
+                name: {
+                    "readings": self._rings[meter_id].size,
+                    "capacity": self._rings[meter_id].capacity,
+                    "bytes": self._rings[meter_id].nbytes,
+                }
+                for name, meter_id in self._meter_ids.items()
+                if meter_id in self._rings
+            }
+        return {
+            "ready": self.ready,
+            "hours": settings.HOT_TIER_HOURS,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytes": sum(m["bytes"] for m in meters.values()),
+            "meters": meters,
+        }
+
+
+hot_tier = HotTier()
+if settings.HOT_TIER_ENABLED:
+    snapshot.followers.append(hot_tier)
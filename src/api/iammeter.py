@@ -1,123 +1,347 @@
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+import httpx
 import requests
 from ..settings import settings
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
-from ..models import CurrentDB, EnergyDB, MeterDB, PowerDB, VoltageDB
+from ..models import MeterDB
 from ..database import SessionLocal
+from .writer import ReadingBatchWriter
+from .meter_health import backoff_delay, health
+from .spool import spool
 from datetime import datetime
 
 
 db = SessionLocal()
-URL = "https://www.iammeter.com/api/v1/site/meterdata2/"
+URL = settings.IAMMETER_BASE_URL.rstrip("/") + "/api/v1/site/meterdata2/"
 IAMMETER_ADD_STATION_URL = "https://www.iammeter.com/dz/user/BIZ_DZ_DianZhanSave/0"
 
+FIELDS = [
+    "voltage",
+    "current",
+    "active_power",
+    "power_factor",
+    "grid_consumption",
+    "exported_power",
+]
+
+
+@dataclass
+class CycleStats:
+    mode: str
+    started_at: datetime
+    duration_seconds: float
+    meters: int
+    fetched: int
+    # Meters not requested because their circuit breaker is open
+    skipped: int = 0
+
+    @property
+    def failed(self) -> int:
+        return self.meters - self.fetched - self.skipped
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data["started_at"] = self.started_at.isoformat()
+        data["failed"] = self.failed
+        return data
+
+
+# Stats of the most recent polling cycle, exposed via /data-collection/status
+last_cycle_stats: Optional[CycleStats] = None
+
+# Last meter list read from the database, used while it is unreachable
+_known_meters: Optional[list[tuple[int, str]]] = None
+
+# Shared pooled client for the async poller, bound to the loop that created it
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+TRANSIENT_ERRORS = (
+    httpx.TransportError,
+    requests.ConnectionError,
+    requests.Timeout,
+    TimeoutError,
+)
+
+
+class MeterFetchError(Exception):
+    """A failed meterdata2 request; transient ones are worth retrying"""
+
+    def __init__(self, message: str, transient: bool):
+        super().__init__(message)
+        self.transient = transient
+
+
+def parse_meter_payload(payload: dict):
+    if not payload.get("successful"):
+        return None
+
+    data = payload["data"]
+
+    phaseAdata = dict(zip(FIELDS, data["values"][0]))
+    phaseBdata = dict(zip(FIELDS, data["values"][1]))
+    phaseCdata = dict(zip(FIELDS, data["values"][2]))
+
+    return {
+        "timestamp": data["localTime"],
+        "phaseAdata": phaseAdata,
+        "phaseBdata": phaseBdata,
+        "phaseCdata": phaseCdata,
+    }
+
+
+def _parse_response(r) -> dict:
+    """Turn a requests/httpx response into meter data or a MeterFetchError"""
+    if r.status_code == 429 or r.status_code >= 500:
+        raise MeterFetchError(f"HTTP {r.status_code}", transient=True)
+    if r.status_code >= 400:
+        raise MeterFetchError(f"HTTP {r.status_code}", transient=False)
+
+    payload = r.json()
+    meter_data = parse_meter_payload(payload)
+    if meter_data is None:
+        raise MeterFetchError(f"API error: {payload.get('message')}", transient=False)
+    return meter_data
+
+
+def _as_fetch_error(e: Exception) -> MeterFetchError:
+    if isinstance(e, MeterFetchError):
+        return e
+    return MeterFetchError(repr(e), transient=isinstance(e, TRANSIENT_ERRORS))
+
+
+def _retry_delay(error: MeterFetchError, attempt: int, deadline: float) -> Optional[float]:
+    """Backoff before the next attempt, None when the error is final or
+    the retry would not start before the deadline"""
+    if not error.transient or attempt >= settings.FETCH_RETRIES:
+        return None
+    delay = backoff_delay(attempt)
+    return delay if time.monotonic() + delay < deadline else None
+
 
 def fetch_meter_data(meter_sn: str):
+    meter_health = health.get(meter_sn)
     params = {"token": settings.IAMMETER_TOKEN}
-    try:
-        r = requests.get(URL + meter_sn, timeout=10, params=params)
-        r.raise_for_status()
-        payload = r.json()
-
-        if not payload.get("successful"):
-            print("API error:", payload.get("message"))
+    # All attempts of a meter share one POLL_DEADLINE_SECONDS, so a dead
+    # meter costs at most that per cycle
+    deadline = time.monotonic() + settings.POLL_DEADLINE_SECONDS
+
+    for attempt in range(settings.FETCH_RETRIES + 1):
+        try:
+            r = requests.get(
+                URL + meter_sn, timeout=deadline - time.monotonic(), params=params
+            )
+            meter_data = _parse_response(r)
+        except Exception as e:
+            error = _as_fetch_error(e)
+            delay = _retry_delay(error, attempt, deadline)
+            if delay is not None:
+                time.sleep(delay)
+                continue
+            meter_health.record_failure(str(error))
+            print(f"Fetch failed for {meter_sn}:", error)
             return None
 
-        data = payload["data"]
+        meter_health.record_success()
+        return meter_data
 
-        fields = [
-            "voltage",
-            "current",
-            "active_power",
-            "power_factor",
-            "grid_consumption",
-            "exported_power",
-        ]
 
-        phaseAdata = dict(zip(fields, data["values"][0]))
-        phaseBdata = dict(zip(fields, data["values"][1]))
-        phaseCdata = dict(zip(fields, data["values"][2]))
+def get_async_client() -> httpx.AsyncClient:
+    global _async_client, _async_client_loop
 
-        return {
-            "timestamp": data["localTime"],
-            "phaseAdata": phaseAdata,
-            "phaseBdata": phaseBdata,
-            "phaseCdata": phaseCdata,
-        }
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.POLL_DEADLINE_SECONDS),
+            limits=httpx.Limits(
+                max_connections=settings.POLL_CONCURRENCY,
+                max_keepalive_connections=settings.POLL_CONCURRENCY,
+            ),
+        )
+        _async_client_loop = loop
+    return _async_client
 
-    except Exception as e:
-        print("Fetch failed:", e)
-        return None
 
+async def close_async_client():
+    global _async_client, _async_client_loop
 
-def insert_meterdata(db: Session, meter_id: int, meter_data: dict):
-    ts = datetime.strptime(meter_data["timestamp"], "%Y/%m/%d %H:%M:%S")
+    if _async_client is not None and not _async_client.is_closed:
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
 
-    a = meter_data["phaseAdata"]
-    b = meter_data["phaseBdata"]
-    c = meter_data["phaseCdata"]
 
-    current = CurrentDB(
-        meter_id=meter_id,
-        timestamp=ts,
-        phase_A_current=a["current"],
-        phase_B_current=b["current"],
-        phase_C_current=c["current"],
-    )
+async def fetch_meter_data_async(client: httpx.AsyncClient, meter_sn: str):
+    meter_health = health.get(meter_sn)
+    params = {"token": settings.IAMMETER_TOKEN}
+    deadline = time.monotonic() + settings.POLL_DEADLINE_SECONDS
+
+    for attempt in range(settings.FETCH_RETRIES + 1):
+        try:
+            # httpx timeouts are per phase, the deadline bounds every attempt
+            # of the meter together
+            r = await asyncio.wait_for(
+                client.get(URL + meter_sn, params=params),
+                timeout=deadline - time.monotonic(),
+            )
+            meter_data = _parse_response(r)
+        except Exception as e:
+            error = _as_fetch_error(e)
+            delay = _retry_delay(error, attempt, deadline)
+            if delay is not None:
+                await asyncio.sleep(delay)
+                continue
+            meter_health.record_failure(str(error))
+            print(f"Fetch failed for {meter_sn}:", error)
+            return None
 
-    voltage = VoltageDB(
-        meter_id=meter_id,
-        timestamp=ts,
-        phase_A_voltage=a["voltage"],
-        phase_B_voltage=b["voltage"],
-        phase_C_voltage=c["voltage"],
-    )
+        meter_health.record_success()
+        return meter_data
 
-    power = PowerDB(
-        meter_id=meter_id,
-        timestamp=ts,
-        phase_A_active_power=a["active_power"],
-        phase_A_power_factor=a["power_factor"],
-        phase_B_active_power=b["active_power"],
-        phase_B_power_factor=b["power_factor"],
-        phase_C_active_power=c["active_power"],
-        phase_C_power_factor=c["power_factor"],
-    )
 
-    energy = EnergyDB(
-        meter_id=meter_id,
-        timestamp=ts,
-        phase_A_grid_consumption=a["grid_consumption"],
-        phase_A_exported_power=a["exported_power"],
-        phase_B_grid_consumption=b["grid_consumption"],
-        phase_B_exported_power=b["exported_power"],
-        phase_C_grid_consumption=c["grid_consumption"],
-        phase_C_exported_power=c["exported_power"],
+async def fetch_all_meter_data_async(meters: list[tuple[int, str]]) -> dict[int, dict]:
+    """Fetch every (meter_id, sn) concurrently, at most POLL_CONCURRENCY at a time"""
+    client = get_async_client()
+    semaphore = asyncio.Semaphore(settings.POLL_CONCURRENCY)
+
+    async def fetch_one(meter_id: int, sn: str):
+        async with semaphore:
+            return meter_id, await fetch_meter_data_async(client, sn)
+
+    results = await asyncio.gather(*(fetch_one(mid, sn) for mid, sn in meters))
+    return {meter_id: data for meter_id, data in results if data is not None}
+
+
+def reading_row(meter_id: int, meter_data: dict) -> dict:
+    """Flatten a parsed meterdata2 payload into a readings row"""
+    row = {
+        "meter_id": meter_id,
+        "timestamp": datetime.strptime(meter_data["timestamp"], "%Y/%m/%d %H:%M:%S"),
+    }
+    for phase in "ABC":
+        values = meter_data[f"phase{phase}data"]
+        for field in FIELDS:
+            row[f"phase_{phase}_{field}"] = values[field]
+    return row
+
+
+def _record_cycle(
+    mode: str, started_at: datetime, started: float, meters: int, fetched: int, skipped: int
+):
+    global last_cycle_stats
+
+    last_cycle_stats = CycleStats(
+        mode=mode,
+        started_at=started_at,
+        duration_seconds=round(time.perf_counter() - started, 3),
+        meters=meters,
+        fetched=fetched,
+        skipped=skipped,
+    )
+    print(
+        f"{mode} polling cycle: {fetched}/{meters} meters "
+        f"({skipped} skipped) in {last_cycle_stats.duration_seconds}s"
     )
 
-    db.add_all([current, voltage, power, energy])
 
+def load_meters() -> list[tuple[int, str]]:
+    """(meter_id, sn) of every meter, or the last known list if the DB is down"""
+    global _known_meters
 
-def store_all_meter_data():
     db: Session = SessionLocal()
     try:
-        meters = db.query(MeterDB).all()
+        _known_meters = [
+            (m.meter_id, m.sn) for m in db.query(MeterDB.meter_id, MeterDB.sn).all()
+        ]
+    except Exception as e:
+        if _known_meters is None:
+            raise
+        print("load_meters failed, polling the last known meters:", e)
+    finally:
+        db.close()
+    return _known_meters
 
-        for meter in meters:
-            meter_data = fetch_meter_data(meter.sn)
-            if meter_data is None:
-                continue
-            insert_meterdata(db, meter.meter_id, meter_data)
-            print(f"data stored for meter {meter.meter_id} at time {datetime.now()}")
 
+def write_rows(rows: list[dict]):
+    db: Session = SessionLocal()
+    try:
+        writer = ReadingBatchWriter()
+        writer.extend(rows)
+        writer.flush(db)
         db.commit()
     except Exception as e:
         db.rollback()
-        print("store_all_meter_data error:", e)
+        print("write_rows error:", e)
         raise
     finally:
         db.close()
 
 
+def store_all_meter_data():
+    """Sequential fallback: fetch and store meters one after another"""
+    started_at, started = datetime.now(), time.perf_counter()
+    meters = load_meters()
+    rows = []
+    skipped = 0
+
+    for meter_id, sn in meters:
+        if not health.get(sn).allow_request():
+            skipped += 1
+            continue
+        meter_data = fetch_meter_data(sn)
+        if meter_data is None:
+            continue
+        rows.append(reading_row(meter_id, meter_data))
+
+    if settings.SPOOL_ENABLED:
+        spool.append(rows)
+        spool.drain()
+    elif rows:
+        write_rows(rows)
+    _record_cycle("sequential", started_at, started, len(meters), len(rows), skipped)
+
+
+def _log_drain_error(drain: asyncio.Future):
+    if not drain.cancelled() and drain.exception() is not None:
+        print("Spool drain failed:", drain.exception())
+
+
+async def store_all_meter_data_async():
+    """Fetch all meters concurrently, then store the cycle in one transaction"""
+    started_at, started = datetime.now(), time.perf_counter()
+
+    meters = await asyncio.to_thread(load_meters)
+    # Meters with an open breaker are skipped instead of eating the cycle budget
+    due = [(mid, sn) for mid, sn in meters if health.get(sn).allow_request()]
+    readings = await fetch_all_meter_data_async(due)
+    rows = [reading_row(meter_id, data) for meter_id, data in readings.items()]
+
+    if settings.SPOOL_ENABLED:
+        await asyncio.to_thread(spool.append, rows)
+        # Not awaited: a slow or unreachable database must not delay the next poll
+        drain = asyncio.get_running_loop().run_in_executor(None, spool.drain)
+        drain.add_done_callback(_log_drain_error)
+    elif rows:
+        await asyncio.to_thread(write_rows, rows)
+
+    _record_cycle(
+        "async", started_at, started, len(meters), len(rows), len(meters) - len(due)
+    )
+
+
+async def collect_meter_data():
+    """Run one polling cycle using the configured POLL_MODE"""
+    if settings.POLL_MODE == "sequential":
+        await asyncio.to_thread(store_all_meter_data)
+    else:
+        await store_all_meter_data_async()
+
+
 def get_meter_id_by_name(db, meter_name):
     try:
         meter_id = (
@@ -152,21 +376,56 @@ def calculate_unbalance(A, B, C):
     return round((max_dev / avg) * 100, 2)
 
 
+def unbalance_sql(A, B, C):
+    """calculate_unbalance as a SQL expression over three columns, before
+    rounding: pass the value to unbalance_level"""
+    avg = (A + B + C) / 3
+    max_dev = func.greatest(func.abs(A - avg), func.abs(B - avg), func.abs(C - avg))
+    return case((avg == 0, 0.0), else_=max_dev / avg * 100)
+
+
+def unbalance_level(value, levels) -> tuple[Optional[float], str]:
+    """Round an unbalance_sql value and grade it, NO_DATA when it is NULL.
+
+    Rounded here rather than in SQL, where round() on numeric takes halves
+    away from zero while Python's round() goes to the even neighbour.
+    """
+    if value is None:
+        return None, "NO_DATA"
+    value = round(value, 2)
+    return value, level(value, levels, "CRITICAL")
+
+
+# (limit, status) pairs checked in order: the first limit the value is
+# below wins, values past every limit get the default
+VOLTAGE_UNBALANCE_LEVELS = [(1, "NORMAL"), (2, "ACCEPTABLE"), (3, "WARNING")]
+CURRENT_UNBALANCE_LEVELS = [(10, "NORMAL"), (20, "WARNING")]
+POWER_FACTOR_LEVELS = [(0.8, "CRITICAL"), (0.9, "WARNING"), (0.95, "ACCEPTABLE")]
+
+
+def level(value, levels, default):
+    for limit, status in levels:
+        if value < limit:
+            return status
+    return default
+
+
+def level_sql(value, levels, default):
+    """level as a SQL expression, NO_DATA when value is NULL"""
+    return case(
+        (value.is_(None), "NO_DATA"),
+        *((value < limit, status) for limit, status in levels),
+        else_=default,
+    )
+
+
 def voltage_status(unbalance):
-    if unbalance < 1:
-        return "NORMAL"
-    elif unbalance < 2:
-        return "ACCEPTABLE"
-    elif unbalance < 3:
-        return "WARNING"
-    else:
-        return "CRITICAL"
+    return level(unbalance, VOLTAGE_UNBALANCE_LEVELS, "CRITICAL")
 
 
 def current_status(unbalance):
-    if unbalance < 10:
-        return "NORMAL"
-    elif unbalance < 20:
-        return "WARNING"
-    else:
-        return "CRITICAL"
+    return level(unbalance, CURRENT_UNBALANCE_LEVELS, "CRITICAL")
+
+
+def power_factor_status(power_factor):
+    return level(power_factor, POWER_FACTOR_LEVELS, "NORMAL")
@@ -0,0 +1,116 @@
+import random
+import threading
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Optional
+
+from ..settings import settings
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"  # polled every cycle
+    OPEN = "open"  # skipped until next_probe_at
+    HALF_OPEN = "half_open"  # one probe request allowed
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for retry number `attempt` (0-based)"""
+    ceiling = min(
+        settings.FETCH_BACKOFF_MAX_SECONDS,
+        settings.FETCH_BACKOFF_BASE_SECONDS * (2**attempt),
+    )
+    return random.uniform(0, ceiling)
+
+
+class MeterHealth:
+    """Consecutive-failure circuit breaker for one meter"""
+
+    def __init__(self, sn: str):
+        self.sn = sn
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.failed_probes = 0
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[datetime] = None
+        self.last_failure_at: Optional[datetime] = None
+        self.opened_at: Optional[datetime] = None
+        self.next_probe_at: Optional[datetime] = None
+
+    def allow_request(self) -> bool:
+        if self.state == BreakerState.OPEN:
+            if datetime.now() < self.next_probe_at:
+                return False
+            self.state = BreakerState.HALF_OPEN
+        return True
+
+    def record_success(self):
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.failed_probes = 0
+        self.last_success_at = datetime.now()
+        self.opened_at = None
+        self.next_probe_at = None
+
+    def record_failure(self, error: str):
+        now = datetime.now()
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        self.last_error = error
+        self.last_failure_at = now
+
+        if self.state == BreakerState.HALF_OPEN:
+            # Probe failed, wait twice as long before the next one
+            self.failed_probes += 1
+            self._open(now)
+        elif self.consecutive_failures >= settings.BREAKER_FAILURE_THRESHOLD:
+            self._open(now)
+
+    def _open(self, now: datetime):
+        cooldown = min(
+            settings.BREAKER_MAX_RESET_SECONDS,
+            settings.BREAKER_RESET_SECONDS * (2**self.failed_probes),
+        )
+        self.opened_at = self.opened_at or now
+        self.state = BreakerState.OPEN
+        self.next_probe_at = now + timedelta(seconds=cooldown)
+        print(f"Circuit open for meter {self.sn} until {self.next_probe_at}")
+
+    def as_dict(self) -> dict:
+        def iso(value):
+            return value.isoformat() if value else None
+
+        return {
+            "sn": self.sn,
+            "state": self.state.value,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "last_error": self.last_error,
+            "last_success_at": iso(self.last_success_at),
+            "last_failure_at": iso(self.last_failure_at),
+            "opened_at": iso(self.opened_at),
+            "next_probe_at": iso(self.next_probe_at),
+        }
+
+
+class MeterHealthRegistry:
+    def __init__(self):
+        self._meters: dict[str, MeterHealth] = {}
+        self._lock = threading.Lock()
+
+    def get(self, sn: str) -> MeterHealth:
+        with self._lock:
+            if sn not in self._meters:
+                self._meters[sn] = MeterHealth(sn)
+            return self._meters[sn]
+
+    def all(self) -> list[MeterHealth]:
+        with self._lock:
+            return list(self._meters.values())
+
+    def reset(self, sn: str) -> bool:
+        with self._lock:
+            return self._meters.pop(sn, None) is not None
+
+
+health = MeterHealthRegistry()
@@ -0,0 +1,181 @@
+import importlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from typing import Optional
+from urllib.parse import urlencode
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+
+from ..settings import settings
+from .snapshot import snapshot
+
+# Request header that skips the lookup, the fresh response is still stored
+BYPASS_HEADER = "X-Cache-Bypass"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: dict[str, str]
+    body: bytes
+
+
+class MemoryBackend:
+    """LRU of cached responses in this worker, entries expire after their TTL.
+
+    Backends for sharing across workers implement the same async get, set
+    and clear, see RESPONSE_CACHE_BACKEND.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: CachedResponse, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def make_backend():
+    """MemoryBackend, or the factory named "package.module:callable" in
+    RESPONSE_CACHE_BACKEND"""
+    if settings.RESPONSE_CACHE_BACKEND == "memory":
+        return MemoryBackend(settings.RESPONSE_CACHE_MAX_ENTRIES)
+    module, _, name = settings.RESPONSE_CACHE_BACKEND.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+class ResponseCache:
+    """Route-level cache of GET responses, keyed on path and query.
+
+    Every cached response belongs to an ingestion generation, taken from
+    the latest snapshot: new readings, rollups, bills or meters clear the
+    cache of every worker. Without the snapshot only the TTL applies.
+    Writes made through the API also clear the cache of the worker that
+    served them right away.
+    """
+
+    def __init__(self):
+        self.backend = make_backend()
+        self.generation = snapshot.generation
+        self.routes: dict[str, dict[str, int]] = {}
+
+    def route_stats(self, route: str) -> dict[str, int]:
+        return self.routes.setdefault(route, {"hits": 0, "misses": 0, "bypasses": 0})
+
+    async def sync_generation(self):
+        if snapshot.generation != self.generation:
+            self.generation = snapshot.generation
+            await self.backend.clear()
+
+    async def clear(self):
+        await self.backend.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.RESPONSE_CACHE_ENABLED,
+            "generation": self.generation,
+            "entries": len(self.backend) if hasattr(self.backend, "__len__") else None,
+            "evictions": getattr(self.backend, "evictions", None),
+            "routes": self.routes,
+        }
+
+
+response_cache = ResponseCache()
+
+
+def _route_path(request: Request) -> Optional[str]:
+    """Path template of the route a request goes to, e.g. /billing/{year}/{month}"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", None)
+    return None
+
+
+def _prefix(path: str) -> str:
+    """First path segment, e.g. /meter of /meter/edit/locations"""
+    return "/" + path.split("/")[1]
+
+
+def _cache_key(request: Request) -> str:
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}"
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        cache = response_cache
+        if request.method not in SAFE_METHODS:
+            response = await call_next(request)
+            cached_prefixes = {_prefix(p) for p in settings.RESPONSE_CACHE_ROUTES}
+            if response.status_code < 400 and _prefix(request.url.path) in cached_prefixes:
+                await cache.clear()
+            return response
+
+        route = _route_path(request) if request.method == "GET" else None
+        if route is None or not any(
+            fnmatch(route, pattern) for pattern in settings.RESPONSE_CACHE_ROUTES
+        ):
+            return await call_next(request)
+
+        stats = cache.route_stats(route)
+        await cache.sync_generation()
+        generation = cache.generation
+        key = _cache_key(request)
+        bypass = BYPASS_HEADER.lower() in request.headers
+        if not bypass:
+            cached = await cache.backend.get(key)
+            if cached is not None:
+                stats["hits"] += 1
+                return Response(
+                    cached.body,
+                    status_code=cached.status_code,
+                    headers={**cached.headers, "X-Cache": "HIT"},
+                )
+        stats["bypasses" if bypass else "misses"] += 1
+
+        response = await call_next(request)
+        if response.status_code != 200 or "set-cookie" in response.headers:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = dict(response.headers)
+        # Computed against data that changed meanwhile, do not keep it
+        if snapshot.generation == generation:
+            await cache.backend.set(
+                key,
+                CachedResponse(response.status_code, headers, body),
+                settings.RESPONSE_CACHE_TTL_SECONDS,
+            )
+        return Response(
+            body,
+            status_code=response.status_code,
+            headers={**headers, "X-Cache": "BYPASS" if bypass else "MISS"},
+        )
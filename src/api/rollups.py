@@ -0,0 +1,216 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    and_,
+    column,
+    delete,
+    func,
+    literal_column,
+    select,
+    tuple_,
+    values,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import (
+    READING_COLUMNS,
+    ROLLUP_COUNTER_COLUMNS,
+    ReadingDB,
+    ReadingDailyDB,
+    ReadingHourlyDB,
+    RollupDirtyDB,
+)
+from .snapshot import notify_rollups_changed
+
+# Dirty hours claimed per refresh transaction
+REFRESH_BATCH = 2000
+
+QUARTER_HOUR = timedelta(minutes=15)
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def mark_dirty(db: Session, rows: list[dict]):
+    """Queue the hours touched by freshly written readings for a refresh"""
+    keys = {(row["meter_id"], hour_bucket(row["timestamp"])) for row in rows}
+    if not keys:
+        return
+    db.connection().execute(
+        insert(RollupDirtyDB).on_conflict_do_nothing(),
+        [{"meter_id": meter_id, "bucket": bucket} for meter_id, bucket in keys],
+    )
+
+
+def rollup_avg(model, name: str):
+    """Sample weighted average of a value column over the selected buckets"""
+    total = func.sum(getattr(model, f"{name}_avg") * getattr(model, f"{name}_count"))
+    return total / func.nullif(func.sum(getattr(model, f"{name}_count")), 0)
+
+
+def rollup_sum(model, name: str):
+    """Sum of the raw samples of a value column within one bucket row"""
+    return getattr(model, f"{name}_avg") * getattr(model, f"{name}_count")
+
+
+def bucket_start(value, step: timedelta):
+    """Start of the step sized bucket holding value, aligned to midnight"""
+    return func.date_bin(
+        literal_column(f"interval '{int(step.total_seconds())} seconds'"),
+        value,
+        literal_column("TIMESTAMP '2000-01-01'"),
+    )
+
+
+def _first(value, order_by):
+    """First non-null value in the given order"""
+    return array_agg(aggregate_order_by(value, order_by)).filter(value.isnot(None))[1]
+
+
+def _from_readings(step: timedelta) -> dict:
+    """Rollup columns aggregated straight from raw readings"""
+    ts = ReadingDB.timestamp
+    columns = {
+        "meter_id": ReadingDB.meter_id,
+        "bucket": bucket_start(ts, step),
+        "sample_count": func.count(),
+        "first_timestamp": func.min(ts),
+        "last_timestamp": func.max(ts),
+    }
+    for name in READING_COLUMNS:
+        value = getattr(ReadingDB, name)
+        columns[f"{name}_min"] = func.min(value)
+        columns[f"{name}_max"] = func.max(value)
+        columns[f"{name}_avg"] = func.avg(value)
+        columns[f"{name}_count"] = func.count(value)
+    for name in ROLLUP_COUNTER_COLUMNS:
+        value = getattr(ReadingDB, name)
+        columns[f"{name}_first"] = _first(value, ts.asc())
+        columns[f"{name}_last"] = _first(value, ts.desc())
+    return columns
+
+
+def _from_rollup(source, step: timedelta) -> dict:
+    """Rollup columns combined from a finer rollup"""
+    columns = {
+        "meter_id": source.meter_id,
+        "bucket": bucket_start(source.bucket, step),
+        "sample_count": func.sum(source.sample_count),
+        "first_timestamp": func.min(source.first_timestamp),
+        "last_timestamp": func.max(source.last_timestamp),
+    }
+    for name in READING_COLUMNS:
+        columns[f"{name}_min"] = func.min(getattr(source, f"{name}_min"))
+        columns[f"{name}_max"] = func.max(getattr(source, f"{name}_max"))
+        columns[f"{name}_avg"] = rollup_avg(source, name)
+        columns[f"{name}_count"] = func.sum(getattr(source, f"{name}_count"))
+    for name in ROLLUP_COUNTER_COLUMNS:
+        bucket = source.bucket
+        columns[f"{name}_first"] = _first(getattr(source, f"{name}_first"), bucket.asc())
+        columns[f"{name}_last"] = _first(getattr(source, f"{name}_last"), bucket.desc())
+    return columns
+
+
+def _rebuild(
+    db: Session, model, source, step: timedelta, keys: set[tuple[int, datetime]]
+):
+    """Recompute the given (meter_id, bucket) rows of one rollup"""
+    dirty = values(
+        column("meter_id", Integer), column("bucket", DateTime), name="dirty"
+    ).data(sorted(keys))
+
+    if source is ReadingDB:
+        columns = _from_readings(step)
+        ts = ReadingDB.timestamp
+        meter_id = ReadingDB.meter_id
+    else:
+        columns = _from_rollup(source, step)
+        ts = source.bucket
+        meter_id = source.meter_id
+
+    since = min(bucket for _, bucket in keys)
+    until = max(bucket for _, bucket in keys) + step
+    query = (
+        select(*columns.values())
+        .join(
+            dirty,
+            and_(
+                meter_id == dirty.c.meter_id,
+                ts >= dirty.c.bucket,
+                ts < dirty.c.bucket + step,
+            ),
+        )
+        # Constant bounds so raw reads are pruned to the touched partitions
+        .where(ts >= since, ts < until)
+        .group_by(meter_id, columns["bucket"])
+    )
+
+    db.execute(delete(model).where(tuple_(model.meter_id, model.bucket).in_(keys)))
+    db.execute(insert(model).from_select(list(columns), query))
+
+
+def refresh_rollups(db: Session, limit: int = REFRESH_BATCH) -> int:
+    """Refresh the rollups of up to limit dirty hours, returns how many"""
+    claimed = (
+        select(RollupDirtyDB.meter_id, RollupDirtyDB.bucket)
+        .order_by(RollupDirtyDB.bucket)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    hours = {
+        (row.meter_id, row.bucket)
+        for row in db.execute(
+            delete(RollupDirtyDB)
+            .where(tuple_(RollupDirtyDB.meter_id, RollupDirtyDB.bucket).in_(claimed))
+            .returning(RollupDirtyDB.meter_id, RollupDirtyDB.bucket)
+        )
+    }
+    if not hours:
+        return 0
+
+    days = {(meter_id, bucket.replace(hour=0)) for meter_id, bucket in hours}
+    _rebuild(db, ReadingHourlyDB, ReadingDB, HOUR, hours)
+    _rebuild(db, ReadingDailyDB, ReadingHourlyDB, DAY, days)
+    notify_rollups_changed(db)
+    return len(hours)
+
+
+def compact_range(db: Session, model, step: timedelta, start: datetime, end: datetime) -> int:
+    """Rebuild every bucket of a rollup in [start, end) from raw readings.
+
+    Only safe while the raw readings of the whole range are still present.
+    """
+    columns = _from_readings(step)
+    query = (
+        select(*columns.values())
+        .where(ReadingDB.timestamp >= start, ReadingDB.timestamp < end)
+        .group_by(ReadingDB.meter_id, columns["bucket"])
+    )
+    db.execute(delete(model).where(model.bucket >= start, model.bucket < end))
+    return db.execute(insert(model).from_select(list(columns), query)).rowcount
+
+
+def refresh_all_rollups(max_batches: int = 50) -> int:
+    """Work through the dirty hours one committed batch at a time"""
+    refreshed = 0
+    for _ in range(max_batches):
+        db: Session = SessionLocal()
+        try:
+            count = refresh_rollups(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        refreshed += count
+        if count < REFRESH_BATCH:
+            break
+    return refreshed
@@ -0,0 +1,75 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..settings import settings
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time in this worker.
+
+    Requests that arrive while a call for the same key is running wait for
+    it and get its result (or its exception) instead of repeating the work.
+    Results are shared, callers must not modify them.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._running: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._running.get(key)
+            owner = call is None
+            if owner:
+                call = self._running[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._running[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "running": len(self._running)}
+
+
+flights = SingleFlight()
+
+
+def advisory_xact_lock(db: Session, name: str):
+    """Wait for the transaction-level advisory lock called name.
+
+    Serialises work on the same thing across workers, the lock is released
+    when db commits or rolls back. A no-op unless SINGLE_FLIGHT_ADVISORY_LOCKS.
+    """
+    if settings.SINGLE_FLIGHT_ADVISORY_LOCKS:
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(hashtextextended(:name, 0))"), {"name": name}
+        )
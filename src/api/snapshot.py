@@ -0,0 +1,288 @@
+import asyncio
+import threading
+from typing import Optional
+from uuid import uuid4
+
+from sqlalchemy import desc, event, select, text, true
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal, db_engine
+from ..models import MeterDB, ReadingDB
+from ..settings import settings
+
+# Newest readings kept per meter, enough for prev_curr_power
+DEPTH = 2
+
+# NOTIFY channel, fired inside every transaction that writes readings or
+# changes meters, rollups or bills. The payload is the writer's
+# PROCESS_TOKEN, "meters", ROLLUPS or BILLS
+CHANNEL = "kusm_latest"
+ROLLUPS = "rollups"
+BILLS = "bills"
+# Data the snapshot does not hold, these only move generation on
+BUMP_ONLY = {ROLLUPS, BILLS}
+
+# Tells this process's own notifications apart, pids repeat across hosts
+PROCESS_TOKEN = uuid4().hex
+
+RECONNECT_SECONDS = 5
+
+# Session.info key of rows to publish once the session commits
+_PENDING = "snapshot_rows"
+
+COLUMNS = [c.name for c in ReadingDB.__table__.columns if c.name != "id"]
+
+
+class LatestSnapshot:
+    """The newest DEPTH readings of every meter, held in memory.
+
+    The process that writes readings publishes them here right after
+    commit. Every worker LISTENs on CHANNEL and reloads the snapshot with
+    one query when another process wrote. Until the first load, and while
+    the listener is disconnected, the snapshot is not ready and readers
+    fall back to the database.
+    """
+
+    def __init__(self):
+        self.ready = False
+        # Bumped on every change, lets caches tell when readings moved on
+        self.generation = 0
+        self.loads = 0
+        self.hits = 0
+        self.misses = 0
+        self._meters: dict[int, str] = {}
+        self._readings: dict[int, list[dict]] = {}
+        self._published_during_load: Optional[list[dict]] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # Other in-memory caches kept fresh by this listener, they get the
+        # same publish, refresh(db) and invalidate calls
+        self.followers: list = []
+
+    def load(self, db: Session):
+        """Replace the snapshot with the newest readings from the database"""
+        with self._lock:
+            # Rows published while the query runs may be missing from its result
+            self._published_during_load = []
+        recent = (
+            select(ReadingDB)
+            .where(ReadingDB.meter_id == MeterDB.meter_id)
+            .order_by(desc(ReadingDB.timestamp))
+            .limit(DEPTH)
+            .lateral("recent")
+        )
+        rows = db.execute(
+            select(MeterDB.meter_id, MeterDB.name, recent)
+            .outerjoin(recent, true())
+            .order_by(MeterDB.meter_id, desc(recent.c.timestamp))
+        ).mappings()
+
+        meters, readings = {}, {}
+        for row in rows:
+            meters[row["meter_id"]] = row["name"]
+            meter_readings = readings.setdefault(row["meter_id"], [])
+            if row["timestamp"] is not None:
+                meter_readings.append({c: row[c] for c in COLUMNS})
+
+        with self._lock:
+            self._meters, self._readings = meters, readings
+            self.ready = True
+            self._merge(self._published_during_load)
+            self._published_during_load = None
+            self.loads += 1
+
+    def publish(self, rows: list[dict]):
+        """Merge freshly committed reading dicts into the snapshot"""
+        with self._lock:
+            if self._published_during_load is not None:
+                self._published_during_load.extend(rows)
+            self._merge(rows)
+        for follower in self.followers:
+            follower.publish(rows)
+
+    def _merge(self, rows: list[dict]):
+        by_meter: dict[int, list[dict]] = {}
+        for row in rows:
+            by_meter.setdefault(row["meter_id"], []).append(row)
+
+        for meter_id, new in by_meter.items():
+            if meter_id not in self._meters:
+                # A meter this snapshot has never seen, reload to learn it
+                self.ready = False
+                continue
+            merged = {r["timestamp"]: r for r in self._readings.get(meter_id, [])}
+            for row in new:
+                merged.setdefault(row["timestamp"], {c: row.get(c) for c in COLUMNS})
+            newest = sorted(merged, reverse=True)[:DEPTH]
+            self._readings[meter_id] = [merged[ts] for ts in newest]
+        self.generation += 1
+
+    def bump(self):
+        """Data the snapshot does not hold changed, only move generation on"""
+        with self._lock:
+            self.generation += 1
+
+    def invalidate(self):
+        with self._lock:
+            self.ready = False
+            self.generation += 1
+        for follower in self.followers:
+            follower.invalidate()
+
+    def latest(self, meter_id: int, n: int = 1, present: Optional[str] = None):
+        """Newest n readings of a meter (newest first) with column present
+        not null, exactly as the database would return them.
+
+        None when the snapshot cannot tell, the caller then asks the database.
+        """
+        if not self.ready or n > DEPTH or meter_id not in self._meters:
+            self.misses += 1
+            return None
+        readings = self._readings.get(meter_id, [])
+        if present is not None and any(r[present] is None for r in readings[:n]):
+            # An older reading may have it, only the database knows
+            self.misses += 1
+            return None
+        self.hits += 1
+        return readings[:n]
+
+    def latest_all(self, n: int = 1, present: Optional[str] = None):
+        """[(meter_id, name, readings)] for every meter, None unless the
+        snapshot can answer for all of them"""
+        meters = self._meters
+        result = []
+        for meter_id, name in sorted(meters.items()):
+            readings = self.latest(meter_id, n, present)
+            if readings is None:
+                return None
+            result.append((meter_id, name, readings))
+        return result if self.ready else None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "generation": self.generation,
+            "meters": len(self._meters),
+            "loads": self.loads,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def start(self):
+        if settings.SNAPSHOT_ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.invalidate()
+
+    def _reload(self):
+        db = SessionLocal()
+        try:
+            self.load(db)
+            for follower in self.followers:
+                follower.refresh(db)
+        finally:
+            db.close()
+
+    async def _handle(self, payloads: set[str]):
+        # Our own writes were already published after commit,
+        # unless that found a meter the snapshot did not know
+        if payloads - {PROCESS_TOKEN} - BUMP_ONLY or not self.ready:
+            await asyncio.to_thread(self._reload)
+        elif payloads & BUMP_ONLY:
+            self.bump()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            conn = None
+            try:
+                conn = db_engine.raw_connection()
+                listener = conn.dbapi_connection
+                # LISTEN belongs to the session, never hand it back to the pool
+                conn.detach()
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+
+                woken = asyncio.Event()
+                loop.add_reader(listener.fileno(), woken.set)
+                try:
+                    # Listen first, so no write between load and LISTEN is missed
+                    await asyncio.to_thread(self._reload)
+                    while True:
+                        await woken.wait()
+                        woken.clear()
+                        listener.poll()
+                        payloads = {n.payload for n in listener.notifies}
+                        listener.notifies.clear()
+                        await self._handle(payloads)
+                finally:
+                    loop.remove_reader(listener.fileno())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Latest snapshot listener failed, using the database: {e}")
+                self.invalidate()
+                await asyncio.sleep(RECONNECT_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+snapshot = LatestSnapshot()
+
+
+def notify_written(db: Session, rows: list[dict]):
+    """Tell every worker about readings written in db's transaction.
+
+    The NOTIFY is only delivered, and the rows only published locally,
+    if the transaction commits.
+    """
+    db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": PROCESS_TOKEN},
+    )
+    db.info.setdefault(_PENDING, []).extend(rows)
+
+
+def notify_meters_changed(db: Session):
+    """Make every worker, this one included, reload after db commits"""
+    db.execute(
+        text("SELECT pg_notify(:channel, 'meters')"), {"channel": CHANNEL}
+    )
+
+
+def notify_rollups_changed(db: Session):
+    """Move every worker's generation on after db commits"""
+    db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": ROLLUPS},
+    )
+
+
+def notify_bills_changed(db: Session):
+    """Move every worker's generation on after db commits"""
+    db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANNEL, "payload": BILLS},
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session):
+    rows = session.info.pop(_PENDING, None)
+    if rows:
+        snapshot.publish(rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session):
+    session.info.pop(_PENDING, None)
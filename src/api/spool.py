@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from ..database import SessionLocal
+from ..settings import settings
+from .writer import ReadingBatchWriter
+
+
+class ReadingSpool:
+    """Append-only local log of fetched readings, replayed into Postgres.
+
+    The collector appends every cycle to `active.jsonl` (fsynced) before
+    touching the database. A drain rotates the active file into a numbered
+    segment and writes segments in batches, deleting each one only after
+    all of its batches are committed. A segment whose drain fails is left
+    in place and the drain moves on to the next one; replaying it later is
+    harmless because the writer skips rows that already exist. Segments
+    that fail max_attempts times, or with an error retrying cannot fix
+    (bad rows, an unreadable file), are moved to `failed/`.
+    """
+
+    # Retrying these gives the same error
+    PERMANENT_ERRORS = (IntegrityError, DataError, ValueError, KeyError)
+
+    def __init__(self, directory: str, batch_rows: int = 5000, max_attempts: int = 5):
+        self.directory = Path(directory)
+        self.active = self.directory / "active.jsonl"
+        self.failed = self.directory / "failed"
+        self.batch_rows = batch_rows
+        self.max_attempts = max_attempts
+        self._attempts: dict[str, int] = {}
+        self._append_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self.last_drain_at: Optional[datetime] = None
+        self.last_drain_rows = 0
+        self.last_error: Optional[str] = None
+        self.quarantined = 0
+
+    def append(self, rows: list[dict]):
+        if not rows:
+            return
+        lines = "".join(
+            json.dumps({**row, "timestamp": row["timestamp"].isoformat()}) + "\n"
+            for row in rows
+        )
+        with self._append_lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.active, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def segments(self) -> list[Path]:
+        return sorted(self.directory.glob("segment-*.jsonl"))
+
+    def _rotate(self):
+        with self._append_lock:
+            if self.active.exists() and self.active.stat().st_size > 0:
+                self.active.rename(self.directory / f"segment-{time.time_ns()}.jsonl")
+
+    def _read_batches(self, segment: Path):
+        batch = []
+        with open(segment, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+                batch.append(row)
+                if len(batch) >= self.batch_rows:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def drain(self) -> int:
+        """Replay spooled readings into the database; returns rows written"""
+        # Only one drainer at a time, a concurrent call just returns
+        if not self._drain_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._rotate()
+            written = 0
+            error = None
+            for segment in self.segments():
+                db = SessionLocal()
+                try:
+                    for batch in self._read_batches(segment):
+                        writer = ReadingBatchWriter()
+                        writer.extend(batch)
+                        writer.flush(db)
+                        db.commit()
+                        written += len(batch)
+                except Exception as e:
+                    db.rollback()
+                    error = f"{segment.name}: {e}"
+                    self._failed(segment, e)
+                    continue
+                finally:
+                    db.close()
+                segment.unlink()
+                self._attempts.pop(segment.name, None)
+
+            self.last_error = error
+            self.last_drain_at = datetime.now()
+            self.last_drain_rows = written
+            return written
+        finally:
+            self._drain_lock.release()
+
+    def _failed(self, segment: Path, error: Exception):
+        """Count a failed drain of segment, move it to failed/ when it is
+        not worth retrying"""
+        attempts = self._attempts.get(segment.name, 0) + 1
+        if attempts < self.max_attempts and not isinstance(error, self.PERMANENT_ERRORS):
+            self._attempts[segment.name] = attempts
+            print(f"Spool drain of {segment.name} failed (attempt {attempts}):", error)
+            return
+        self._attempts.pop(segment.name, None)
+        self.failed.mkdir(parents=True, exist_ok=True)
+        segment.rename(self.failed / segment.name)
+        self.quarantined += 1
+        print(f"Spool segment {segment.name} moved to {self.failed} after {attempts} attempts:", error)
+
+    def stats(self) -> dict:
+        files = self.segments() + ([self.active] if self.active.exists() else [])
+        return {
+            "pending_segments": len(self.segments()),
+            "pending_bytes": sum(f.stat().st_size for f in files),
+            "failed_segments": len(list(self.failed.glob("segment-*.jsonl"))),
+            "quarantined": self.quarantined,
+            "last_drain_at": self.last_drain_at.isoformat() if self.last_drain_at else None,
+            "last_drain_rows": self.last_drain_rows,
+            "last_error": self.last_error,
+        }
+
+
+spool = ReadingSpool(settings.SPOOL_DIR, max_attempts=settings.SPOOL_MAX_ATTEMPTS)
@@ -0,0 +1,174 @@
+import csv
+import io
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from ..models import ReadingDB, READING_COLUMNS
+from ..retention import raw_horizon
+from .rollups import mark_dirty
+from .snapshot import notify_written
+from ..settings import settings
+
+
+# COPY has a fixed setup cost, below this many rows a multi-row INSERT wins
+COPY_MIN_ROWS = 500
+
+COLUMNS = ["meter_id", "timestamp", *READING_COLUMNS]
+CONFLICT_KEY = ["meter_id", "timestamp"]
+
+# Rows per multi-row INSERT; matches SQLAlchemy's insertmanyvalues page size,
+# so every chunk is one statement and its rowcount is exact
+INSERT_CHUNK_ROWS = 1000
+
+
+@dataclass
+class WriteStats:
+    method: str
+    rows: int
+    inserted: int
+    seconds: float
+    too_old: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.rows / self.seconds, 1) if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "duplicates": self.rows - self.too_old - self.inserted,
+            "too_old": self.too_old,
+            "seconds": round(self.seconds, 4),
+            "rows_per_second": self.rows_per_second,
+        }
+
+
+# Stats of the most recent flush, exposed via /data-collection/status
+last_write_stats: Optional[WriteStats] = None
+
+
+class ReadingBatchWriter:
+    """Collects plain reading dicts and writes them in one statement.
+
+    Rows are dicts keyed by ReadingDB column name; missing phase columns are
+    written as NULL. No ORM objects are built, so a polling cycle or a
+    backfill chunk costs one round trip instead of one INSERT per row.
+    Samples already stored for the same (meter_id, timestamp) are skipped,
+    which makes re-polling an unchanged meter or replaying a batch harmless.
+    """
+
+    def __init__(self, method: Optional[str] = None):
+        self.method = method or settings.INGEST_WRITE_METHOD
+        self.rows: list[dict] = []
+
+    def add(self, row: dict):
+        self.rows.append(row)
+
+    def extend(self, rows):
+        self.rows.extend(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _pick_method(self, db: Session) -> str:
+        if self.method != "auto":
+            return self.method
+        if db.get_bind().dialect.driver == "psycopg2" and len(self.rows) >= COPY_MIN_ROWS:
+            return "copy"
+        return "insert"
+
+    def flush(self, db: Session) -> Optional[WriteStats]:
+        """Write the buffered rows inside db's transaction; the caller commits"""
+        global last_write_stats
+
+        if not self.rows:
+            return None
+
+        rows = len(self.rows)
+        too_old = self._reject_too_old()
+        method = self._pick_method(db)
+        started = time.perf_counter()
+        if not self.rows:
+            inserted = 0
+        elif method == "copy":
+            inserted = self._copy(db)
+        else:
+            inserted = self._insert(db)
+        if inserted:
+            mark_dirty(db, self.rows)
+            notify_written(db, self.rows)
+
+        stats = WriteStats(
+            method, rows, inserted, time.perf_counter() - started, too_old
+        )
+        last_write_stats = stats
+        self.rows = []
+        return stats
+
+    def _reject_too_old(self) -> int:
+        """Drop rows of months retention has compacted and dropped.
+
+        They would land in the default partition, and compacting them
+        again would replace the month's 15 minute rollup with just them.
+        """
+        horizon = raw_horizon()
+        if horizon is None:
+            return 0
+        kept = [row for row in self.rows if row["timestamp"] >= horizon]
+        too_old = len(self.rows) - len(kept)
+        if too_old:
+            print(f"Rejected {too_old} readings from before the retention horizon {horizon:%Y-%m}")
+        self.rows = kept
+        return too_old
+
+    def _insert(self, db: Session) -> int:
+        # executemany of a Core insert is batched into multi-row VALUES
+        rows = [{c: row.get(c) for c in COLUMNS} for row in self.rows]
+        statement = insert(ReadingDB).on_conflict_do_nothing(index_elements=CONFLICT_KEY)
+        connection = db.connection()
+
+        inserted = 0
+        for i in range(0, len(rows), INSERT_CHUNK_ROWS):
+            chunk = rows[i : i + INSERT_CHUNK_ROWS]
+            inserted += connection.execute(statement, chunk).rowcount
+        return inserted
+
+    def _copy(self, db: Session) -> int:
+        # COPY cannot skip conflicts, so stage the batch and upsert from there
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in self.rows:
+            writer.writerow([row.get(c) for c in COLUMNS])
+        buffer.seek(0)
+
+        table = ReadingDB.__tablename__
+        columns = ", ".join(f'"{c}"' for c in COLUMNS)
+        db.execute(
+            text(
+                f"CREATE TEMP TABLE IF NOT EXISTS {table}_stage "
+                f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+        )
+        cursor = db.connection().connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table}_stage ({columns}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        finally:
+            cursor.close()
+
+        result = db.execute(
+            text(
+                f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_stage "
+                f"ON CONFLICT ({', '.join(CONFLICT_KEY)}) DO NOTHING"
+            )
+        )
+        db.execute(text(f"TRUNCATE {table}_stage"))
+        return result.rowcount
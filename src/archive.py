@@ -0,0 +1,174 @@
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models import READING_COLUMNS, ROLLUP_COUNTER_COLUMNS, MeterDB, ReadingDB
+from .partitions import add_months, is_partitioned, list_partitions, month_start, partition_month
+from .settings import settings
+from .utils.floats import float32_to_python
+
+# Written last, a month directory without it is an interrupted export
+DONE_MARKER = "_SUCCESS"
+
+# float32 is plenty for instantaneous values, but kWh counters in the
+# hundreds of thousands would lose their fraction, as in hot_tier._dtype
+ARCHIVE_SCHEMA = pa.schema(
+    [("timestamp", pa.timestamp("s"))]
+    + [
+        (name, pa.float64() if name in ROLLUP_COUNTER_COLUMNS else pa.float32())
+        for name in READING_COLUMNS
+    ]
+)
+
+
+def month_dir(month: datetime) -> Path:
+    return Path(settings.ARCHIVE_DIR) / f"{month:%Y-%m}"
+
+
+def archive_path(meter_id: int, month: datetime) -> Path:
+    """One Parquet file per meter-month"""
+    return month_dir(month) / f"meter_{meter_id}.parquet"
+
+
+def is_archived(month: datetime) -> bool:
+    return (month_dir(month) / DONE_MARKER).exists()
+
+
+def archived_span() -> Optional[tuple[datetime, datetime]]:
+    """[start, end) of the newest unbroken run of fully archived months.
+
+    end is the freshness watermark: the archive holds every reading
+    before it (as of the export), nothing after it.
+    """
+    root = Path(settings.ARCHIVE_DIR)
+    if not root.is_dir():
+        return None
+    months = sorted(
+        datetime.strptime(d.name, "%Y-%m")
+        for d in root.iterdir()
+        if d.is_dir() and (d / DONE_MARKER).exists()
+    )
+    if not months:
+        return None
+    start = months[-1]
+    while add_months(start, -1) in months:
+        start = add_months(start, -1)
+    return start, add_months(months[-1], 1)
+
+
+def month_files(month: datetime, meter_ids: Optional[list[int]] = None) -> list[Path]:
+    if meter_ids is None:
+        return sorted(month_dir(month).glob("meter_*.parquet"))
+    paths = (archive_path(meter_id, month) for meter_id in meter_ids)
+    return [path for path in paths if path.exists()]
+
+
+def hot_window_start(db: Session) -> Optional[datetime]:
+    """Start of the oldest readings partition still in Postgres.
+
+    Anything earlier was dropped by retention and only lives in the
+    archive. None when readings are not partitioned, i.e. all hot.
+    """
+    if not is_partitioned(db.connection(), "readings"):
+        return None
+    months = [
+        partition_month("readings", name)
+        for name in list_partitions(db.connection(), "readings")
+    ]
+    months = [m for m in months if m is not None]
+    return min(months) if months else None
+
+
+def export_month(db: Session, month: datetime) -> dict[int, int]:
+    """Write the readings of one month to Parquet, returns rows per meter.
+
+    Files are written to a temporary name and renamed, so readers never
+    see a partial file and a rerun simply overwrites.
+    """
+    start, end = month, add_months(month, 1)
+    directory = month_dir(month)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / DONE_MARKER).unlink(missing_ok=True)
+
+    written = {}
+    for meter_id in db.execute(select(MeterDB.meter_id)).scalars():
+        rows = db.execute(
+            select(ReadingDB.timestamp, *(getattr(ReadingDB, c) for c in READING_COLUMNS))
+            .where(
+                ReadingDB.meter_id == meter_id,
+                ReadingDB.timestamp >= start,
+                ReadingDB.timestamp < end,
+            )
+            .order_by(ReadingDB.timestamp)
+        ).all()
+        path = archive_path(meter_id, month)
+        if not rows:
+            path.unlink(missing_ok=True)
+            continue
+
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, ARCHIVE_SCHEMA)],
+            schema=ARCHIVE_SCHEMA,
+        )
+        tmp = path.with_suffix(".tmp")
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+        written[meter_id] = len(rows)
+
+    (directory / DONE_MARKER).touch()
+    return written
+
+
+def archive_closed_months(db: Session, now: Optional[datetime] = None) -> list[str]:
+    """Export every month that ended over a day ago and is not archived yet"""
+    now = now or datetime.now()
+    first = hot_window_start(db)
+    if first is None:
+        return []
+
+    archived = []
+    month = first
+    # A day of grace for readings drained late from the spool
+    while add_months(month, 1) + timedelta(days=1) <= now:
+        if not is_archived(month):
+            written = export_month(db, month)
+            archived.append(f"{month:%Y-%m}")
+            print(f"Archived {month:%Y-%m}: {sum(written.values())} readings, {len(written)} meters")
+        month = add_months(month, 1)
+    return archived
+
+
+def iter_archive(meter_id: int, start: datetime, end: datetime) -> Iterator[list[dict]]:
+    """Archived readings of one meter with start <= timestamp <= end, one
+    list per archived month, so at most a month is held in memory"""
+    month = month_start(start)
+    while month <= end:
+        path = archive_path(meter_id, month)
+        month = add_months(month, 1)
+        if not path.exists():
+            continue
+
+        table = pq.read_table(
+            path, filters=[("timestamp", ">=", start), ("timestamp", "<=", end)]
+        )
+        data = {"timestamp": table.column("timestamp").to_pylist()}
+        for name in READING_COLUMNS:
+            data[name] = float32_to_python(table.column(name).to_numpy())
+        rows = []
+        for i in range(table.num_rows):
+            row = {"meter_id": meter_id}
+            row.update((name, values[i]) for name, values in data.items())
+            rows.append(row)
+        yield rows
+
+
+def read_archive(meter_id: int, start: datetime, end: datetime) -> list[dict]:
+    """Archived readings of one meter with start <= timestamp <= end"""
+    return [row for rows in iter_archive(meter_id, start, end) for row in rows]
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from .models import MeterDB
+from .api.snapshot import notify_meters_changed
 
 DEFAULT_METERS = [
         {"name": "Physics Department (Block 6)", "sn": "CD0FF6AB"},
@@ -29,6 +30,7 @@ def init_meter(db: Session, meters: list[dict] | None = None):
             added_meters.append(new_meter)
 
     if added_meters:
+        notify_meters_changed(db)
         db.commit()
         for meter in added_meters:
             db.refresh(meter)
@@ -47,6 +49,7 @@ def add_meter(db: Session, name: str, sn: str):
 
     meter = MeterDB(name=name, sn=sn)
     db.add(meter)
+    notify_meters_changed(db)
     db.commit()
     db.refresh(meter)
     return meter
@@ -58,6 +61,7 @@ def remove_meter(db: Session, sn: str, force: bool = False):
         raise ValueError("Meter with SN {sn} not found")
 
     db.delete(meter)
+    notify_meters_changed(db)
     db.commit()
     return meter
 
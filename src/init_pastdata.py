@@ -1,6 +1,6 @@
 import pandas as pd
 from datetime import datetime
-from .models import EnergyDB
+from .api.writer import ReadingBatchWriter
 from .api.iammeter import get_meter_id_by_name
 from .database import SessionLocal
 from sqlalchemy.orm import Session
@@ -21,28 +21,28 @@ def insert_past_data(
     meter_name: str
 ):
     df = pd.read_csv(csv_path)
-    meter_id = get_meter_id_by_name(meter_name)
+    meter_id = get_meter_id_by_name(db, meter_name)
 
+    writer = ReadingBatchWriter()
     for _, row in df.iterrows():
-        ts = datetime.strptime(row["timestamp"], "%Y-%m-%d %H:%M")
+        writer.add({
+            "meter_id": meter_id,
+            "timestamp": datetime.strptime(row["timestamp"], "%Y-%m-%d %H:%M"),
 
-        energy = EnergyDB(
-            meter_id=meter_id,
-            timestamp=ts,
+            "phase_A_grid_consumption": row["phase_A_grid_consumption"],
+            "phase_A_exported_power": row["phase_A_exported_power"],
 
-            phase_A_grid_consumption=row["phase_A_grid_consumption"],
-            phase_A_exported_power=row["phase_A_exported_power"],
+            "phase_B_grid_consumption": row["phase_B_grid_consumption"],
+            "phase_B_exported_power": row["phase_B_exported_power"],
 
-            phase_B_grid_consumption=row["phase_B_grid_consumption"],
-            phase_B_exported_power=row["phase_B_exported_power"],
-
-            phase_C_grid_consumption=row["phase_C_grid_consumption"],
-            phase_C_exported_power=row["phase_C_exported_power"],
-        )
-
-        db.add(energy)
+            "phase_C_grid_consumption": row["phase_C_grid_consumption"],
+            "phase_C_exported_power": row["phase_C_exported_power"],
+        })
 
+    stats = writer.flush(db)
     db.commit()
+    if stats:
+        print(f"{meter_name}: {stats.rows} rows via {stats.method}, {stats.rows_per_second} rows/s")
  
 for meter in DEFAULT_METERS:
     insert_past_data(meter["path"], meter["name"])
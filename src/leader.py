@@ -0,0 +1,126 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .database import db_engine
+from .settings import settings
+
+# Arbitrary constant shared by every worker, "KUSM" in ASCII
+LEADER_LOCK_KEY = 0x4B55534D
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class LeaderElector:
+    """Elects one worker process as owner of the background work.
+
+    The leader holds a session-level PostgreSQL advisory lock on a dedicated
+    connection. Postgres drops the lock as soon as that session ends, so if
+    the leader process dies another worker acquires it on its next attempt.
+    A failed heartbeat on the lock connection demotes the leader locally.
+    """
+
+    def __init__(self, lock_key: int = LEADER_LOCK_KEY):
+        self.lock_key = lock_key
+        self.is_leader = False
+        self._conn: Optional[Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._on_elected: Optional[Callback] = None
+        self._on_demoted: Optional[Callback] = None
+        self._on_tick: Optional[Callback] = None
+
+    def start(
+        self,
+        on_elected: Callback,
+        on_demoted: Callback,
+        on_tick: Optional[Callback] = None,
+    ):
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self._on_tick = on_tick
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await self._step_down()
+
+    def _try_acquire(self) -> bool:
+        if not settings.LEADER_ELECTION_ENABLED:
+            return True
+        conn = db_engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}
+            ).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def _heartbeat(self):
+        if self._conn is not None:
+            self._conn.execute(text("SELECT 1"))
+
+    def _release(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key}
+            )
+        except Exception as e:
+            print(f"Advisory unlock failed: {e}")
+            # Discard the connection so the session, and with it the lock, ends
+            self._conn.invalidate()
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    async def _step_down(self):
+        self.is_leader = False
+        print(f"Worker {os.getpid()} is no longer the leader")
+        try:
+            await self._on_demoted()
+        finally:
+            await asyncio.to_thread(self._release)
+
+    async def _run(self):
+        while True:
+            try:
+                if self.is_leader:
+                    await asyncio.to_thread(self._heartbeat)
+                elif await asyncio.to_thread(self._try_acquire):
+                    self.is_leader = True
+                    print(f"Worker {os.getpid()} elected leader")
+                    await self._on_elected()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Leader election error: {e}")
+                if self.is_leader:
+                    await self._step_down()
+
+            if self.is_leader and self._on_tick:
+                try:
+                    await self._on_tick()
+                except Exception as e:
+                    print(f"Leader tick error: {e}")
+
+            await asyncio.sleep(settings.LEADER_HEARTBEAT_SECONDS)
+
+
+leader = LeaderElector()
@@ -11,6 +11,7 @@ from sqlalchemy import (
     ForeignKey,
     desc,
     Text,
+    JSON,
     UniqueConstraint,
     Enum as SQLEnum,
 )
@@ -40,6 +41,143 @@ class MeterDB(Base):
     y = Column(Float, nullable=True)  # Map Y coordinate (0-100%)
 
 
+# Read by the latest-reading lookups, which the unique index covers so
+# they run without touching the table
+LATEST_READING_COLUMNS = [
+    f"phase_{phase}_{name}"
+    for name in ("current", "voltage", "active_power")
+    for phase in "ABC"
+]
+
+
+class ReadingDB(Base):
+    """One sample of every phase measurement for a meter"""
+
+    __tablename__ = "readings"
+
+    # The partition key has to be part of every unique constraint
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    meter_id = Column(
+        Integer, ForeignKey("meters.meter_id", ondelete="CASCADE"), nullable=False
+    )
+    timestamp = Column(DateTime, primary_key=True, nullable=False)
+
+    # Nullable because imported history only carries the energy counters
+    phase_A_current = Column(Float, nullable=True)
+    phase_B_current = Column(Float, nullable=True)
+    phase_C_current = Column(Float, nullable=True)
+
+    phase_A_voltage = Column(Float, nullable=True)
+    phase_B_voltage = Column(Float, nullable=True)
+    phase_C_voltage = Column(Float, nullable=True)
+
+    phase_A_active_power = Column(Float, nullable=True)
+    phase_A_power_factor = Column(Float, nullable=True)
+
+    phase_B_active_power = Column(Float, nullable=True)
+    phase_B_power_factor = Column(Float, nullable=True)
+
+    phase_C_active_power = Column(Float, nullable=True)
+    phase_C_power_factor = Column(Float, nullable=True)
+
+    phase_A_grid_consumption = Column(Float, nullable=True)
+    phase_A_exported_power = Column(Float, nullable=True)
+
+    phase_B_grid_consumption = Column(Float, nullable=True)
+    phase_B_exported_power = Column(Float, nullable=True)
+
+    phase_C_grid_consumption = Column(Float, nullable=True)
+    phase_C_exported_power = Column(Float, nullable=True)
+
+    # One sample per meter per timestamp, the unique index also covers the
+    # latest-reading lookups so they run as index-only scans. BRIN serves
+    # time range scans across meters. Partitioned by month, see
+    # src/partitions.py
+    __table_args__ = (
+        Index(
+            "ix_readings_meter_key",
+            "meter_id",
+            "timestamp",
+            unique=True,
+            postgresql_include=LATEST_READING_COLUMNS,
+        ),
+        Index(
+            "ix_readings_timestamp_brin",
+            "timestamp",
+            postgresql_using="brin",
+            postgresql_with={"autosummarize": "on"},
+        ),
+        {"postgresql_partition_by": 'RANGE ("timestamp")'},
+    )
+
+
+# All per-phase value columns of ReadingDB, in table order
+READING_COLUMNS = [
+    c.name for c in ReadingDB.__table__.columns if c.name.startswith("phase_")
+]
+
+# Cumulative energy counters, summarised by their first and last value
+ROLLUP_COUNTER_COLUMNS = [
+    c for c in READING_COLUMNS if c.endswith(("_grid_consumption", "_exported_power"))
+]
+
+
+def _rollup_model(class_name: str, table_name: str, doc: str):
+    """Per meter summary of readings in fixed buckets.
+
+    Every value column of ReadingDB gets <column>_min, _max, _avg and
+    _count (non-null samples, the weight for combining averages), and
+    every energy counter also gets <column>_first and _last.
+    """
+    attrs = {
+        "__tablename__": table_name,
+        "__doc__": doc,
+        "meter_id": Column(
+            Integer, ForeignKey("meters.meter_id", ondelete="CASCADE"), primary_key=True
+        ),
+        "bucket": Column(DateTime, primary_key=True),  # start of the bucket
+        "sample_count": Column(Integer, nullable=False),
+        "first_timestamp": Column(DateTime, nullable=False),
+        "last_timestamp": Column(DateTime, nullable=False),
+        # Buckets are written roughly in time order, so BRIN stays tight
+        "__table_args__": (
+            Index(f"ix_{table_name}_bucket_brin", "bucket", postgresql_using="brin"),
+        ),
+    }
+    for column in READING_COLUMNS:
+        for agg in ("min", "max", "avg"):
+            attrs[f"{column}_{agg}"] = Column(Float, nullable=True)
+        attrs[f"{column}_count"] = Column(Integer, nullable=False, default=0)
+    for column in ROLLUP_COUNTER_COLUMNS:
+        attrs[f"{column}_first"] = Column(Float, nullable=True)
+        attrs[f"{column}_last"] = Column(Float, nullable=True)
+    return type(class_name, (Base,), attrs)
+
+
+ReadingQuarterHourDB = _rollup_model(
+    "ReadingQuarterHourDB",
+    "readings_15min",
+    "15 minute rollup of readings past raw retention, see retention.py",
+)
+ReadingHourlyDB = _rollup_model(
+    "ReadingHourlyDB", "readings_hourly", "Hourly rollup of readings, see api/rollups.py"
+)
+ReadingDailyDB = _rollup_model(
+    "ReadingDailyDB", "readings_daily", "Daily rollup of readings, see api/rollups.py"
+)
+
+
+class RollupDirtyDB(Base):
+    """Hours with new readings whose rollups have not been refreshed yet"""
+
+    __tablename__ = "rollup_dirty"
+
+    meter_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)  # start of the hour
+
+
+# Legacy per-measurement tables, superseded by ReadingDB. Nothing writes to
+# them anymore; they are kept so the readings backfill migration can read them.
 class CurrentDB(Base):
     __tablename__ = "current"
 
@@ -182,6 +320,8 @@ class DataCollectionScheduleDB(Base):
         DateTime(timezone=True), nullable=False
     )  # Full datetime with timezone (Nepal time)
     interval_minutes = Column(Integer, nullable=False)
+    # Optional daily windows with their own interval, see ScheduleWindow
+    windows = Column(JSON, nullable=True)
     is_active = Column(Boolean, nullable=False, default=True)
     created_at = Column(DateTime(timezone=True), default=get_nepal_time, nullable=False)
     updated_at = Column(
@@ -200,6 +340,35 @@ class DataCollectionScheduleDB(Base):
         )
 
 
+class DataCollectionStateDB(Base):
+    """Collector state published by the leader worker, read by every worker"""
+
+    __tablename__ = "data_collection_state"
+
+    id = Column(Integer, primary_key=True)  # single row, always 1
+    is_running = Column(Boolean, nullable=False, default=False)
+    schedule_id = Column(
+        Integer,
+        ForeignKey("data_collection_schedule.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+    last_run = Column(DateTime(timezone=True), nullable=True)
+    next_run = Column(DateTime(timezone=True), nullable=True)
+    skipped_ticks = Column(Integer, nullable=False, default=0)
+    last_cycle = Column(JSON, nullable=True)
+    last_write = Column(JSON, nullable=True)
+    spool = Column(JSON, nullable=True)
+    # Breaker state of every meter the leader polls
+    meter_health = Column(JSON, nullable=True)
+    # Serial numbers of breakers to close, applied by the leader on its next tick
+    health_resets = Column(JSON, nullable=True)
+    # Set by /run-now on a follower, the leader collects once and clears it
+    run_now_requested_at = Column(DateTime(timezone=True), nullable=True)
+    leader_pid = Column(Integer, nullable=True)
+    # Refreshed on every leader heartbeat, a stale value means no live collector
+    updated_at = Column(DateTime(timezone=True), default=get_nepal_time, nullable=False)
+
+
 class UserRole(str, Enum):
     SUPER_ADMIN = "super_admin"
     ADMIN = "admin"
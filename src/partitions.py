@@ -0,0 +1,207 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .database import db_engine
+from .settings import settings
+
+# Tables declared PARTITION BY RANGE ("timestamp") with one partition per month
+PARTITIONED_TABLES = ["readings"]
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_y{month:%Y}m{month:%m}"
+
+
+def partition_month(table: str, name: str) -> Optional[datetime]:
+    """Month of a partition created by partition_name, None for others"""
+    try:
+        return datetime.strptime(name, f"{table}_y%Ym%m")
+    except ValueError:
+        return None
+
+
+def _exists(conn: Connection, name: str) -> bool:
+    found = conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+    return found is not None
+
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    return conn.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(:table))"
+        ),
+        {"table": table},
+    ).scalar()
+
+
+def list_partitions(conn: Connection, table: str) -> dict[str, str]:
+    """Partition name -> bound expression, e.g. FOR VALUES FROM (...) TO (...)"""
+    rows = conn.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+        ),
+        {"table": table},
+    )
+    return {name: bound for name, bound in rows}
+
+
+def _index_valid(conn: Connection, name: str) -> Optional[bool]:
+    """None if the index does not exist"""
+    return conn.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+        {"name": name},
+    ).scalar()
+
+
+def _has_attached_index(conn: Connection, parent_index: str, partition: str) -> bool:
+    return conn.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_inherits i "
+            "JOIN pg_index x ON x.indexrelid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:parent) "
+            "AND x.indrelid = to_regclass(:partition))"
+        ),
+        {"parent": parent_index, "partition": partition},
+    ).scalar()
+
+
+def create_index_concurrently(
+    conn: Connection, table: str, name: str, definition: str, unique: bool = False
+):
+    """Build an index without blocking writes, conn must be in autocommit mode.
+
+    definition is everything after the table name, e.g. 'USING brin (x)'.
+    Postgres cannot build a partitioned index concurrently, so the parent
+    index is created ON ONLY (invalid at first), every partition's index is
+    built concurrently and attached, and the last attach makes it valid.
+    Safe to rerun after an interruption.
+    """
+
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+
+    def build(target: str, index: str):
+        if _index_valid(conn, index) is False:
+            # Left behind by an interrupted concurrent build
+            conn.execute(text(f"DROP INDEX CONCURRENTLY {index}"))
+        conn.execute(
+            text(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {index} ON {target} {definition}")
+        )
+
+    if not is_partitioned(conn, table):
+        build(table, name)
+        return
+
+    conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON ONLY {table} {definition}"))
+    suffix = name.removeprefix(f"ix_{table}_")
+    for partition in list_partitions(conn, table):
+        if _has_attached_index(conn, name, partition):
+            continue
+        index = f"{partition}_{suffix}"
+        build(partition, index)
+        conn.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {index}"))
+
+
+def create_month_partition(conn: Connection, table: str, month: datetime) -> bool:
+    """Create the partition of one month, False if it already exists.
+
+    Rows of that month which landed in the default partition are moved
+    into the new partition, otherwise attaching it would fail.
+    """
+    name = partition_name(table, month)
+    if _exists(conn, name):
+        return False
+
+    bounds = {"start": month, "end": add_months(month, 1)}
+    default = f"{table}_default"
+    stranded = _exists(conn, default) and conn.execute(
+        text(
+            f"SELECT EXISTS (SELECT 1 FROM {default} "
+            f'WHERE "timestamp" >= :start AND "timestamp" < :end)'
+        ),
+        bounds,
+    ).scalar()
+
+    if not stranded:
+        conn.execute(
+            text(
+                f"CREATE TABLE {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+            )
+        )
+        return True
+
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+    conn.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {default} "
+            f'WHERE "timestamp" >= :start AND "timestamp" < :end RETURNING *) '
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        bounds,
+    )
+    conn.execute(
+        text(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+        )
+    )
+    return True
+
+
+def ensure_partitions(
+    conn: Connection,
+    table: str,
+    since: Optional[datetime] = None,
+    months_ahead: Optional[int] = None,
+) -> list[str]:
+    """Create the default partition, every month from since to months_ahead
+    and every month that has rows in the default partition"""
+    if not is_partitioned(conn, table):
+        return []
+    if months_ahead is None:
+        months_ahead = settings.PARTITION_MONTHS_AHEAD
+
+    conn.execute(
+        text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    )
+
+    created = []
+    # Months whose rows only landed in the default partition, e.g. imported history
+    stranded = conn.execute(
+        text(f"""SELECT DISTINCT date_trunc('month', "timestamp") FROM {table}_default""")
+    ).scalars()
+    for month in sorted(stranded):
+        if create_month_partition(conn, table, month):
+            created.append(partition_name(table, month))
+
+    month = month_start(since or datetime.now())
+    last = add_months(month_start(datetime.now()), months_ahead)
+    while month <= last:
+        if create_month_partition(conn, table, month):
+            created.append(partition_name(table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def maintain_partitions() -> list[str]:
+    """Create upcoming partitions of every partitioned table"""
+    created = []
+    for table in PARTITIONED_TABLES:
+        with db_engine.begin() as conn:
+            created += ensure_partitions(conn, table)
+    return created
@@ -0,0 +1,151 @@
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, text
+from sqlalchemy.orm import Session
+
+from .archive import export_month, is_archived
+from .api.rollups import QUARTER_HOUR, compact_range, refresh_all_rollups
+from .database import SessionLocal
+from .models import ReadingHourlyDB, ReadingQuarterHourDB
+from .partitions import (
+    add_months,
+    ensure_partitions,
+    list_partitions,
+    month_start,
+    partition_month,
+)
+from .settings import settings
+
+# Do not queue ingestion behind a DETACH for longer than this
+DETACH_LOCK_TIMEOUT = "5s"
+
+
+@dataclass
+class RetentionReport:
+    started_at: datetime
+    raw_cutoff: Optional[datetime]
+    partitions_dropped: list[str] = field(default_factory=list)
+    rows_compacted: int = 0
+    rollup_rows_deleted: dict[str, int] = field(default_factory=dict)
+    bytes_reclaimed: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "started_at": self.started_at.isoformat(),
+            "raw_cutoff": self.raw_cutoff.isoformat() if self.raw_cutoff else None,
+            "partitions_dropped": self.partitions_dropped,
+            "rows_compacted": self.rows_compacted,
+            "rollup_rows_deleted": self.rollup_rows_deleted,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "seconds": round(self.seconds, 3),
+        }
+
+
+def _cutoff(now: datetime, days: int) -> Optional[datetime]:
+    return now - timedelta(days=days) if days > 0 else None
+
+
+def raw_horizon(now: Optional[datetime] = None) -> Optional[datetime]:
+    """Start of the oldest month whose raw readings retention keeps.
+
+    Earlier months are compacted to 15 minute rows and dropped (or about
+    to be), so readings for them must not be written any more. None when
+    retention keeps raw readings forever.
+    """
+    if not settings.RETENTION_ENABLED:
+        return None
+    cutoff = _cutoff(now or datetime.now(), settings.RETENTION_RAW_DAYS)
+    return month_start(cutoff) if cutoff else None
+
+
+def expired_partitions(db: Session, cutoff: datetime) -> list[tuple[str, datetime]]:
+    """(name, month) of readings partitions that end at or before cutoff"""
+    expired = []
+    for name in list_partitions(db.connection(), "readings"):
+        month = partition_month("readings", name)
+        if month is not None and add_months(month, 1) <= cutoff:
+            expired.append((name, month))
+    return sorted(expired, key=lambda p: p[1])
+
+
+def drop_raw_partition(db: Session, name: str, month: datetime) -> tuple[int, int]:
+    """Compact one month of raw readings, then detach and drop its partition.
+
+    Returns (15 minute rows written, bytes reclaimed). Everything happens in
+    the caller's transaction, so a failure leaves the partition attached.
+    """
+    compacted = compact_range(
+        db, ReadingQuarterHourDB, QUARTER_HOUR, month, add_months(month, 1)
+    )
+    size = db.execute(
+        text("SELECT pg_total_relation_size(to_regclass(:name))"), {"name": name}
+    ).scalar()
+    db.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+    db.execute(text(f"ALTER TABLE readings DETACH PARTITION {name}"))
+    db.execute(text(f"DROP TABLE {name}"))
+    return compacted, size or 0
+
+
+def _expire_rollup(db: Session, model, cutoff: datetime) -> tuple[int, int]:
+    """Delete rollup rows older than cutoff, returns (rows, estimated bytes)"""
+    table = model.__tablename__
+    size, total = db.execute(
+        text(
+            "SELECT pg_total_relation_size(to_regclass(:table)), "
+            "(SELECT count(*) FROM " + table + ")"
+        ),
+        {"table": table},
+    ).one()
+    deleted = db.execute(delete(model).where(model.bucket < cutoff)).rowcount
+    # Space is only reusable after VACUUM, so this is an estimate
+    return deleted, int(size * deleted / total) if total else 0
+
+
+def run_retention(now: Optional[datetime] = None) -> RetentionReport:
+    """Apply the retention policy from settings once"""
+    now = now or datetime.now()
+    started = time.perf_counter()
+    report = RetentionReport(now, _cutoff(now, settings.RETENTION_RAW_DAYS))
+
+    # Hourly and daily rollups must cover everything before raw rows go away,
+    # and stray rows in the default partition need a month partition of their own
+    refresh_all_rollups(max_batches=1000)
+    db: Session = SessionLocal()
+    try:
+        ensure_partitions(db.connection(), "readings")
+        db.commit()
+
+        if report.raw_cutoff:
+            for name, month in expired_partitions(db, report.raw_cutoff):
+                if settings.ARCHIVE_ENABLED and not is_archived(month):
+                    export_month(db, month)
+                compacted, size = drop_raw_partition(db, name, month)
+                db.commit()
+                report.partitions_dropped.append(name)
+                report.rows_compacted += compacted
+                report.bytes_reclaimed += size
+                print(f"Retention dropped {name}: {compacted} 15 minute rows, {size} bytes")
+
+        for model, days in (
+            (ReadingQuarterHourDB, settings.RETENTION_15MIN_DAYS),
+            (ReadingHourlyDB, settings.RETENTION_HOURLY_DAYS),
+        ):
+            cutoff = _cutoff(now, days)
+            if cutoff is None:
+                continue
+            deleted, size = _expire_rollup(db, model, cutoff)
+            db.commit()
+            report.rollup_rows_deleted[model.__tablename__] = deleted
+            report.bytes_reclaimed += size
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    report.seconds = time.perf_counter() - started
+    return report
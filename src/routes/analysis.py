@@ -1,111 +1,178 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import func, desc, cast, Date
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func, desc, cast, Date, select, true
 from sqlalchemy.orm import Session
-from ..models import EnergyDB, MeterDB, PowerDB, VoltageDB, CurrentDB
+from ..models import MeterDB, ReadingDB, ReadingDailyDB
 from ..database import get_db
-from ..api.iammeter import voltage_status, calculate_unbalance, current_status
+from ..api.iammeter import (
+    CURRENT_UNBALANCE_LEVELS,
+    POWER_FACTOR_LEVELS,
+    VOLTAGE_UNBALANCE_LEVELS,
+    calculate_unbalance,
+    level,
+    level_sql,
+    unbalance_level,
+    unbalance_sql,
+)
+from ..api.single_flight import flights
+from ..api.snapshot import DEPTH, snapshot
 from ..api.iammeter import get_meter_id_by_name
+from ..api.rollups import rollup_sum
+from ..analytics import average, column_totals, engine_for
 from datetime import datetime, date
+from types import SimpleNamespace
+from typing import Optional
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 
+
+def _engine_headers(response: Response, engine: str, watermark):
+    """Say which engine answered and up to when the archive was used"""
+    response.headers["X-Analytics-Engine"] = engine
+    if watermark is not None:
+        response.headers["X-Analytics-Watermark"] = watermark.isoformat()
+
+
 @router.get("/avg_consumption_yearly")
 def get_yearly_consumption_and_power(
-    year: int = Query(..., ge=2000),
+    response: Response,
+    year: Optional[int] = Query(None, ge=2000),
+    year_from: Optional[int] = Query(None, ge=2000),
+    year_to: Optional[int] = Query(None, ge=2000),
     db: Session = Depends(get_db)
 ):
-    start_date = date(year, 1, 1)
-    end_date = date(year + 1, 1, 1)
-
-    meters = db.query(MeterDB).all()
-    result = []
-
-    for m in meters:
-        power_data = (
-            db.query(
-                func.avg(PowerDB.phase_A_active_power),
-                func.avg(PowerDB.phase_B_active_power),
-                func.avg(PowerDB.phase_C_active_power),
-            )
-            .filter(PowerDB.meter_id == m.meter_id)
-            .filter(PowerDB.timestamp >= start_date)
-            .filter(PowerDB.timestamp < end_date)
-            .one()
+    """Per meter averages of one year, or of every year from year_from to
+    year_to inclusive"""
+    if year is not None:
+        year_from = year_to = year
+    if year_from is None or year_to is None:
+        raise HTTPException(
+            status_code=400, detail="Either year or year_from and year_to are required"
         )
-
-        energy_data = (
-            db.query(
-                func.avg(EnergyDB.phase_A_grid_consumption),
-                func.avg(EnergyDB.phase_B_grid_consumption),
-                func.avg(EnergyDB.phase_C_grid_consumption),
-            )
-            .filter(EnergyDB.meter_id == m.meter_id)
-            .filter(EnergyDB.timestamp >= start_date)
-            .filter(EnergyDB.timestamp < end_date)
-            .one()
+    if year_from > year_to:
+        raise HTTPException(
+            status_code=400, detail="year_from cannot be later than year_to"
         )
 
-        total_avg_power = sum(v or 0 for v in power_data)
-        total_avg_energy = sum(v or 0 for v in energy_data)
-
-        result.append({
-            "meter_name": m.name,
-            "year": year,
-            "average_power": total_avg_power,
-            "average_energy": total_avg_energy,
-        })
-
+    # Concurrent requests for the same years share one computation
+    result, engine, watermark = flights.do(
+        ("avg_consumption_yearly", year_from, year_to),
+        lambda: _yearly_averages(db, year_from, year_to),
+    )
+    _engine_headers(response, engine, watermark)
     return result
 
 
-@router.get("/prev_curr_power")
-def get_previous_current_power(db: Session = Depends(get_db)):
+def _yearly_averages(db: Session, year_from: int, year_to: int):
+    """Per meter averages of each year, with the engine and watermark used"""
     meters = db.query(MeterDB).all()
     result = []
 
-    for m in meters:
-        latest_power = (
-            db.query(
-                PowerDB.phase_A_active_power,
-                PowerDB.phase_B_active_power,
-                PowerDB.phase_C_active_power,
-                PowerDB.timestamp,
-            )
-            .filter(PowerDB.meter_id == m.meter_id)
-            .order_by(desc(PowerDB.timestamp))
-            .first()
-        )
+    power_columns = ["phase_A_active_power", "phase_B_active_power", "phase_C_active_power"]
+    energy_columns = [
+        "phase_A_grid_consumption", "phase_B_grid_consumption", "phase_C_grid_consumption"
+    ]
+    # One grouped query over whole days, so the daily rollup (or the archive) answers it
+    engine = engine_for("avg_consumption_yearly")
+    totals, watermark = column_totals(
+        db,
+        power_columns + energy_columns,
+        datetime(year_from, 1, 1),
+        datetime(year_to + 1, 1, 1),
+        engine,
+        period="year",
+    )
+
+    for y in range(year_from, year_to + 1):
+        for m in meters:
+            key = (m.meter_id, datetime(y, 1, 1))
+            total_avg_power = sum(average(totals, key, c) or 0 for c in power_columns)
+            total_avg_energy = sum(average(totals, key, c) or 0 for c in energy_columns)
+
+            result.append({
+                "meter_name": m.name,
+                "year": y,
+                "average_power": total_avg_power,
+                "average_energy": total_avg_energy,
+            })
+
+    return result, engine, watermark
+
+
+def _recent_power(db: Session, limit: int) -> dict:
+    """meter_id -> (name, newest readings with .timestamp and .power)"""
+    power = (
+        func.coalesce(ReadingDB.phase_A_active_power, 0) +
+        func.coalesce(ReadingDB.phase_B_active_power, 0) +
+        func.coalesce(ReadingDB.phase_C_active_power, 0)
+    ) / 3
+    # One index-only scan per meter on ix_readings_meter_key, in one query
+    recent = (
+        select(ReadingDB.timestamp, power.label("power"))
+        .where(ReadingDB.meter_id == MeterDB.meter_id)
+        .where(ReadingDB.phase_A_active_power.isnot(None))
+        .order_by(desc(ReadingDB.timestamp))
+        .limit(limit)
+        .lateral("recent")
+    )
+    rows = db.execute(
+        select(MeterDB.meter_id, MeterDB.name, recent.c.timestamp, recent.c.power)
+        .outerjoin(recent, true())
+        .order_by(MeterDB.meter_id, desc(recent.c.timestamp))
+    )
 
-        previous_power = (
-            db.query(
-                PowerDB.phase_A_active_power,
-                PowerDB.phase_B_active_power,
-                PowerDB.phase_C_active_power,
-                PowerDB.timestamp,
+    readings = {}
+    for row in rows:
+        meter = readings.setdefault(row.meter_id, (row.name, []))
+        if row.timestamp is not None:
+            meter[1].append(row)
+    return readings
+
+
+def _recent_power_cached(limit: int) -> Optional[dict]:
+    """_recent_power from the latest snapshot, None if it cannot answer"""
+    entries = snapshot.latest_all(limit, present="phase_A_active_power")
+    if entries is None:
+        return None
+    readings = {}
+    for meter_id, name, latest in entries:
+        readings[meter_id] = (name, [
+            SimpleNamespace(
+                timestamp=r["timestamp"],
+                power=(
+                    (r["phase_A_active_power"] or 0) +
+                    (r["phase_B_active_power"] or 0) +
+                    (r["phase_C_active_power"] or 0)
+                ) / 3,
             )
-            .filter(PowerDB.meter_id == m.meter_id)
-            .order_by(desc(PowerDB.timestamp))
-            .offset(1)
-            .first()
-        )
+            for r in latest
+        ])
+    return readings
 
-        def avg_power(row):
-            if not row:
-                return None
-            return (
-                (row.phase_A_active_power or 0) +
-                (row.phase_B_active_power or 0) +
-                (row.phase_C_active_power or 0)
-            ) / 3
 
-        current_avg_power = avg_power(latest_power)
-        previous_avg_power = avg_power(previous_power)
+@router.get("/prev_curr_power")
+def get_previous_current_power(
+    n: Optional[int] = Query(None, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Latest and previous average phase power per meter, plus the last n
+    readings oldest first (for sparklines) when n is given"""
+    limit = max(n or 0, 2)
+    readings = _recent_power_cached(limit) if limit <= DEPTH else None
+    if readings is None:
+        readings = _recent_power(db, limit)
 
-        result.append({
-            "meter_name": m.name,
-            "current_power": current_avg_power,
-            "previous_power": previous_avg_power,
-        })
+    result = []
+    for meter_name, latest in readings.values():
+        item = {
+            "meter_name": meter_name,
+            "current_power": latest[0].power if len(latest) > 0 else None,
+            "previous_power": latest[1].power if len(latest) > 1 else None,
+        }
+        if n is not None:
+            item["recent_power"] = [
+                {"timestamp": r.timestamp, "power": r.power} for r in reversed(latest[:n])
+            ]
+        result.append(item)
 
     return result
 
@@ -117,20 +184,26 @@ def get_avg_daily_energy_across_meters(
     to_date: date = Query(...),
     db: Session = Depends(get_db)
 ):
-    # per-meter daily energy
+    return flights.do(
+        ("avg_daily_energy", from_date, to_date),
+        lambda: _avg_daily_energy(db, from_date, to_date),
+    )
+
+
+def _avg_daily_energy(db: Session, from_date: date, to_date: date) -> list[dict]:
+    # per-meter daily energy, one daily rollup row each
     per_meter_daily = (
         db.query(
-            cast(EnergyDB.timestamp, Date).label("day"),
-            EnergyDB.meter_id.label("meter_id"),
-            func.sum(
-                EnergyDB.phase_A_grid_consumption +
-                EnergyDB.phase_B_grid_consumption +
-                EnergyDB.phase_C_grid_consumption
+            cast(ReadingDailyDB.bucket, Date).label("day"),
+            ReadingDailyDB.meter_id.label("meter_id"),
+            (
+                rollup_sum(ReadingDailyDB, "phase_A_grid_consumption") +
+                rollup_sum(ReadingDailyDB, "phase_B_grid_consumption") +
+                rollup_sum(ReadingDailyDB, "phase_C_grid_consumption")
             ).label("meter_energy")
         )
-        .filter(EnergyDB.timestamp >= from_date)
-        .filter(EnergyDB.timestamp < to_date)
-        .group_by("day", EnergyDB.meter_id)
+        .filter(ReadingDailyDB.bucket >= from_date)
+        .filter(ReadingDailyDB.bucket < to_date)
         .subquery()
     )
 
@@ -159,155 +232,249 @@ MONTHS = {
     5: "may", 6: "jun", 7: "jul", 8: "aug",
     9: "sep", 10: "oct", 11: "nov", 12: "dec"
 }
-@router.get("/monthly_average/{year}/{meter_name}")
-def monthly_average(meter_name: str, year: int, db:Session = Depends(get_db)):
-    data = {}
-    meter_id = get_meter_id_by_name(meter_name)
-    for month in range(1, 13):
-        start_date = datetime(year, month, 1)
-        end_date = (
-            datetime(year + 1, 1, 1)
-            if month == 12
-            else datetime(year, month + 1, 1)
-        )
+def _monthly_averages(
+    db: Session, response: Response, year: int, meter_ids: list
+) -> dict:
+    """Month name -> summed phase averages, for each meter id, in one query"""
+    result, engine, watermark = flights.do(
+        ("monthly_average", year, tuple(meter_ids)),
+        lambda: _compute_monthly_averages(db, year, meter_ids),
+    )
+    _engine_headers(response, engine, watermark)
+    return result
 
-        avg_current = db.query(
-            (
-                func.coalesce(func.avg(CurrentDB.phase_A_current), 0) +
-                func.coalesce(func.avg(CurrentDB.phase_B_current), 0) +
-                func.coalesce(func.avg(CurrentDB.phase_C_current), 0)
-            )
-        ).filter(
-            CurrentDB.meter_id == meter_id,
-            CurrentDB.timestamp >= start_date,
-            CurrentDB.timestamp < end_date
-        ).scalar()
-        
-        avg_voltage = db.query(
-            (
-                func.coalesce(func.avg(VoltageDB.phase_A_voltage), 0) +
-                func.coalesce(func.avg(VoltageDB.phase_B_voltage), 0) +
-                func.coalesce(func.avg(VoltageDB.phase_C_voltage), 0)
-            )
-        ).filter(
-            VoltageDB.meter_id == meter_id,
-            VoltageDB.timestamp >= start_date,
-            VoltageDB.timestamp < end_date
-        ).scalar()       
 
-        avg_power = db.query(
-            (
-                func.coalesce(func.avg(PowerDB.phase_A_active_power), 0) +
-                func.coalesce(func.avg(PowerDB.phase_B_active_power), 0) +
-                func.coalesce(func.avg(PowerDB.phase_C_active_power), 0)
-            )
-        ).filter(
-            PowerDB.meter_id == meter_id,
-            PowerDB.timestamp >= start_date,
-            PowerDB.timestamp < end_date
-        ).scalar()
+def _compute_monthly_averages(db: Session, year: int, meter_ids: list):
+    fields = ("current", "voltage", "active_power", "grid_consumption")
+    engine = engine_for("monthly_average")
+    totals, watermark = column_totals(
+        db,
+        [f"phase_{p}_{field}" for field in fields for p in "ABC"],
+        datetime(year, 1, 1),
+        datetime(year + 1, 1, 1),
+        engine,
+        period="month",
+        meter_ids=meter_ids,
+    )
 
-        avg_energy = db.query(
-            (
-                func.coalesce(func.avg(EnergyDB.phase_A_grid_consumption), 0) +
-                func.coalesce(func.avg(EnergyDB.phase_B_grid_consumption), 0) +
-                func.coalesce(func.avg(EnergyDB.phase_C_grid_consumption), 0)
-            )
-        ).filter(
-            EnergyDB.meter_id == meter_id,
-            EnergyDB.timestamp >= start_date,
-            EnergyDB.timestamp < end_date
-        ).scalar()
-
-        data[MONTHS[month]] = {
-            "average_current": avg_current,
-            "average_voltage":avg_voltage,
-            "average_power": avg_power,
-            "average_energy": avg_energy
-        }
+    def monthly(key, column):
+        return sum(average(totals, key, f"phase_{p}_{column}") or 0.0 for p in "ABC")
+
+    result = {}
+    for meter_id in meter_ids:
+        data = {}
+        for month in range(1, 13):
+            key = (meter_id, datetime(year, month, 1))
+            data[MONTHS[month]] = {
+                "average_current": monthly(key, "current"),
+                "average_voltage": monthly(key, "voltage"),
+                "average_power": monthly(key, "active_power"),
+                "average_energy": monthly(key, "grid_consumption")
+            }
+        result[meter_id] = data
+    return result, engine, watermark
+
+
+@router.get("/monthly_average/{year}")
+def monthly_average_many(
+    year: int,
+    response: Response,
+    meters: list[str] = Query(..., description="Meter names, repeat for several"),
+    db: Session = Depends(get_db)
+):
+    """monthly_average of several meters, keyed by meter name"""
+    found = dict(
+        db.query(MeterDB.name, MeterDB.meter_id).filter(MeterDB.name.in_(meters)).all()
+    )
+    missing = [name for name in meters if name not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Meters not found: {missing}")
+
+    names = list(dict.fromkeys(meters))
+    averages = _monthly_averages(db, response, year, [found[name] for name in names])
+    return {
+        "success": True,
+        "year": year,
+        "data": {name: averages[found[name]] for name in names}
+    }
+
+
+@router.get("/monthly_average/{year}/{meter_name}")
+def monthly_average(
+    meter_name: str, year: int, response: Response, db:Session = Depends(get_db)
+):
+    meter_id = get_meter_id_by_name(db, meter_name)
+    if meter_id is None:
+        raise HTTPException(status_code=404, detail="Meter not found")
+    data = _monthly_averages(db, response, year, [meter_id])[meter_id]
 
     return {
         "success": True,
         "year": year,
         "data": data
     }
-@router.get("/voltage")
-def get_voltage_analysis(db: Session = Depends(get_db)):
-    meters = db.query(MeterDB).all()
-    result = []
-    for m in meters:
-        latest_voltage = (
-            db.query(VoltageDB)
-            .filter(VoltageDB.meter_id == m.meter_id)
-            .order_by(desc(VoltageDB.timestamp))
-            .first()
-        )
 
-        if not latest_voltage:
-            result.append({
-                "meter_name": m.name,
-                "status": "NO_DATA"
-            })
+
+def _latest_reading(*columns, present):
+    """Newest reading of each meter where present is not null, as a LATERAL
+    subquery: one index probe per meter instead of a scan of every reading"""
+    return (
+        select(ReadingDB.timestamp, *columns)
+        .where(ReadingDB.meter_id == MeterDB.meter_id)
+        .where(present.isnot(None))
+        .order_by(desc(ReadingDB.timestamp))
+        .limit(1)
+        .lateral("latest")
+    )
+
+
+def _phase_unbalance_cached(quantity: str, levels) -> Optional[list[dict]]:
+    """_phase_unbalance from the latest snapshot, None if it cannot answer"""
+    entries = snapshot.latest_all(1, present=f"phase_A_{quantity}")
+    if entries is None:
+        return None
+
+    result = []
+    for _, name, latest in entries:
+        if not latest:
+            result.append({"meter_name": name, "status": "NO_DATA"})
             continue
+        reading = latest[0]
+        values = [reading[f"phase_{p}_{quantity}"] for p in "ABC"]
+        if None in values:
+            return None
+        unbalance = calculate_unbalance(*values)
+        item = {"meter_name": name, "timestamp": reading["timestamp"]}
+        for p, value in zip("ABC", values):
+            item[f"phase_{p}_{quantity}"] = value
+        item[f"{quantity}_unbalance_percent"] = unbalance
+        item["status"] = level(unbalance, levels, "CRITICAL")
+        result.append(item)
+    return result
+
 
-        unbalance = calculate_unbalance(
-            latest_voltage.phase_A_voltage,
-            latest_voltage.phase_B_voltage,
-            latest_voltage.phase_C_voltage
+def _phase_unbalance(db: Session, quantity: str, levels) -> list[dict]:
+    """Latest phase values, unbalance percent and status of every meter"""
+    cached = _phase_unbalance_cached(quantity, levels)
+    if cached is not None:
+        return cached
+
+    phases = [getattr(ReadingDB, f"phase_{p}_{quantity}") for p in "ABC"]
+    latest = _latest_reading(*phases, present=phases[0])
+    values = [latest.c[f"phase_{p}_{quantity}"] for p in "ABC"]
+    unbalance = unbalance_sql(*values)
+    rows = db.execute(
+        select(
+            MeterDB.name,
+            latest.c.timestamp,
+            *values,
+            unbalance.label("unbalance"),
         )
+        .outerjoin(latest, true())
+        .order_by(MeterDB.meter_id)
+    )
+
+    result = []
+    for row in rows:
+        if row.timestamp is None:
+            result.append({"meter_name": row.name, "status": "NO_DATA"})
+            continue
+        item = {"meter_name": row.name, "timestamp": row.timestamp}
+        for p in "ABC":
+            item[f"phase_{p}_{quantity}"] = getattr(row, f"phase_{p}_{quantity}")
+        (
+            item[f"{quantity}_unbalance_percent"],
+            item["status"],
+        ) = unbalance_level(row.unbalance, levels)
+        result.append(item)
+    return result
 
-        result.append({
-            "meter_name": m.name,
-            "timestamp": latest_voltage.timestamp,
-            "phase_A_voltage": latest_voltage.phase_A_voltage,
-            "phase_B_voltage": latest_voltage.phase_B_voltage,
-            "phase_C_voltage": latest_voltage.phase_C_voltage,
-            "voltage_unbalance_percent": unbalance,
-            "status": voltage_status(unbalance)      
-        })
 
+@router.get("/voltage")
+def get_voltage_analysis(db: Session = Depends(get_db)):
     return {
         "success": True,
-        "data": result
+        "data": _phase_unbalance(db, "voltage", VOLTAGE_UNBALANCE_LEVELS)
     }
 
+
 @router.get("/current")
 def get_current_analysis(db: Session = Depends(get_db)):
-    meters = db.query(MeterDB).all()
+    return {
+        "success": True,
+        "data": _phase_unbalance(db, "current", CURRENT_UNBALANCE_LEVELS)
+    }
+
+
+@router.get("/power-quality")
+def get_power_quality(db: Session = Depends(get_db)):
+    """Voltage and current unbalance and power factor of the latest reading
+    of every meter, in one query"""
+    columns = [
+        getattr(ReadingDB, f"phase_{p}_{quantity}")
+        for quantity in ("voltage", "current", "power_factor")
+        for p in "ABC"
+    ]
+    latest = _latest_reading(*columns, present=ReadingDB.phase_A_voltage)
+
+    def phase_values(quantity):
+        return [latest.c[f"phase_{p}_{quantity}"] for p in "ABC"]
+
+    # The worst phase decides; least() skips phases without a value
+    power_factor = func.least(*phase_values("power_factor"))
+    rows = db.execute(
+        select(
+            MeterDB.name,
+            latest,
+            unbalance_sql(*phase_values("voltage")).label("voltage_unbalance"),
+            unbalance_sql(*phase_values("current")).label("current_unbalance"),
+            power_factor.label("power_factor"),
+            level_sql(power_factor, POWER_FACTOR_LEVELS, "NORMAL").label(
+                "power_factor_status"
+            ),
+        )
+        .select_from(MeterDB)
+        .outerjoin(latest, true())
+        .order_by(MeterDB.meter_id)
+    )
+
     result = []
-    for m in meters:
-        latest_current = (
-            db.query(CurrentDB)
-            .filter(CurrentDB.meter_id == m.meter_id)
-            .order_by(desc(CurrentDB.timestamp))
-            .first()
-        )   
-
-        if not latest_current:
-            result.append({
-                "meter_name": m.name,
-                "status": "NO_DATA"
-            })
+    for row in rows:
+        if row.timestamp is None:
+            result.append({"meter_name": row.name, "status": "NO_DATA"})
             continue
 
-        unbalance = calculate_unbalance(
-            latest_current.phase_A_current,
-            latest_current.phase_B_current,
-            latest_current.phase_C_current
+        def phases(quantity):
+            return {p: getattr(row, f"phase_{p}_{quantity}") for p in "ABC"}
+
+        voltage_unbalance, voltage_status = unbalance_level(
+            row.voltage_unbalance, VOLTAGE_UNBALANCE_LEVELS
+        )
+        current_unbalance, current_status = unbalance_level(
+            row.current_unbalance, CURRENT_UNBALANCE_LEVELS
         )
 
         result.append({
-            "meter_name": m.name,
-            "timestamp": latest_current.timestamp,
-            "phase_A_current": latest_current.phase_A_current,
-            "phase_B_current": latest_current.phase_B_current,
-            "phase_C_current": latest_current.phase_C_current,
-            "current_unbalance_percent": unbalance,
-            "status": current_status(unbalance)      
+            "meter_name": row.name,
+            "timestamp": row.timestamp,
+            "voltage": {
+                "phases": phases("voltage"),
+                "unbalance_percent": voltage_unbalance,
+                "status": voltage_status,
+            },
+            "current": {
+                "phases": phases("current"),
+                "unbalance_percent": current_unbalance,
+                "status": current_status,
+            },
+            "power_factor": {
+                "phases": phases("power_factor"),
+                "min": row.power_factor,
+                "status": row.power_factor_status,
+            },
         })
 
     return {
         "success": True,
         "data": result
     }
-
@@ -5,6 +5,7 @@ from datetime import date
 from ..models import BillingDB, CostPerDayDB, CostPerMeterDB
 from ..database import get_db
 from ..api.billing import calculate_bill
+from ..api.single_flight import flights
 
 router = APIRouter(prefix="/billing", tags=["billing"])
 
@@ -15,9 +16,12 @@ def get_bill(
     month: int,
     db: Session = Depends(get_db)
   ):
-  month_key = f"{year}-{month:02d}"
+  # Concurrent requests for the same month share one computation
+  return flights.do(("bill", year, month), lambda: _bill(year, month, db))
+
 
-  billing = (
+def _billing_row(month_key: str, db: Session):
+  return (
     db.query(
       BillingDB.total_cost,
       BillingDB.avg_cost_per_day,
@@ -28,18 +32,17 @@ def get_bill(
     .first()
   )
 
+
+def _bill(year: int, month: int, db: Session) -> dict:
+  month_key = f"{year}-{month:02d}"
+
+  billing = _billing_row(month_key, db)
+
   if not billing:
-    calculate_bill(year, month, db)
-    billing = (
-      db.query(
-        BillingDB.total_cost,
-        BillingDB.avg_cost_per_day,
-        BillingDB.expensive_day,
-        BillingDB.expensive_day_cost,
-      )
-      .filter(BillingDB.date == month_key)
-      .first()
-    )
+    # Another worker may be calculating this month, in which case its
+    # bill is kept
+    calculate_bill(year, month, db, recalculate=False)
+    billing = _billing_row(month_key, db)
 
   cost_per_day = (
     db.query(
@@ -104,11 +107,5 @@ def do_bill(
     db: Session = Depends(get_db)
   ):
 
-  month_key = f"{year}-{month:02d}"
-
-  db.query(BillingDB).filter(BillingDB.date == month_key).delete()
-  db.query(CostPerDayDB).filter(CostPerDayDB.date == month_key).delete()
-  db.query(CostPerMeterDB).filter(CostPerMeterDB.date == month_key).delete()
-
   calculate_bill(year, month, db)
   return "Billing Calculated"
@@ -1,29 +1,84 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field, field_validator
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
+from functools import lru_cache
 from typing import Optional
 import asyncio
+import os
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from zoneinfo import ZoneInfo
 
-from src.api import iammeter
+from src.api import iammeter, writer
+from src.api.meter_health import health
+from src.api.hot_tier import hot_tier
+from src.api.response_cache import response_cache
+from src.api.single_flight import flights
+from src.api.snapshot import snapshot
+from src.api.spool import spool
 from src.routes.auth.auth_utils import require_admin, get_current_user
-from src.models import User, DataCollectionScheduleDB
-from src.database import get_db
+from src.models import User, DataCollectionScheduleDB, DataCollectionStateDB, MeterDB
+from src.database import get_db, SessionLocal
+from src.leader import leader
+from src.settings import settings
+from src.utils.timeline import ALL_DAYS, CollectionTimeline, Window
 
 router = APIRouter(prefix="/data-collection", tags=["Data Collection"])
 
 NEPAL_TZ = ZoneInfo("Asia/Kathmandu")
 
+# Primary key of the single data_collection_state row
+STATE_ROW_ID = 1
+
 
 def get_nepal_time() -> datetime:
     return datetime.now(NEPAL_TZ)
 
 
+def parse_schedule_datetime(value: str) -> datetime:
+    """Parse an ISO schedule string, treating naive values as Nepal time"""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=NEPAL_TZ)
+
+
+class ScheduleWindow(BaseModel):
+    start_time: str = Field(..., example="09:00")
+    end_time: str = Field(..., example="17:00")  # at or before start wraps midnight
+    interval_minutes: int = Field(..., ge=1, le=1440, example=1)
+    days: list[int] = Field(default_factory=lambda: sorted(ALL_DAYS), example=[0, 1, 2, 3, 4])
+
+    @field_validator("start_time", "end_time")
+    @classmethod
+    def validate_time_format(cls, v):
+        try:
+            time.fromisoformat(v)
+        except ValueError as e:
+            raise ValueError(f"Time must be in HH:MM format: {e}")
+        return v
+
+    @field_validator("days")
+    @classmethod
+    def validate_days(cls, v):
+        if not v or any(d not in ALL_DAYS for d in v):
+            raise ValueError("days must be weekday numbers, 0 (Monday) to 6 (Sunday)")
+        return v
+
+    def to_window(self) -> Window:
+        return Window(
+            start=time.fromisoformat(self.start_time),
+            end=time.fromisoformat(self.end_time),
+            interval_minutes=self.interval_minutes,
+            days=frozenset(self.days),
+        )
+
+
 class ScheduleInput(BaseModel):
     start_datetime: str = Field(..., example="2025-02-15T08:00")
     end_datetime: str = Field(..., example="2025-02-15T18:00")
+    # Used outside of every window, or everywhere when there are no windows
     interval_minutes: int = Field(..., ge=1, le=1440, example=5)
+    # Earlier windows win where they overlap
+    windows: Optional[list[ScheduleWindow]] = None
 
     @field_validator("start_datetime", "end_datetime")
     @classmethod
@@ -58,111 +113,229 @@ class ScheduleInput(BaseModel):
         return v
 
 
+@lru_cache(maxsize=8)
+def _build_timeline(
+    start: datetime, end: datetime, interval_minutes: int, windows: tuple[Window, ...]
+) -> CollectionTimeline:
+    return CollectionTimeline(start, end, interval_minutes, list(windows))
+
+
+def schedule_timeline(schedule: ScheduleInput) -> CollectionTimeline:
+    """Precomputed timeline of a schedule, cached since schedules are immutable"""
+    return _build_timeline(
+        parse_schedule_datetime(schedule.start_datetime),
+        parse_schedule_datetime(schedule.end_datetime),
+        schedule.interval_minutes,
+        tuple(w.to_window() for w in schedule.windows or []),
+    )
+
+
 # Global state
 class CollectionState:
     def __init__(self):
         self.is_running = False
         self.task: Optional[asyncio.Task] = None
         self.schedule: Optional[ScheduleInput] = None
+        self.schedule_id: Optional[int] = None
+        self.timeline: Optional[CollectionTimeline] = None
         self.last_run: Optional[datetime] = None
         self.next_run: Optional[datetime] = None
+        self.skipped_ticks = 0
+        self.restored = False
+        self.run_now_task: Optional[asyncio.Task] = None
 
     def is_within_schedule(self) -> bool:
-        if not self.schedule:
+        if not self.timeline:
             return True
-        now = get_nepal_time()
-        # Parse the datetime strings (they're in Nepal time)
-        start = datetime.fromisoformat(
-            self.schedule.start_datetime.replace("Z", "+00:00")
-        )
-        end = datetime.fromisoformat(self.schedule.end_datetime.replace("Z", "+00:00"))
+        return self.timeline.segment_at(get_nepal_time()) is not None
 
-        # Ensure timezone awareness
-        if start.tzinfo is None:
-            start = start.replace(tzinfo=NEPAL_TZ)
-        if end.tzinfo is None:
-            end = end.replace(tzinfo=NEPAL_TZ)
+    def calculate_next_run(self) -> Optional[datetime]:
+        if not self.timeline:
+            return None
+        return self.timeline.next_tick(get_nepal_time())
 
-        return start <= now <= end
 
-    def calculate_next_run(self) -> datetime:
-        if not self.schedule:
-            # No schedule, just add interval to now
-            interval = 5 * 60  # default 5 minutes
-            return get_nepal_time() + timedelta(seconds=interval)
+state = CollectionState()
 
-        interval = self.schedule.interval_minutes * 60
-        now = get_nepal_time()
-        next_time = now + timedelta(seconds=interval)
 
-        # Parse schedule datetimes
-        start_dt = datetime.fromisoformat(
-            self.schedule.start_datetime.replace("Z", "+00:00")
+def _load_active_schedule() -> Optional[tuple[int, ScheduleInput]]:
+    db: Session = SessionLocal()
+    try:
+        row = (
+            db.query(DataCollectionScheduleDB)
+            .filter(DataCollectionScheduleDB.is_active)
+            .order_by(DataCollectionScheduleDB.id.desc())
+            .first()
         )
-        end_dt = datetime.fromisoformat(
-            self.schedule.end_datetime.replace("Z", "+00:00")
+        if not row or row.end_datetime <= get_nepal_time():
+            return None
+        return row.id, ScheduleInput(
+            start_datetime=row.start_datetime.astimezone(NEPAL_TZ).isoformat(),
+            end_datetime=row.end_datetime.astimezone(NEPAL_TZ).isoformat(),
+            interval_minutes=row.interval_minutes,
+            windows=row.windows,
         )
+    finally:
+        db.close()
 
-        # Ensure timezone awareness
-        if start_dt.tzinfo is None:
-            start_dt = start_dt.replace(tzinfo=NEPAL_TZ)
-        if end_dt.tzinfo is None:
-            end_dt = end_dt.replace(tzinfo=NEPAL_TZ)
 
-        # If next run is after end datetime, we're done with this schedule
-        if next_time > end_dt:
-            # Schedule has ended, return end time
-            return end_dt
+def _save_state():
+    """Publish the local collector state to the shared row, after applying
+    the breaker resets requested through it"""
+    db: Session = SessionLocal()
+    try:
+        row = db.get(DataCollectionStateDB, STATE_ROW_ID, with_for_update=True)
+        for sn in (row.health_resets or []) if row else []:
+            health.reset(sn)
+        db.execute(_state_upsert())
+        db.commit()
+    except Exception as e:
+        print(f"Failed to save collection state: {e}")
+    finally:
+        db.close()
 
-        # If we're currently before start time, schedule for start time
-        if now < start_dt:
-            return start_dt
 
-        return next_time
+def _state_upsert():
+    values = {
+        "is_running": state.is_running,
+        "schedule_id": state.schedule_id,
+        "last_run": state.last_run,
+        "next_run": state.next_run,
+        "skipped_ticks": state.skipped_ticks,
+        "last_cycle": iammeter.last_cycle_stats.as_dict()
+        if iammeter.last_cycle_stats
+        else None,
+        "last_write": writer.last_write_stats.as_dict()
+        if writer.last_write_stats
+        else None,
+        "spool": spool.stats(),
+        "meter_health": [meter.as_dict() for meter in health.all()],
+        "health_resets": None,
+        "leader_pid": os.getpid(),
+        "updated_at": get_nepal_time(),
+    }
+    return (
+        insert(DataCollectionStateDB)
+        .values(id=STATE_ROW_ID, **values)
+        .on_conflict_do_update(index_elements=["id"], set_=values)
+    )
 
 
-state = CollectionState()
+def _take_run_now_request() -> bool:
+    """Clear a pending /run-now request, True if there was one"""
+    db: Session = SessionLocal()
+    try:
+        row = db.get(DataCollectionStateDB, STATE_ROW_ID, with_for_update=True)
+        if row is None or row.run_now_requested_at is None:
+            return False
+        row.run_now_requested_at = None
+        db.commit()
+        return True
+    finally:
+        db.close()
 
 
-async def collection_task():
-    """Background task that collects data on schedule"""
-    while state.is_running:
+async def collect_now():
+    """Run one collection cycle outside the schedule, on the leader"""
+    await iammeter.collect_meter_data()
+    state.last_run = get_nepal_time()
+
+
+async def _run_requested_collection():
+    try:
+        await collect_now()
+        print(f"[{get_nepal_time()}] Requested collection complete")
+    except Exception as e:
+        print(f"Requested collection error: {e}")
+
+
+def _load_counters() -> tuple[Optional[datetime], int]:
+    db: Session = SessionLocal()
+    try:
+        row = db.get(DataCollectionStateDB, STATE_ROW_ID)
+        return (row.last_run, row.skipped_ticks) if row else (None, 0)
+    finally:
+        db.close()
+
+
+def start_local_collection(schedule_id: int, schedule: ScheduleInput):
+    state.is_running = True
+    state.schedule = schedule
+    state.schedule_id = schedule_id
+    state.timeline = schedule_timeline(schedule)
+    state.next_run = state.calculate_next_run()
+    state.task = asyncio.create_task(collection_task())
+
+
+async def stop_local_collection():
+    state.is_running = False
+    if state.task:
+        state.task.cancel()
         try:
-            if state.is_within_schedule():
-                print(f"[{get_nepal_time()}] Collecting data...")
-                await asyncio.to_thread(iammeter.store_all_meter_data)
-                state.last_run = get_nepal_time()
-                print(f"[{get_nepal_time()}] Collection complete")
-            else:
-                print(f"[{get_nepal_time()}] Outside schedule window, skipping")
+            await state.task
+        except asyncio.CancelledError:
+            pass
+        state.task = None
+    state.schedule_id = None
+    state.next_run = None
+    await asyncio.to_thread(_save_state)
 
-        except Exception as e:
-            print(f"Collection error: {e}")
 
-        # Calculate next run time
-        interval = state.schedule.interval_minutes * 60 if state.schedule else 5 * 60
-        state.next_run = get_nepal_time() + timedelta(seconds=interval)
+async def sync_collection():
+    """Leader only: run the collector exactly when the DB has an active schedule"""
+    if not state.restored:
+        # Carry the counters over a restart or failover
+        state.last_run, state.skipped_ticks = await asyncio.to_thread(_load_counters)
+        state.restored = True
 
-        # Adjust next_run if outside schedule window
-        if state.schedule:
-            now = get_nepal_time()
-            end_dt = datetime.fromisoformat(
-                state.schedule.end_datetime.replace("Z", "+00:00")
-            )
-            if end_dt.tzinfo is None:
-                end_dt = end_dt.replace(tzinfo=NEPAL_TZ)
+    active = await asyncio.to_thread(_load_active_schedule)
+    if active is None:
+        if state.is_running:
+            await stop_local_collection()
+    elif not state.is_running or state.schedule_id != active[0]:
+        if state.is_running:
+            await stop_local_collection()
+        start_local_collection(*active)
 
-            # If we've passed the end datetime, stop the collection
-            if now > end_dt:
-                print(f"[{get_nepal_time()}] Schedule ended, stopping collection")
-                state.is_running = False
-                break
+    # In a task, a slow cycle must not hold up the heartbeat
+    running = state.run_now_task is not None and not state.run_now_task.done()
+    if not running and await asyncio.to_thread(_take_run_now_request):
+        state.run_now_task = asyncio.create_task(_run_requested_collection())
 
-            # If next run would be after end time, schedule for end time
-            if state.next_run > end_dt:
-                state.next_run = end_dt
+    # Doubles as the heartbeat other workers use to judge freshness
+    await asyncio.to_thread(_save_state)
 
-        await asyncio.sleep(interval)
+
+async def collection_task():
+    """Background task that collects data on every tick of the schedule timeline"""
+    tick = get_nepal_time()
+    while state.is_running:
+        # Strictly after the previous tick, in case the sleep woke early
+        tick = state.timeline.next_tick(max(tick, get_nepal_time()))
+        if tick is None:
+            print(f"[{get_nepal_time()}] Schedule ended, stopping collection")
+            state.is_running = False
+            break
+
+        state.next_run = tick
+        await asyncio.to_thread(_save_state)
+        await asyncio.sleep((tick - get_nepal_time()).total_seconds())
+
+        try:
+            print(f"[{get_nepal_time()}] Collecting data for tick {tick}...")
+            await iammeter.collect_meter_data()
+            state.last_run = get_nepal_time()
+            print(f"[{get_nepal_time()}] Collection complete")
+        except Exception as e:
+            print(f"Collection error: {e}")
+
+        # Ticks that passed while the cycle ran are dropped, not queued
+        missed = state.timeline.count_ticks(tick, get_nepal_time())
+        if missed:
+            state.skipped_ticks += missed
+            print(f"Collection overran, skipped {missed} tick(s)")
+
+    await asyncio.to_thread(_save_state)
 
 
 @router.get("/current-time")
@@ -177,21 +350,71 @@ async def get_current_time(current_user: User = Depends(get_current_user)):
 
 
 @router.get("/status")
-async def get_status(current_user: User = Depends(get_current_user)):
-    """Get current collection status"""
+def get_status(
+    db: Session = Depends(get_db), current_user: User = Depends(get_current_user)
+):
+    """Get current collection status, identical on every worker"""
+    now = get_nepal_time()
+    row = db.get(DataCollectionStateDB, STATE_ROW_ID)
+    schedule = (
+        db.query(DataCollectionScheduleDB)
+        .filter(DataCollectionScheduleDB.is_active)
+        .order_by(DataCollectionScheduleDB.id.desc())
+        .first()
+    )
+
+    # A leader that stopped heartbeating is no longer collecting
+    stale_after = timedelta(seconds=3 * settings.LEADER_HEARTBEAT_SECONDS)
+    alive = row is not None and now - row.updated_at <= stale_after
+    is_running = alive and row.is_running
+
+    timeline = (
+        _build_timeline(
+            schedule.start_datetime,
+            schedule.end_datetime,
+            schedule.interval_minutes,
+            tuple(ScheduleWindow(**w).to_window() for w in schedule.windows or []),
+        )
+        if schedule
+        else None
+    )
+
     return {
-        "is_running": state.is_running,
+        "is_running": is_running,
         "schedule": {
-            "start_datetime": state.schedule.start_datetime,
-            "end_datetime": state.schedule.end_datetime,
-            "interval_minutes": state.schedule.interval_minutes,
+            "start_datetime": schedule.start_datetime.astimezone(NEPAL_TZ).isoformat(),
+            "end_datetime": schedule.end_datetime.astimezone(NEPAL_TZ).isoformat(),
+            "interval_minutes": schedule.interval_minutes,
+            "windows": schedule.windows,
         }
-        if state.schedule
+        if schedule
+        else None,
+        "last_run": row.last_run.astimezone(NEPAL_TZ).isoformat()
+        if row and row.last_run
         else None,
-        "last_run": state.last_run.isoformat() if state.last_run else None,
-        "next_run": state.next_run.isoformat() if state.next_run else None,
-        "is_within_schedule": state.is_within_schedule() if state.is_running else None,
-        "current_nepal_time": get_nepal_time().isoformat(),
+        "next_run": row.next_run.astimezone(NEPAL_TZ).isoformat()
+        if is_running and row.next_run
+        else None,
+        "last_cycle": row.last_cycle if row else None,
+        "last_write": row.last_write if row else None,
+        "spool": row.spool if row else None,
+        "snapshot": snapshot.stats(),
+        "hot_tier": hot_tier.stats(),
+        "response_cache": response_cache.stats(),
+        "single_flight": flights.stats(),
+        "skipped_ticks": row.skipped_ticks if row else 0,
+        "is_within_schedule": timeline.segment_at(now) is not None
+        if is_running and timeline
+        else None,
+        "current_nepal_time": now.isoformat(),
+        "leader": {
+            "pid": row.leader_pid if row else None,
+            "heartbeat_at": row.updated_at.astimezone(NEPAL_TZ).isoformat()
+            if row
+            else None,
+            "alive": alive,
+        },
+        "worker": {"pid": os.getpid(), "is_leader": leader.is_leader},
     }
 
 
@@ -202,15 +425,16 @@ async def start_collection(
     db: Session = Depends(get_db),
 ):
     """Start data collection with schedule"""
-    if state.is_running:
+    if await asyncio.to_thread(_load_active_schedule):
         raise HTTPException(status_code=400, detail="Already running")
 
-    # Save to database
+    # Save to database, the leader worker picks it up from there
     db.query(DataCollectionScheduleDB).update({"is_active": False})
     new_schedule = DataCollectionScheduleDB(
-        start_datetime=schedule.start_datetime,
-        end_datetime=schedule.end_datetime,
+        start_datetime=parse_schedule_datetime(schedule.start_datetime),
+        end_datetime=parse_schedule_datetime(schedule.end_datetime),
         interval_minutes=schedule.interval_minutes,
+        windows=[w.model_dump() for w in schedule.windows] if schedule.windows else None,
         is_active=True,
         created_by=current_user.id,
         created_at=get_nepal_time(),
@@ -218,11 +442,8 @@ async def start_collection(
     db.add(new_schedule)
     db.commit()
 
-    # Start collection
-    state.is_running = True
-    state.schedule = schedule
-    state.next_run = state.calculate_next_run()
-    state.task = asyncio.create_task(collection_task())
+    if leader.is_leader:
+        await sync_collection()
 
     return {"message": "Collection started", "is_running": True}
 
@@ -233,39 +454,84 @@ async def stop_collection(
     db: Session = Depends(get_db),
 ):
     """Stop data collection"""
-    if not state.is_running:
+    if not await asyncio.to_thread(_load_active_schedule):
         raise HTTPException(status_code=400, detail="Not running")
 
-    state.is_running = False
-    if state.task:
-        state.task.cancel()
-        try:
-            await state.task
-        except asyncio.CancelledError:
-            pass
-        state.task = None
-
-    # Mark schedule as inactive in DB
+    # Mark schedule as inactive in DB, the leader stops on its next sync
     db.query(DataCollectionScheduleDB).filter(
         DataCollectionScheduleDB.is_active
     ).update({"is_active": False})
     db.commit()
 
-    # Clear next run when stopped
-    state.next_run = None
+    if state.is_running:
+        await stop_local_collection()
 
     return {"message": "Collection stopped", "is_running": False}
 
 
 @router.post("/run-now")
-async def run_now(current_user: User = Depends(require_admin)):
-    """Manually trigger data collection once"""
+async def run_now(
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Manually trigger data collection once.
+
+    Only the leader collects (it owns the spool and the breakers), other
+    workers leave a request in the state row for its next heartbeat.
+    """
+    if not leader.is_leader:
+        now = get_nepal_time()
+        row = db.get(DataCollectionStateDB, STATE_ROW_ID, with_for_update=True)
+        if row is None:
+            raise HTTPException(status_code=503, detail="No leader has started yet")
+        row.run_now_requested_at = now
+        db.commit()
+        return {"message": "Collection requested", "timestamp": now.isoformat()}
+
     try:
-        await asyncio.to_thread(iammeter.store_all_meter_data)
-        state.last_run = get_nepal_time()
+        await collect_now()
         return {
             "message": "Collection executed",
             "timestamp": get_nepal_time().isoformat(),
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/meter-health")
+async def get_meter_health(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Circuit breaker state of every meter, as last published by the leader"""
+    row = db.get(DataCollectionStateDB, STATE_ROW_ID)
+    names = dict(db.query(MeterDB.sn, MeterDB.name).all())
+    meters = [
+        {"name": names.get(meter["sn"]), **meter}
+        for meter in (row.meter_health or [] if row else [])
+    ]
+    return {
+        "open": sum(1 for m in meters if m["state"] != "closed"),
+        "meters": meters,
+    }
+
+
+@router.post("/meter-health/{sn}/reset")
+def reset_meter_health(
+    sn: str,
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Close the breaker for a meter so it is polled again on the next cycle.
+
+    The leader owns the breakers, the reset is queued in the state row and
+    applied on its next heartbeat.
+    """
+    row = db.get(DataCollectionStateDB, STATE_ROW_ID, with_for_update=True)
+    meters = row.meter_health or [] if row else []
+    if not any(meter["sn"] == sn for meter in meters):
+        raise HTTPException(status_code=404, detail="No health record for this meter")
+    row.meter_health = [meter for meter in meters if meter["sn"] != sn]
+    row.health_resets = sorted({*(row.health_resets or []), sn})
+    db.commit()
+    return {"message": f"Breaker reset for {sn}"}
@@ -1,13 +1,21 @@
-from typing import List
+import csv
+import io
+import json
+from typing import Iterator, List, Literal
 from pydantic import BaseModel, Field
 from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy import desc
+from fastapi.responses import StreamingResponse
+from sqlalchemy import desc, select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from ..models import CurrentDB, EnergyDB, MeterDB, PowerDB, VoltageDB
-from ..database import get_db
+from ..models import READING_COLUMNS, MeterDB, ReadingDB
+from ..database import SessionLocal, get_db
 from ..api.iammeter import get_meter_id_by_name
-from datetime import datetime, date, time
+from ..api.hot_tier import hot_tier
+from ..api.snapshot import notify_meters_changed, snapshot
+from ..archive import hot_window_start, iter_archive, read_archive
+from datetime import datetime, date, time, timedelta
+from types import SimpleNamespace
 
 
 # Pydantic models for request validation
@@ -32,6 +40,16 @@ class BulkLocationUpdate(BaseModel):
 
 router = APIRouter(prefix="/meter", tags=["meter"])
 
+# Response field order within each phase, kept from the old four-table format
+PHASE_FIELDS = [
+    "current",
+    "voltage",
+    "active_power",
+    "power_factor",
+    "grid_consumption",
+    "exported_power",
+]
+
 
 @router.get("")
 def get_all_meters(db: Session = Depends(get_db)):
@@ -55,76 +73,37 @@ def get_all_meters(db: Session = Depends(get_db)):
 
 @router.get("/{meter_id}/latest")
 def get_latest_meter_data(meter_id: int, db: Session = Depends(get_db)):
-    row = (
-        db.query(CurrentDB, VoltageDB, PowerDB, EnergyDB)
-        .join(
-            VoltageDB,
-            (VoltageDB.meter_id == CurrentDB.meter_id)
-            & (VoltageDB.timestamp == CurrentDB.timestamp),
-        )
-        .join(
-            PowerDB,
-            (PowerDB.meter_id == CurrentDB.meter_id)
-            & (PowerDB.timestamp == CurrentDB.timestamp),
-        )
-        .join(
-            EnergyDB,
-            (EnergyDB.meter_id == CurrentDB.meter_id)
-            & (EnergyDB.timestamp == CurrentDB.timestamp),
-        )
-        .filter(CurrentDB.meter_id == meter_id)
-        .order_by(desc(CurrentDB.timestamp))
+    cached = snapshot.latest(meter_id)
+    if cached is not None:
+        if not cached:
+            raise HTTPException(status_code=404, detail="No data found for this meter")
+        return _convert_format(SimpleNamespace(**cached[0]))
+
+    reading = (
+        db.query(ReadingDB)
+        .filter(ReadingDB.meter_id == meter_id)
+        .order_by(desc(ReadingDB.timestamp))
         .first()
     )
 
-    if not row:
+    if not reading:
         raise HTTPException(status_code=404, detail="No data found for this meter")
 
-    c, v, p, e = row
-
-    return _convert_format(c, v, p, e)
+    return _convert_format(reading)
 
 
 @router.get("/todaysdata/{meter_name}")
 def get_todays_data(meter_name: str, db: Session = Depends(get_db)):
-    meter_id = get_meter_id_by_name(meter_name)
-    if not meter_id:
-        raise HTTPException(status_code=404, detail="Meter not found")
-
     today = date.today()
     start = datetime.combine(today, time.min)
     end = datetime.combine(today, time.max)
     try:
-        rows = (
-            db.query(CurrentDB, VoltageDB, PowerDB, EnergyDB)
-            .join(
-                VoltageDB,
-                (VoltageDB.meter_id == CurrentDB.meter_id)
-                & (VoltageDB.timestamp == CurrentDB.timestamp),
-            )
-            .join(
-                PowerDB,
-                (PowerDB.meter_id == CurrentDB.meter_id)
-                & (PowerDB.timestamp == CurrentDB.timestamp),
-            )
-            .join(
-                EnergyDB,
-                (EnergyDB.meter_id == CurrentDB.meter_id)
-                & (EnergyDB.timestamp == CurrentDB.timestamp),
-            )
-            .filter(
-                CurrentDB.meter_id == meter_id, CurrentDB.timestamp.between(start, end)
-            )
-            .order_by(CurrentDB.timestamp)
-            .all()
-        )
+        rows = _readings_between(db, meter_name, start, end)
 
         if not rows:
             raise HTTPException(status_code=404, detail="No Data for Today")
 
-        data = []
-        for c, v, p, e in rows:
-            data.append(_convert_format(c, v, p, e))
+        data = [_convert_format(r) for r in rows]
 
         return {
             "success": True,
@@ -137,6 +116,43 @@ def get_todays_data(meter_name: str, db: Session = Depends(get_db)):
         raise
 
 
+@router.get("/recent/{meter_name}")
+def get_recent_data(
+    meter_name: str,
+    hours: int = Query(1, ge=1, le=168),
+    db: Session = Depends(get_db),
+):
+    """Readings of the last hours, oldest first"""
+    end = datetime.now()
+    rows = _readings_between(db, meter_name, end - timedelta(hours=hours), end)
+    data = [_convert_format(r) for r in rows]
+    return {
+        "success": True,
+        "meter_name": meter_name,
+        "hours": hours,
+        "count": len(data),
+        "data": data,
+    }
+
+
+def _readings_between(db: Session, meter_name: str, start: datetime, end: datetime):
+    """Readings of a meter with start <= timestamp <= end, oldest first,
+    from the hot tier when it covers start"""
+    cached = hot_tier.readings(meter_name, start, end)
+    if cached is not None:
+        return [SimpleNamespace(**r) for r in cached]
+
+    meter_id = get_meter_id_by_name(db, meter_name)
+    if not meter_id:
+        raise HTTPException(status_code=404, detail="Meter not found")
+    return (
+        db.query(ReadingDB)
+        .filter(ReadingDB.meter_id == meter_id, ReadingDB.timestamp.between(start, end))
+        .order_by(ReadingDB.timestamp)
+        .all()
+    )
+
+
 @router.get("/databydate")
 def get_data_by_date_range(
     meter_name: str = Query(...),
@@ -156,40 +172,29 @@ def get_data_by_date_range(
     start = datetime.combine(from_date, time.min)
     end = datetime.combine(to_date, time.max)
     try:
+        # Months dropped from Postgres by retention are read from the archive
+        archived = []
+        archived_end = _archived_end(db, start, end)
+        if archived_end is not None:
+            archived = read_archive(meter_id, start, archived_end)
+
         rows = (
-            db.query(CurrentDB, VoltageDB, PowerDB, EnergyDB)
-            .join(
-                VoltageDB,
-                (VoltageDB.meter_id == CurrentDB.meter_id)
-                & (VoltageDB.timestamp == CurrentDB.timestamp),
-            )
-            .join(
-                PowerDB,
-                (PowerDB.meter_id == CurrentDB.meter_id)
-                & (PowerDB.timestamp == CurrentDB.timestamp),
-            )
-            .join(
-                EnergyDB,
-                (EnergyDB.meter_id == CurrentDB.meter_id)
-                & (EnergyDB.timestamp == CurrentDB.timestamp),
-            )
+            db.query(ReadingDB)
             .filter(
-                CurrentDB.meter_id == meter_id, CurrentDB.timestamp.between(start, end)
+                ReadingDB.meter_id == meter_id, ReadingDB.timestamp.between(start, end)
             )
-            .distinct(CurrentDB.timestamp)
-            .order_by(CurrentDB.timestamp)
+            .order_by(ReadingDB.timestamp)
             .all()
         )
 
-        if not rows:
+        if not rows and not archived:
             return {
                 "success": False,
                 "message": "No data found for the given date range",
             }
 
-        data = []
-        for c, v, p, e in rows:
-            data.append(_convert_format(c, v, p, e))
+        data = [_convert_format(SimpleNamespace(**r)) for r in archived]
+        data += [_convert_format(r) for r in rows]
 
         return {
             "success": True,
@@ -204,6 +209,109 @@ def get_data_by_date_range(
         raise
 
 
+# Readings fetched per round trip of the export's server-side cursor
+EXPORT_BATCH = 2000
+
+EXPORT_FIELDS = ["meter_id", "timestamp"] + [
+    f"phase_{phase}_{column}" for phase in "ABC" for column in PHASE_FIELDS
+]
+
+
+@router.get("/databydate/export")
+def export_data_by_date_range(
+    meter_name: str = Query(...),
+    from_date: date = Query(...),
+    to_date: date = Query(...),
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    db: Session = Depends(get_db),
+):
+    """databydate streamed as NDJSON or CSV, one reading per line.
+
+    Rows come from a server-side cursor a batch at a time, so memory use
+    does not grow with the range.
+    """
+    if from_date > to_date:
+        raise HTTPException(
+            status_code=400, detail="from_date cannot be later than to_date"
+        )
+
+    meter_id = get_meter_id_by_name(db, meter_name)
+    if not meter_id:
+        raise HTTPException(status_code=404, detail="Meter not found")
+
+    start = datetime.combine(from_date, time.min)
+    end = datetime.combine(to_date, time.max)
+    archived_end = _archived_end(db, start, end)
+
+    batches = _export_batches(meter_id, start, end, archived_end)
+    if format == "csv":
+        chunks, media_type = _csv_chunks(batches), "text/csv"
+    else:
+        chunks, media_type = _ndjson_chunks(batches), "application/x-ndjson"
+    filename = f"meter_{meter_id}_{from_date}_{to_date}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _archived_end(db: Session, start: datetime, end: datetime):
+    """Last moment of [start, end] only held by the archive, None if none is"""
+    hot_start = hot_window_start(db)
+    if hot_start is None or start >= hot_start:
+        return None
+    return min(end, hot_start - timedelta(microseconds=1))
+
+
+def _export_batches(meter_id: int, start: datetime, end: datetime, archived_end) -> Iterator[list[dict]]:
+    """Readings in _convert_format, archive first, a batch at a time"""
+    if archived_end is not None:
+        for rows in iter_archive(meter_id, start, archived_end):
+            yield [_convert_format(SimpleNamespace(**r)) for r in rows]
+
+    # The request's session is closed once the route returns, the stream
+    # outlives it
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            select(
+                ReadingDB.meter_id,
+                ReadingDB.timestamp,
+                *(getattr(ReadingDB, c) for c in READING_COLUMNS),
+            )
+            .where(ReadingDB.meter_id == meter_id, ReadingDB.timestamp.between(start, end))
+            .order_by(ReadingDB.timestamp)
+            .execution_options(yield_per=EXPORT_BATCH)
+        )
+        for rows in result.partitions():
+            yield [_convert_format(r) for r in rows]
+    finally:
+        db.close()
+
+
+def _ndjson_chunks(batches: Iterator[list[dict]]) -> Iterator[str]:
+    for batch in batches:
+        yield "".join(
+            json.dumps({**row, "timestamp": row["timestamp"].isoformat()}) + "\n"
+            for row in batch
+        )
+
+
+def _csv_chunks(batches: Iterator[list[dict]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows({**row, "timestamp": row["timestamp"].isoformat()} for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Just the header for an empty range
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
 @router.put("/{meter_id}/location")
 def update_meter_location(
     meter_id: int, location: MeterLocationUpdate, db: Session = Depends(get_db)
@@ -219,6 +327,7 @@ def update_meter_location(
     try:
         meter.x = location.x
         meter.y = location.y
+        notify_meters_changed(db)
         db.commit()
         db.refresh(meter)
 
@@ -239,26 +348,10 @@ def update_meter_location(
         )
 
 
-def _convert_format(current, voltage, power, energy):
-    return {
-        "meter_id": current.meter_id,
-        "timestamp": current.timestamp,
-        "phase_A_current": current.phase_A_current,
-        "phase_A_voltage": voltage.phase_A_voltage,
-        "phase_A_active_power": power.phase_A_active_power,
-        "phase_A_power_factor": power.phase_A_power_factor,
-        "phase_A_grid_consumption": energy.phase_A_grid_consumption,
-        "phase_A_exported_power": energy.phase_A_exported_power,
-        "phase_B_current": current.phase_B_current,
-        "phase_B_voltage": voltage.phase_B_voltage,
-        "phase_B_active_power": power.phase_B_active_power,
-        "phase_B_power_factor": power.phase_B_power_factor,
-        "phase_B_grid_consumption": energy.phase_B_grid_consumption,
-        "phase_B_exported_power": energy.phase_B_exported_power,
-        "phase_C_current": current.phase_C_current,
-        "phase_C_voltage": voltage.phase_C_voltage,
-        "phase_C_active_power": power.phase_C_active_power,
-        "phase_C_power_factor": power.phase_C_power_factor,
-        "phase_C_grid_consumption": energy.phase_C_grid_consumption,
-        "phase_C_exported_power": energy.phase_C_exported_power,
-    }
+def _convert_format(reading):
+    data = {"meter_id": reading.meter_id, "timestamp": reading.timestamp}
+    for phase in "ABC":
+        for column in PHASE_FIELDS:
+            key = f"phase_{phase}_{column}"
+            data[key] = getattr(reading, key)
+    return data
@@ -5,6 +5,12 @@ from sqlalchemy.orm import Session
 from .database import SessionLocal
 from .api.billing import calculate_bill
 from .utils.meter_status import update_flatline_status
+from .api.spool import spool
+from .partitions import maintain_partitions
+from .api.rollups import refresh_all_rollups
+from .archive import archive_closed_months
+from .retention import run_retention
+from .settings import settings
 
 def meter_status_job():
     db: Session = SessionLocal()
@@ -18,6 +24,50 @@ def meter_status_job():
 
 scheduler = BackgroundScheduler()
 
+def spool_drain_job():
+    # Replays readings spooled while the database was unreachable
+    written = spool.drain()
+    if written:
+        print(f"Spool drain wrote {written} readings at {datetime.utcnow()}")
+
+def rollup_job():
+    # Folds newly written readings into the hourly and daily rollups
+    try:
+        refreshed = refresh_all_rollups()
+        if refreshed:
+            print(f"Refreshed rollups of {refreshed} meter hours at {datetime.utcnow()}")
+    except Exception as e:
+        print(f"Error in rollup job: {e}")
+
+def retention_job():
+    if not settings.RETENTION_ENABLED:
+        return
+    try:
+        report = run_retention()
+        print(f"Retention job completed: {report.as_dict()}")
+    except Exception as e:
+        print(f"Error in retention job: {e}")
+
+def archive_job():
+    if not settings.ARCHIVE_ENABLED:
+        return
+    db: Session = SessionLocal()
+    try:
+        archived = archive_closed_months(db)
+        print(f"Archive job completed: {archived}")
+    except Exception as e:
+        print(f"Error in archive job: {e}")
+    finally:
+        db.close()
+
+def partition_maintenance_job():
+    try:
+        created = maintain_partitions()
+        if created:
+            print(f"Created partitions {', '.join(created)} at {datetime.utcnow()}")
+    except Exception as e:
+        print(f"Error in partition maintenance job: {e}")
+
 def daily_billing_job():
     db: Session = SessionLocal()
     try:
@@ -49,3 +99,44 @@ scheduler.add_job(
     id="meter_status_job",
     replace_existing=True
 )
+
+scheduler.add_job(
+    spool_drain_job,
+    trigger="interval",
+    seconds=30,
+    id="spool_drain_job",
+    replace_existing=True
+)
+
+scheduler.add_job(
+    partition_maintenance_job,
+    trigger="interval",
+    days=1,
+    next_run_time=datetime.now(),
+    id="partition_maintenance_job",
+    replace_existing=True
+)
+
+scheduler.add_job(
+    rollup_job,
+    trigger="interval",
+    seconds=60,
+    id="rollup_job",
+    replace_existing=True
+)
+
+scheduler.add_job(
+    archive_job,
+    trigger="cron",
+    hour=2,
+    id="archive_job",
+    replace_existing=True
+)
+
+scheduler.add_job(
+    retention_job,
+    trigger="cron",
+    hour=3,
+    id="retention_job",
+    replace_existing=True
+)
@@ -12,6 +12,96 @@ class Settings:
         self.IAMMETER_COOKIE = os.getenv("IAMMETER_COOKIE")
         self.ENV = os.getenv("ENV", "debug")
 
+        # "or" so an empty value copied from .env.example keeps the default
+        self.IAMMETER_BASE_URL = (
+            os.getenv("IAMMETER_BASE_URL") or "https://www.iammeter.com"
+        )
+        # "async" polls all meters concurrently, "sequential" is the old loop
+        self.POLL_MODE = os.getenv("POLL_MODE", "async")
+        self.POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY", "50"))
+        # Budget per meter and cycle, retries included
+        self.POLL_DEADLINE_SECONDS = float(os.getenv("POLL_DEADLINE_SECONDS", "10"))
+        self.FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "2"))
+        self.FETCH_BACKOFF_BASE_SECONDS = float(
+            os.getenv("FETCH_BACKOFF_BASE_SECONDS", "0.5")
+        )
+        self.FETCH_BACKOFF_MAX_SECONDS = float(
+            os.getenv("FETCH_BACKOFF_MAX_SECONDS", "5")
+        )
+        # Consecutive failures before a meter is skipped, and the first cooldown
+        self.BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+        self.BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "300"))
+        self.BREAKER_MAX_RESET_SECONDS = float(
+            os.getenv("BREAKER_MAX_RESET_SECONDS", "3600")
+        )
+        # Only the worker holding the advisory lock runs the scheduler and collector
+        self.LEADER_ELECTION_ENABLED = (
+            os.getenv("LEADER_ELECTION_ENABLED", "true").lower() == "true"
+        )
+        self.LEADER_HEARTBEAT_SECONDS = float(os.getenv("LEADER_HEARTBEAT_SECONDS", "10"))
+        # Readings are appended here before the database write, see api/spool.py
+        self.SPOOL_ENABLED = os.getenv("SPOOL_ENABLED", "true").lower() == "true"
+        self.SPOOL_DIR = os.getenv("SPOOL_DIR", "data/spool")
+        # Segments failing this many drains are moved to SPOOL_DIR/failed
+        self.SPOOL_MAX_ATTEMPTS = int(os.getenv("SPOOL_MAX_ATTEMPTS", "5"))
+        # "insert", "copy" or "auto" (COPY for large batches on psycopg2)
+        self.INGEST_WRITE_METHOD = os.getenv("INGEST_WRITE_METHOD", "auto")
+        # Monthly readings partitions are created this many months in advance
+        self.PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+        # Off by default since it deletes data. Raw readings older than
+        # RETENTION_RAW_DAYS are compacted to 15 minute rollups and dropped a
+        # whole month partition at a time; 0 days keeps a tier forever
+        self.RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+        self.RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "90"))
+        self.RETENTION_15MIN_DAYS = int(os.getenv("RETENTION_15MIN_DAYS", "730"))
+        self.RETENTION_HOURLY_DAYS = int(os.getenv("RETENTION_HOURLY_DAYS", "0"))
+        # Closed months are exported to Parquet here, one file per meter-month,
+        # and read back once retention has dropped them from Postgres
+        self.ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+        self.ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archive")
+        # Analysis routes answered by DuckDB over the archive, e.g.
+        # "avg_consumption_yearly,monthly_average"; needs the analytics extra.
+        # Empty by default: the daily rollup answered faster at every scale
+        # benchmarks/bench_analytics.py was run at, 210M rows included
+        self.DUCKDB_ROUTES = [
+            r.strip() for r in os.getenv("DUCKDB_ROUTES", "").split(",") if r.strip()
+        ]
+        self.DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "2"))
+        # Serve the latest-reading routes from memory, kept fresh via LISTEN/NOTIFY
+        self.SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "true").lower() == "true"
+        # Per-meter NumPy ring buffers of recent readings for the "today" and
+        # recent routes, follows the snapshot so needs SNAPSHOT_ENABLED too
+        self.HOT_TIER_ENABLED = os.getenv("HOT_TIER_ENABLED", "true").lower() == "true"
+        self.HOT_TIER_HOURS = int(os.getenv("HOT_TIER_HOURS", "48"))
+        # Refreshes re-read this much before the newest held reading, to catch
+        # rows that committed after rows with higher ids
+        self.HOT_TIER_REFRESH_OVERLAP_SECONDS = int(
+            os.getenv("HOT_TIER_REFRESH_OVERLAP_SECONDS", "300")
+        )
+        # GET responses of these route paths (fnmatch patterns) are cached
+        # until the TTL passes or the snapshot generation moves on.
+        # RESPONSE_CACHE_BACKEND is "memory" or a "module:factory" returning a
+        # backend shared between workers
+        self.RESPONSE_CACHE_ENABLED = (
+            os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+        )
+        self.RESPONSE_CACHE_ROUTES = [
+            r.strip()
+            for r in os.getenv(
+                "RESPONSE_CACHE_ROUTES", "/analysis/*,/billing/{year}/{month},/meter"
+            ).split(",")
+            if r.strip()
+        ]
+        self.RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+        self.RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+        self.RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+        # Concurrent identical analysis and billing requests share one
+        # computation per worker; this also serialises bill calculation of a
+        # month across workers with a PostgreSQL advisory lock
+        self.SINGLE_FLIGHT_ADVISORY_LOCKS = (
+            os.getenv("SINGLE_FLIGHT_ADVISORY_LOCKS", "true").lower() == "true"
+        )
+
         self.ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 1
 
         self.ALGORITHM: str = "HS256"
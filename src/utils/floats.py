@@ -0,0 +1,9 @@
+import numpy as np
+
+
+def float32_to_python(values: np.ndarray) -> list:
+    """Array values as the floats the database returned, NaN as None"""
+    if values.dtype == np.float32:
+        # Shortest float32 repr, so 0.93 reads back as 0.93 not 0.9300000071525574
+        values = values.astype(str).astype(np.float64)
+    return [None if v != v else v for v in values.tolist()]
@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 import os
 import asyncio
 
-from src.models import PowerDB, MeterDB, MeterStatusDB
+from src.models import MeterDB, MeterStatusDB, ReadingDB
 from src.utils.email_service import send_email
 
 WINDOW_MINUTES = 60
@@ -46,11 +46,11 @@ def update_flatline_status(db: Session):
     for meter_id, name, sn in meters:
         rows = (
             db.query(
-                PowerDB.phase_A_active_power,
-                PowerDB.phase_B_active_power,
-                PowerDB.phase_C_active_power,
+                ReadingDB.phase_A_active_power,
+                ReadingDB.phase_B_active_power,
+                ReadingDB.phase_C_active_power,
             )
-            .filter(PowerDB.meter_id == meter_id, PowerDB.timestamp >= start)
+            .filter(ReadingDB.meter_id == meter_id, ReadingDB.timestamp >= start)
             .all()
         )
 
@@ -0,0 +1,128 @@
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+NEPAL_TZ = ZoneInfo("Asia/Kathmandu")
+
+ALL_DAYS = frozenset(range(7))
+
+
+@dataclass(frozen=True)
+class Window:
+    """Daily collection window, end <= start wraps past midnight"""
+
+    start: time
+    end: time
+    interval_minutes: int
+    days: frozenset = field(default=ALL_DAYS)  # weekday() the window opens on
+
+
+@dataclass(frozen=True)
+class Segment:
+    start: datetime
+    end: datetime  # exclusive
+    interval: timedelta
+
+
+class CollectionTimeline:
+    """Collection ticks of one schedule, precomputed as non-overlapping segments.
+
+    Ticks are aligned to wall-clock multiples of the interval counted from
+    local midnight, so a 15 minute interval fires at :00, :15, :30 and :45
+    no matter when the schedule or the previous cycle started. Where windows
+    overlap, the one listed first wins; outside every window the base
+    interval applies, so segments cover the whole schedule.
+    """
+
+    def __init__(
+        self,
+        start: datetime,
+        end: datetime,
+        interval_minutes: int,
+        windows: Optional[list[Window]] = None,
+        tz: ZoneInfo = NEPAL_TZ,
+    ):
+        self.tz = tz
+        self.start = start.astimezone(tz)
+        self.end = end.astimezone(tz)
+        base = timedelta(minutes=interval_minutes)
+        if windows:
+            self.segments = self._build(windows, base)
+        else:
+            self.segments = [Segment(self.start, self.end, base)] if self.start < self.end else []
+        self._ends = [s.end for s in self.segments]
+
+    def _build(self, windows: list[Window], base: timedelta) -> list[Segment]:
+        if self.start >= self.end:
+            return []
+        # (start, end, priority, interval) of every window occurrence
+        spans = []
+        # Start a day early to pick up windows wrapping into the first day
+        day = self.start.date() - timedelta(days=1)
+        while day <= self.end.date():
+            for priority, w in enumerate(windows):
+                if day.weekday() not in w.days:
+                    continue
+                s = datetime.combine(day, w.start, tzinfo=self.tz)
+                end_day = day if w.end > w.start else day + timedelta(days=1)
+                e = datetime.combine(end_day, w.end, tzinfo=self.tz)
+                s, e = max(s, self.start), min(e, self.end)
+                if s < e:
+                    spans.append((s, e, priority, timedelta(minutes=w.interval_minutes)))
+            day += timedelta(days=1)
+
+        # Sweep the span boundaries, keeping the highest priority open span
+        opening, closing = {}, {}
+        for i, (s, e, _, _) in enumerate(spans):
+            opening.setdefault(s, []).append(i)
+            closing.setdefault(e, []).append(i)
+        # The schedule bounds too, so the gaps before, between and after
+        # the window spans get the base interval
+        points = sorted(set(opening) | set(closing) | {self.start, self.end})
+
+        segments: list[Segment] = []
+        open_spans: set[tuple[int, int]] = set()
+        for a, b in zip(points, points[1:]):
+            open_spans.difference_update((spans[i][2], i) for i in closing.get(a, []))
+            open_spans.update((spans[i][2], i) for i in opening.get(a, []))
+            interval = spans[min(open_spans)[1]][3] if open_spans else base
+            if segments and segments[-1].end == a and segments[-1].interval == interval:
+                segments[-1] = Segment(segments[-1].start, b, interval)
+            else:
+                segments.append(Segment(a, b, interval))
+        return segments
+
+    def _align(self, moment: datetime, interval: timedelta) -> datetime:
+        """First interval boundary at or after moment"""
+        midnight = datetime.combine(moment.date(), time(), tzinfo=self.tz)
+        steps = -(-(moment - midnight) // interval)
+        return midnight + steps * interval
+
+    def segment_at(self, moment: datetime) -> Optional[Segment]:
+        moment = moment.astimezone(self.tz)
+        i = bisect_right(self._ends, moment)
+        if i < len(self.segments) and self.segments[i].start <= moment:
+            return self.segments[i]
+        return None
+
+    def next_tick(self, after: datetime) -> Optional[datetime]:
+        """First tick strictly after the given moment, None once the schedule ends"""
+        after = after.astimezone(self.tz)
+        for seg in self.segments[bisect_right(self._ends, after) :]:
+            tick = self._align(max(after, seg.start), seg.interval)
+            if tick == after:
+                tick += seg.interval
+            if tick < seg.end:
+                return tick
+        return None
+
+    def count_ticks(self, after: datetime, until: datetime) -> int:
+        """Ticks in (after, until]"""
+        count = 0
+        tick = self.next_tick(after)
+        while tick is not None and tick <= until:
+            count += 1
+            tick = self.next_tick(tick)
+        return count
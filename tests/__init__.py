@@ -0,0 +1,7 @@
+import os
+
+# The modules under test read their settings and build the engine on
+# import, none of these tests connect to it
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/kusm_test")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("IAMMETER_TOKEN", "test")
@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime, timedelta
+
+from src.api.hot_tier import MeterRing
+from src.models import READING_COLUMNS
+
+START = datetime(2025, 2, 10, 12, 0)
+
+
+def minute(i: int) -> datetime:
+    return START + timedelta(minutes=i)
+
+
+def add(ring: MeterRing, i: int, cutoff: datetime):
+    ring.add(minute(i), {"phase_A_current": i + 0.93}, cutoff)
+
+
+class MeterRingTest(unittest.TestCase):
+    def test_wraps_around_once_full(self):
+        ring = MeterRing(START, capacity=4)
+        for i in range(4):
+            add(ring, i, START)
+        # Full, the two readings before the cutoff make room
+        add(ring, 4, minute(2))
+        add(ring, 5, minute(2))
+
+        self.assertEqual(ring.capacity, 4)
+        self.assertNotEqual(ring.start, 0)
+        self.assertEqual(ring.covered_from, minute(2))
+        rows = ring.slice(START, minute(10))
+        self.assertEqual([r["timestamp"] for r in rows], [minute(i) for i in range(2, 6)])
+        self.assertEqual([r["phase_A_current"] for r in rows], [2.93, 3.93, 4.93, 5.93])
+
+    def test_grows_when_nothing_can_be_evicted(self):
+        ring = MeterRing(START, capacity=4)
+        for i in range(6):
+            add(ring, i, START)
+
+        self.assertEqual(ring.capacity, 8)
+        self.assertEqual(len(ring.slice(START, minute(10))), 6)
+
+    def test_slice_is_inclusive_window(self):
+        ring = MeterRing(START, capacity=4)
+        for i in range(6):
+            add(ring, i, START)
+
+        rows = ring.slice(minute(1), minute(3))
+        self.assertEqual([r["timestamp"] for r in rows], [minute(1), minute(2), minute(3)])
+        self.assertEqual(rows[0]["phase_A_current"], 1.93)
+        self.assertEqual(set(rows[0]), {"timestamp", *READING_COLUMNS})
+        self.assertIsNone(rows[0]["phase_B_voltage"])
+        self.assertEqual(ring.slice(minute(7), minute(9)), [])
+
+    def test_late_reading_is_inserted_in_order(self):
+        ring = MeterRing(START, capacity=4)
+        for i in (0, 1, 3):
+            add(ring, i, START)
+        add(ring, 2, START)
+        add(ring, 2, START)
+
+        rows = ring.slice(START, minute(10))
+        self.assertEqual([r["timestamp"] for r in rows], [minute(i) for i in range(4)])
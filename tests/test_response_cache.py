@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch
+
+from src.api.response_cache import CachedResponse, MemoryBackend, ResponseCache
+from src.api.snapshot import snapshot
+
+
+def response(body: bytes) -> CachedResponse:
+    return CachedResponse(status_code=200, headers={}, body=body)
+
+
+class MemoryBackendTest(unittest.IsolatedAsyncioTestCase):
+    async def test_entries_expire_after_ttl(self):
+        backend = MemoryBackend(max_entries=8)
+        with patch("src.api.response_cache.time") as clock:
+            clock.monotonic.return_value = 100.0
+            await backend.set("/billing/2025/1?", response(b"bill"), ttl=60)
+
+            clock.monotonic.return_value = 159.9
+            self.assertEqual((await backend.get("/billing/2025/1?")).body, b"bill")
+
+            clock.monotonic.return_value = 160.0
+            self.assertIsNone(await backend.get("/billing/2025/1?"))
+        self.assertEqual(len(backend), 0)
+
+    async def test_least_recently_used_entry_is_evicted(self):
+        backend = MemoryBackend(max_entries=2)
+        await backend.set("a", response(b"a"), ttl=60)
+        await backend.set("b", response(b"b"), ttl=60)
+        await backend.get("a")
+        await backend.set("c", response(b"c"), ttl=60)
+
+        self.assertIsNone(await backend.get("b"))
+        self.assertIsNotNone(await backend.get("a"))
+        self.assertIsNotNone(await backend.get("c"))
+        self.assertEqual(backend.evictions, 1)
+
+
+class ResponseCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_cleared_when_generation_changes(self):
+        cache = ResponseCache()
+        await cache.backend.set("a", response(b"a"), ttl=60)
+
+        await cache.sync_generation()
+        self.assertIsNotNone(await cache.backend.get("a"))
+
+        snapshot.bump()
+        await cache.sync_generation()
+        self.assertIsNone(await cache.backend.get("a"))
+        self.assertEqual(cache.generation, snapshot.generation)
@@ -0,0 +1,75 @@
+import threading
+import time
+import unittest
+
+from src.api.single_flight import SingleFlight
+
+WAITERS = 3
+
+
+class SingleFlightTest(unittest.TestCase):
+    def run_concurrently(self, flights: SingleFlight, fn) -> list:
+        """Outcome of the owner and WAITERS callers of the same key, the
+        waiters all arrive while the owner's call is running"""
+        release = threading.Event()
+        outcomes = [None] * (WAITERS + 1)
+
+        def blocked():
+            release.wait()
+            return fn()
+
+        def call(i: int):
+            try:
+                outcomes[i] = flights.do("key", blocked)
+            except Exception as e:
+                outcomes[i] = e
+
+        threads = [threading.Thread(target=call, args=(0,))]
+        threads[0].start()
+        while flights.stats()["running"] == 0:
+            time.sleep(0.001)
+        for i in range(1, WAITERS + 1):
+            threads.append(threading.Thread(target=call, args=(i,)))
+            threads[-1].start()
+        while flights.shared < WAITERS:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_result(self):
+        flights = SingleFlight()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"total": 42}
+
+        outcomes = self.run_concurrently(flights, compute)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes[0], {"total": 42})
+        for outcome in outcomes[1:]:
+            self.assertIs(outcome, outcomes[0])
+        self.assertEqual(flights.stats(), {"calls": 1, "shared": WAITERS, "running": 0})
+
+    def test_concurrent_callers_share_one_exception(self):
+        flights = SingleFlight()
+
+        def fail():
+            raise ValueError("no readings")
+
+        outcomes = self.run_concurrently(flights, fail)
+
+        self.assertIsInstance(outcomes[0], ValueError)
+        for outcome in outcomes[1:]:
+            self.assertIs(outcome, outcomes[0])
+        self.assertEqual(flights.stats()["running"], 0)
+
+    def test_next_call_runs_again(self):
+        flights = SingleFlight()
+
+        self.assertEqual(flights.do("key", lambda: 1), 1)
+        self.assertEqual(flights.do("key", lambda: 2), 2)
+        self.assertEqual(flights.stats(), {"calls": 2, "shared": 0, "running": 0})
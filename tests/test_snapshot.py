@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import Mock
+
+from src.api.snapshot import BUMP_ONLY, PROCESS_TOKEN, LatestSnapshot
+
+
+class ListenerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.snapshot = LatestSnapshot()
+        self.snapshot.ready = True
+        self.snapshot._reload = Mock()
+
+    async def test_own_notification_is_ignored(self):
+        generation = self.snapshot.generation
+        await self.snapshot._handle({PROCESS_TOKEN})
+
+        self.snapshot._reload.assert_not_called()
+        self.assertEqual(self.snapshot.generation, generation)
+
+    async def test_other_writer_reloads(self):
+        await self.snapshot._handle({PROCESS_TOKEN, "0123456789abcdef"})
+        self.snapshot._reload.assert_called_once()
+
+    async def test_meter_change_reloads(self):
+        await self.snapshot._handle({"meters"})
+        self.snapshot._reload.assert_called_once()
+
+    async def test_rollups_and_bills_only_move_generation_on(self):
+        for payload in BUMP_ONLY:
+            with self.subTest(payload=payload):
+                generation = self.snapshot.generation
+                await self.snapshot._handle({PROCESS_TOKEN, payload})
+
+                self.snapshot._reload.assert_not_called()
+                self.assertEqual(self.snapshot.generation, generation + 1)
+
+    async def test_own_notification_reloads_until_ready(self):
+        self.snapshot.ready = False
+        await self.snapshot._handle({PROCESS_TOKEN})
+        self.snapshot._reload.assert_called_once()
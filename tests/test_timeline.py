@@ -0,0 +1,57 @@
+import unittest
+from datetime import datetime, time, timedelta
+
+from src.utils.timeline import NEPAL_TZ, CollectionTimeline, Window
+
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2025, 2, day, hour, minute, tzinfo=NEPAL_TZ)
+
+
+class CollectionTimelineTest(unittest.TestCase):
+    def test_base_interval_outside_windows(self):
+        window = Window(start=time(9), end=time(17), interval_minutes=1)
+        timeline = CollectionTimeline(at(10, 0), at(20, 0), 30, [window])
+
+        self.assertEqual(timeline.next_tick(at(10, 3)), at(10, 3, 30))
+        self.assertEqual(timeline.next_tick(at(10, 9)), at(10, 9, 1))
+        self.assertEqual(timeline.next_tick(at(10, 16, 59)), at(10, 17))
+        self.assertEqual(timeline.next_tick(at(10, 17)), at(10, 17, 30))
+        self.assertIsNotNone(timeline.segment_at(at(10, 3)))
+
+    def test_base_interval_around_window_wrapping_midnight(self):
+        window = Window(start=time(22), end=time(2), interval_minutes=5)
+        timeline = CollectionTimeline(at(10, 0), at(20, 0), 60, [window])
+
+        self.assertEqual(timeline.next_tick(at(10, 21, 30)), at(10, 22))
+        self.assertEqual(timeline.next_tick(at(10, 23, 58)), at(11, 0))
+        self.assertEqual(timeline.next_tick(at(11, 2)), at(11, 3))
+
+    def test_no_gap_until_schedule_end(self):
+        window = Window(start=time(9), end=time(17), interval_minutes=15, days=frozenset({0}))
+        start, end = at(10, 0), at(17, 0)
+        timeline = CollectionTimeline(start, end, 60, [window])
+
+        moment = start
+        while moment < end - timedelta(hours=1):
+            tick = timeline.next_tick(moment)
+            self.assertIsNotNone(tick, moment)
+            self.assertLessEqual(tick - moment, timedelta(hours=1))
+            moment += timedelta(minutes=7)
+        self.assertIsNone(timeline.next_tick(end))
+
+    def test_first_window_wins_on_overlap(self):
+        windows = [
+            Window(start=time(9), end=time(12), interval_minutes=10),
+            Window(start=time(8), end=time(17), interval_minutes=30),
+        ]
+        timeline = CollectionTimeline(at(10, 0), at(11, 0), 60, windows)
+
+        self.assertEqual(timeline.next_tick(at(10, 7)), at(10, 8))
+        self.assertEqual(timeline.next_tick(at(10, 9)), at(10, 9, 10))
+        self.assertEqual(timeline.next_tick(at(10, 12)), at(10, 12, 30))
+        self.assertEqual(timeline.count_ticks(at(10, 8), at(10, 9)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()